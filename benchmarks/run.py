@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+import numpy as np
+
+from benchmarks.synthetic import generate
+
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+
+def _parse_size(value: str) -> int:
+    return SIZES.get(value.lower()) or int(value)
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm", "r", encoding="utf-8") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    samples = np.asarray(samples_ms, dtype=float)
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) if len(samples) else (0.0, 0.0, 0.0)
+    return {"n": len(samples), "mean_ms": float(samples.mean()) if len(samples) else 0.0,
+            "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+
+def _workload(recommender, n_requests: int, seed: int) -> Dict[str, List[dict]]:
+    # Request payloads per filter selectivity, drawn from the catalog itself
+    rng = np.random.default_rng(seed)
+    catalog = recommender.catalog
+    books = recommender.books
+    top_genre = books["genres"].astype(str).str.split("|").explode().value_counts().index[0]
+    top_country = books["country"].astype(str).value_counts().index[0]
+
+    def liked() -> List[str]:
+        return [catalog.titles[int(p)] for p in rng.integers(0, catalog.size, size=rng.integers(0, 4))]
+
+    def pick(column: str) -> str:
+        return str(books[column].iloc[int(rng.integers(0, catalog.size))])
+
+    workloads = {
+        "unfiltered": lambda: {"liked_books": liked()},
+        "broad": lambda: {"genres": [top_genre], "liked_books": liked()},
+        "medium": lambda: {"countries": [top_country], "languages": [pick("language")], "min_year": 1980, "liked_books": liked()},
+        "narrow": lambda: {"authors": [pick("author")], "liked_books": liked()},
+    }
+    return {name: [make() for _ in range(n_requests)] for name, make in workloads.items()}
+
+
+def _bench_recommend(recommender, payloads: Dict[str, List[dict]]) -> Dict[str, Any]:
+    from data_pipeline.schemas import RecommendationRequest
+
+    results: Dict[str, Any] = {}
+    for name, items in payloads.items():
+        requests = [RecommendationRequest(**p) for p in items]
+        recommender.recommend(requests[0])  # warm-up
+        timings, candidates = [], []
+        for request in requests:
+            started = time.perf_counter()
+            recommender.recommend(request)
+            timings.append((time.perf_counter() - started) * 1000)
+            candidates.append(len(recommender._candidates(request)))
+        results[name] = {**_percentiles(timings), "mean_candidates": float(np.mean(candidates))}
+    return results
+
+
+def _bench_rerank(recommender, repeats: int = 20, limit: int = 10) -> Dict[str, float]:
+    # One re-ranked list over a full pool of random candidates (similarities + greedy selection)
+    rng = np.random.default_rng(0)
+    live = recommender.catalog.live
+    pool = min(len(live), recommender.reranker.pool_size)
+    timings = []
+    for _ in range(repeats):
+        positions = np.sort(rng.choice(live, size=pool, replace=False))
+        scores = rng.random(pool)
+        started = time.perf_counter()
+        recommender._rerank(positions, scores, limit)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {**_percentiles(timings), "pool": pool}
+
+
+async def _bench_api(recommender, payloads: List[dict], concurrency: int) -> Dict[str, Any]:
+    # End to end through the FastAPI app in-process (no sockets); the response cache is disabled
+    from httpx import ASGITransport, AsyncClient
+    from services.api import main
+    from storage.recommendation_cache import RecommendationCache
+
+    previous = main.RECOMMENDER, main.CACHE
+    main.RECOMMENDER = recommender
+    main.CACHE = RecommendationCache({"cache": {"local_max_entries": 0}})
+    main.EXECUTOR.start(recommender)
+    semaphore = asyncio.Semaphore(concurrency)
+    timings: List[float] = []
+    errors = 0
+
+    async with AsyncClient(transport=ASGITransport(app=main.app), base_url="http://bench") as client:
+        async def one(payload: dict) -> None:
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                resp = await client.post("/recommend", json=payload)
+                timings.append((time.perf_counter() - started) * 1000)
+                errors += resp.status_code != 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(p) for p in payloads))
+        elapsed = time.perf_counter() - started
+    main.EXECUTOR.shutdown()
+    main.RECOMMENDER, main.CACHE = previous
+    return {**_percentiles(timings), "concurrency": concurrency, "errors": errors,
+            "throughput_rps": len(payloads) / elapsed if elapsed else 0.0}
+
+
+def bench_size(n_books: int, data_dir: str, n_requests: int, concurrency: int, seed: int) -> Dict[str, Any]:
+    # Runs in its own process so peak RSS belongs to this catalog size only
+    from recommender.hybrid import HybridRecommender
+
+    out_dir = os.path.join(data_dir, f"{n_books}-{seed}")
+    started = time.perf_counter()
+    books_csv, interactions_csv = generate(n_books, out_dir, seed)
+    generate_s = time.perf_counter() - started
+
+    config = {"paths": {"books_csv": books_csv, "interactions_csv": interactions_csv}}
+    recommender = HybridRecommender(config)
+    started = time.perf_counter()
+    recommender.initialize()
+    initialize_s = time.perf_counter() - started
+    rss_after_init = _rss_mb()
+
+    payloads = _workload(recommender, n_requests, seed)
+    result = {
+        "books": n_books,
+        "generate_s": generate_s,
+        "initialize_s": initialize_s,
+        "rss_after_initialize_mb": rss_after_init,
+        "recommend": _bench_recommend(recommender, payloads),
+        "rerank": _bench_rerank(recommender),
+    }
+    api_payloads = [p for items in payloads.values() for p in items]
+    result["api"] = asyncio.run(_bench_api(recommender, api_payloads, concurrency))
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def _metadata(seed: int) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        commit = None
+    return {"commit": commit, "timestamp": time.time(), "python": platform.python_version(),
+            "numpy": np.__version__, "platform": platform.platform(), "cpu_count": os.cpu_count(), "seed": seed}
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    # Relative change of the headline numbers per size; positive = slower / bigger
+    lines = []
+    before = {r["books"]: r for r in baseline.get("results", [])}
+    for result in current.get("results", []):
+        old = before.get(result["books"])
+        if old is None:
+            continue
+        pairs = [("initialize_s", old["initialize_s"], result["initialize_s"]), ("peak_rss_mb", old["peak_rss_mb"], result["peak_rss_mb"])]
+        pairs += [(f"recommend.{k}.p95_ms", old["recommend"][k]["p95_ms"], v["p95_ms"]) for k, v in result["recommend"].items() if k in old["recommend"]]
+        pairs.append(("api.throughput_rps", old["api"]["throughput_rps"], result["api"]["throughput_rps"]))
+        for name, a, b in pairs:
+            change = (b - a) / a * 100 if a else 0.0
+            lines.append(f"{result['books']:>10} {name:<32} {a:12.2f} -> {b:12.2f} ({change:+.1f}%)")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Synthetic-catalog benchmarks for the hybrid recommender")
+    parser.add_argument("--sizes", nargs="+", default=["10k", "100k"], help="10k 100k 1m 10m or row counts")
+    parser.add_argument("--requests", type=int, default=200, help="requests per selectivity")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent API clients")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default="data/benchmarks")
+    parser.add_argument("--out", default="benchmark-results.json")
+    parser.add_argument("--compare", help="previous results JSON to diff against")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        n_books = _parse_size(size)
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result = pool.submit(bench_size, n_books, args.data_dir, args.requests, args.concurrency, args.seed).result()
+        results.append(result)
+        unfiltered = result["recommend"]["unfiltered"]
+        print(f"[ok] {n_books} books: init {result['initialize_s']:.1f}s, recommend p50/p99 "
+              f"{unfiltered['p50_ms']:.1f}/{unfiltered['p99_ms']:.1f} ms, api {result['api']['throughput_rps']:.0f} rps, "
+              f"peak rss {result['peak_rss_mb']:.0f} MB")
+    report = {"meta": _metadata(args.seed), "results": results}
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[ok] wrote {args.out}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print("\n".join(compare(json.load(f), report)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from typing import Tuple
+import os
+import numpy as np
+import pandas as pd
+
+
+GENRES = [
+    "Literary", "Fantasy", "Mystery", "Romance", "Science Fiction", "Historical", "Thriller", "YA",
+    "Horror", "Biography", "Poetry", "Magical Realism", "Dystopian", "Humor", "Travel", "Philosophy",
+]
+COUNTRIES = [
+    ("USA", "en"), ("United Kingdom", "en"), ("France", "fr"), ("Japan", "ja"), ("Germany", "de"),
+    ("India", "hi"), ("Spain", "es"), ("Brazil", "pt"), ("Nigeria", "en"), ("Russia", "ru"),
+    ("Italy", "it"), ("Mexico", "es"), ("China", "zh"), ("Argentina", "es"), ("South Korea", "ko"),
+    ("Kenya", "sw"), ("Egypt", "ar"), ("Sweden", "sv"), ("Poland", "pl"), ("Turkey", "tr"),
+]
+VOCABULARY = 5000
+CHUNK_ROWS = 500_000
+
+
+def _zipf_weights(n: int, exponent: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _words(rng: np.random.Generator, rows: int, per_row: int) -> list[str]:
+    # Zipf-distributed synthetic vocabulary, so TF-IDF sees realistic term frequencies
+    vocabulary = np.array([f"w{i}" for i in range(VOCABULARY)], dtype=object)
+    idx = rng.choice(VOCABULARY, size=(rows, per_row), p=_zipf_weights(VOCABULARY, 1.07))
+    return [" ".join(row) for row in vocabulary[idx]]
+
+
+def _multi(rng: np.random.Generator, values: list[str], rows: int, max_per_row: int, exponent: float) -> list[str]:
+    picks = rng.choice(len(values), size=(rows, max_per_row), p=_zipf_weights(len(values), exponent))
+    counts = rng.integers(1, max_per_row + 1, size=rows)
+    return ["|".join(dict.fromkeys(values[i] for i in row[:c])) for row, c in zip(picks, counts)]
+
+
+def books_chunk(rng: np.random.Generator, start: int, rows: int, n_books: int) -> pd.DataFrame:
+    # Skewed like real catalogs: a few genres/countries and prolific authors dominate
+    n_authors = max(1, n_books // 8)
+    country = rng.choice(len(COUNTRIES), size=rows, p=_zipf_weights(len(COUNTRIES), 1.2))
+    ids = np.arange(start, start + rows)
+    return pd.DataFrame(
+        {
+            "book_id": ids.astype(str),
+            "title": [f"Title {i} {w}" for i, w in zip(ids, _words(rng, rows, 2))],
+            "author": [f"Author {a}" for a in (n_authors * rng.random(rows) ** 2).astype(np.int64)],
+            "country": [COUNTRIES[c][0] for c in country],
+            "language": [COUNTRIES[c][1] for c in country],
+            "genres": _multi(rng, GENRES, rows, 3, 1.1),
+            "themes": _multi(rng, [f"theme{i}" for i in range(60)], rows, 3, 0.9),
+            "year": np.clip(rng.normal(1995, 22, rows), 1800, 2024).astype(int),
+            "avg_rating": np.round(np.clip(rng.normal(3.9, 0.35, rows), 1.0, 5.0), 2),
+            "rating_count": np.ceil(rng.lognormal(5.0, 2.0, rows)).astype(np.int64),
+            "description": _words(rng, rows, 15),
+        }
+    )
+
+
+def interactions_chunk(
+    rng: np.random.Generator, user_start: int, users: int, n_books: int, permutation: np.ndarray
+) -> pd.DataFrame:
+    # ~4 events per user; item popularity is a power law over a fixed random permutation of the books
+    per_user = rng.geometric(0.25, size=users)
+    user_ids = np.repeat(np.arange(user_start, user_start + users), per_user)
+    items = permutation[(n_books * rng.random(len(user_ids)) ** 3).astype(np.int64)]
+    return pd.DataFrame(
+        {
+            "user_id": np.char.add("u", user_ids.astype(str)),
+            "book_id": items.astype(str),
+            "event_strength": rng.integers(1, 6, size=len(user_ids)).astype(float),
+            "timestamp": np.sort(rng.integers(0, 10**9, size=len(user_ids))),
+        }
+    ).drop_duplicates(["user_id", "book_id"])
+
+
+def generate(n_books: int, out_dir: str, seed: int = 42) -> Tuple[str, str]:
+    # Writes books.csv / interactions.csv (n_books // 2 users) in chunks; reused when already present
+    books_csv = os.path.join(out_dir, "books.csv")
+    interactions_csv = os.path.join(out_dir, "interactions.csv")
+    if os.path.exists(books_csv) and os.path.exists(interactions_csv):
+        return books_csv, interactions_csv
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_books, CHUNK_ROWS):
+        chunk = books_chunk(rng, start, min(CHUNK_ROWS, n_books - start), n_books)
+        chunk.to_csv(books_csv + ".tmp", mode="a" if start else "w", header=not start, index=False)
+    permutation = rng.permutation(n_books)
+    n_users = max(1, n_books // 2)
+    for start in range(0, n_users, CHUNK_ROWS):
+        chunk = interactions_chunk(rng, start, min(CHUNK_ROWS, n_users - start), n_books, permutation)
+        chunk.to_csv(interactions_csv + ".tmp", mode="a" if start else "w", header=not start, index=False)
+    os.replace(books_csv + ".tmp", books_csv)
+    os.replace(interactions_csv + ".tmp", interactions_csv)
+    return books_csv, interactions_csv
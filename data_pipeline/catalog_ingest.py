@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from typing import Dict, Iterator, List, Optional
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except Exception:
+    pa = None
+    pq = None
+
+
+# Typed catalog schema; mirrors BookRecord. Categorical columns are dictionary-encoded in Parquet.
+TEXT_COLUMNS = ("book_id", "title", "description")
+CATEGORICAL_COLUMNS = ("author", "country", "language", "genres", "themes")
+LIST_COLUMNS = ("genres", "themes")
+CORPUS_FIELDS = ("title", "author", "genres", "themes", "description", "country", "language")
+# What the recommender reads back: the corpus column stands in for the raw description
+RECOMMENDER_COLUMNS = (
+    "book_id", "title", "author", "country", "language", "genres", "themes",
+    "year", "avg_rating", "rating_count", "corpus",
+)
+
+
+def build_corpus(df: pd.DataFrame) -> pd.Series:
+    # Text fed to TF-IDF; a precomputed `corpus` column is used as is, missing entries are rebuilt
+    if "corpus" in df.columns:
+        corpus = df["corpus"].astype(object)
+        missing = corpus.isna().to_numpy()
+        if not missing.any():
+            return corpus.astype(str)
+        corpus = corpus.copy()
+        corpus[missing] = build_corpus(df[missing].drop(columns="corpus"))
+        return corpus.astype(str)
+    # Column-wise string concatenation; empty fields only add whitespace, which tokenization ignores
+    corpus = pd.Series([""] * len(df), index=df.index, dtype=object)
+    for col in CORPUS_FIELDS:
+        if col not in df.columns:
+            continue
+        values = df[col].astype(object).fillna("").astype(str)
+        if col in LIST_COLUMNS:
+            values = values.str.replace("|", " ", regex=False)
+        corpus = corpus + " " + values
+    return corpus.str.strip()
+
+
+def _normalize_list(values: pd.Series) -> pd.Series:
+    # " Fantasy || YA " -> "Fantasy|YA"
+    parts = values.str.split("|")
+    return parts.map(lambda items: "|".join(t.strip() for t in items if t.strip()))
+
+
+def normalize_books(chunk: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+    # Coerce one chunk to the catalog schema; returns (valid rows, rejected row count).
+    # Rows without a book_id or title are rejected; unparsable numbers become missing / 0.
+    chunk = chunk.copy()
+    for col in TEXT_COLUMNS + CATEGORICAL_COLUMNS:
+        if col not in chunk.columns:
+            chunk[col] = ""
+        chunk[col] = chunk[col].astype(object).fillna("").astype(str).str.strip()
+    for col in LIST_COLUMNS:
+        chunk[col] = _normalize_list(chunk[col])
+    valid = (chunk["book_id"] != "") & (chunk["title"] != "")
+    rejected = int((~valid).sum())
+    chunk = chunk[valid]
+    year = pd.to_numeric(chunk["year"], errors="coerce") if "year" in chunk.columns else pd.Series(np.nan, index=chunk.index)
+    chunk["year"] = year.where((year >= -5000) & (year <= 3000)).round().astype("Int32")
+    for col, dtype in (("avg_rating", "float64"), ("rating_count", "int64")):
+        values = pd.to_numeric(chunk[col], errors="coerce") if col in chunk.columns else pd.Series(0, index=chunk.index)
+        chunk[col] = values.fillna(0).clip(lower=0).astype(dtype)
+    chunk["corpus"] = build_corpus(chunk)
+    return chunk.reset_index(drop=True), rejected
+
+
+def iter_book_chunks(csv_path: str, chunk_rows: int = 50000) -> Iterator[tuple[pd.DataFrame, int]]:
+    # Streams (normalized chunk, rejected rows); duplicate book ids keep their first occurrence
+    seen: set = set()
+    for raw in pd.read_csv(csv_path, chunksize=chunk_rows, dtype=str, keep_default_na=False, na_values=[""]):
+        chunk, rejected = normalize_books(raw)
+        duplicate = chunk["book_id"].duplicated() | chunk["book_id"].isin(seen)
+        seen.update(chunk["book_id"][~duplicate])
+        yield chunk[~duplicate].reset_index(drop=True), rejected + int(duplicate.sum())
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise RuntimeError("pyarrow is required for the Parquet catalog (pip install -r requirements-ml.txt)")
+
+
+def _arrow_schema() -> "pa.Schema":
+    fields = [pa.field(col, pa.string()) for col in TEXT_COLUMNS]
+    fields += [pa.field(col, pa.dictionary(pa.int32(), pa.string())) for col in CATEGORICAL_COLUMNS]
+    fields += [
+        pa.field("year", pa.int32()),
+        pa.field("avg_rating", pa.float64()),
+        pa.field("rating_count", pa.int64()),
+        pa.field("corpus", pa.string()),
+    ]
+    return pa.schema(fields)
+
+
+def ingest_books(csv_path: str, out_path: str, chunk_rows: int = 50000) -> Dict[str, int]:
+    # CSV -> Parquet, one row group per chunk, so memory stays bounded by `chunk_rows`
+    _require_pyarrow()
+    schema = _arrow_schema()
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    tmp_path = out_path + ".tmp"
+    stats = {"rows": 0, "rejected": 0, "chunks": 0}
+    with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+        for chunk, rejected in iter_book_chunks(csv_path, chunk_rows):
+            table = pa.Table.from_pandas(chunk[schema.names], schema=schema, preserve_index=False)
+            writer.write_table(table)
+            stats["rows"] += len(chunk)
+            stats["rejected"] += rejected
+            stats["chunks"] += 1
+    os.replace(tmp_path, out_path)
+    return stats
+
+
+def load_books(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    # Column-projected read; dictionary columns come back as pandas categoricals
+    _require_pyarrow()
+    available = set(pq.read_schema(path).names)
+    wanted = [c for c in (columns or RECOMMENDER_COLUMNS) if c in available]
+    books = pq.read_table(path, columns=wanted).to_pandas()
+    for col in books.columns:
+        if isinstance(books[col].dtype, pd.CategoricalDtype) and "" not in books[col].cat.categories:
+            # Downstream code fills missing text with ""
+            books[col] = books[col].cat.add_categories([""])
+    return books
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stream a books CSV export into the Parquet catalog")
+    parser.add_argument("--books-csv", default="sample_data/books_sample.csv")
+    parser.add_argument("--out", default="data/catalog/books.parquet")
+    parser.add_argument("--chunk-rows", type=int, default=50000)
+    args = parser.parse_args()
+    stats = ingest_books(args.books_csv, args.out, args.chunk_rows)
+    print(f"[ok] wrote {stats['rows']} books in {stats['chunks']} row groups to {args.out} ({stats['rejected']} rejected)")
+
+
+if __name__ == "__main__":
+    main()
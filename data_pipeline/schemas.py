@@ -1,5 +1,21 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, Dict, List, Optional
+
+
+class RecommendedBook(BaseModel):
+    book_id: str
+    title: str
+    author: str
+    country: Optional[str] = None
+    language: Optional[str] = None
+    genres: List[str] = Field(default_factory=list)
+    year: Optional[int] = None
+    score: float = 0.0
+    explanation: str = ""
+
+
+RESULT_FIELDS = tuple(RecommendedBook.model_fields)
+MAX_BATCH_REQUESTS = 100
 
 
 class RecommendationRequest(BaseModel):
@@ -11,20 +27,103 @@ class RecommendationRequest(BaseModel):
     min_year: Optional[int] = None
     max_year: Optional[int] = None
     liked_books: List[str] = Field(default_factory=list)
+    # A known user's interaction history is used through their matrix-factorization vector
+    user_id: Optional[str] = None
     limit: int = 10
+    # explain=false skips explanation strings; `fields` projects each result to a subset of
+    # RecommendedBook fields (all when omitted)
+    explain: bool = True
+    fields: Optional[List[str]] = None
+    # Latency budget for scoring in milliseconds (recommendation.latency_budget_ms when omitted, 0 =
+    # none); stages are shrunk or skipped to meet it and the response lists what was degraded
+    budget_ms: Optional[float] = Field(default=None, ge=0)
 
+    @field_validator("fields")
+    @classmethod
+    def _known_fields(cls, fields: Optional[List[str]]) -> Optional[List[str]]:
+        if fields is None:
+            return None
+        unknown = [f for f in fields if f not in RESULT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown result fields: {', '.join(unknown)}")
+        return list(dict.fromkeys(fields))
 
-class RecommendedBook(BaseModel):
+    def wants_explanation(self) -> bool:
+        return self.explain and (self.fields is None or "explanation" in self.fields)
+
+
+class RecommendationResponse(BaseModel):
+    recommendations: List[RecommendedBook] = Field(default_factory=list)
+    # Artifact/model version that produced (or cached) these results
+    model_version: Optional[str] = None
+    # Per-stage timings and candidate counts; only with /recommend?debug=true
+    debug: Optional[Dict[str, Any]] = None
+    # Work dropped to meet the latency budget, e.g. "candidates_shrunk", "rerank_skipped"
+    degraded: List[str] = Field(default_factory=list)
+
+
+class BatchRecommendationRequest(BaseModel):
+    # Bounded: one batch is one scoring-executor job, so its size is not covered by admission control
+    requests: List[RecommendationRequest] = Field(default_factory=list, max_length=MAX_BATCH_REQUESTS)
+
+
+class BatchRecommendationResponse(BaseModel):
+    results: List[RecommendationResponse] = Field(default_factory=list)
+
+
+class InteractionEvent(BaseModel):
+    user_id: str
+    book_id: str
+    event_strength: float = 1.0
+    timestamp: Optional[float] = None
+
+
+class InteractionBatch(BaseModel):
+    events: List[InteractionEvent] = Field(default_factory=list)
+
+
+class InteractionAck(BaseModel):
+    accepted: int = 0
+    applied: int = 0
+
+
+class BookRecord(BaseModel):
+    # One catalog row, same columns as the books CSV (genres/themes pipe-delimited)
     book_id: str
     title: str
-    author: str
-    country: Optional[str] = None
-    language: Optional[str] = None
-    genres: List[str] = Field(default_factory=list)
+    author: str = ""
+    country: str = ""
+    language: str = ""
+    genres: str = ""
+    themes: str = ""
     year: Optional[int] = None
+    avg_rating: float = 0.0
+    rating_count: int = 0
+    description: str = ""
+
+
+class CatalogUpdate(BaseModel):
+    upserts: List[BookRecord] = Field(default_factory=list)
+    deletes: List[str] = Field(default_factory=list)
+
+
+class Suggestion(BaseModel):
+    value: str
     score: float = 0.0
-    explanation: str = ""
+    # Titles: the book; authors, genres and themes: how many live books carry the value
+    book_id: Optional[str] = None
+    author: Optional[str] = None
+    books: Optional[int] = None
 
 
-class RecommendationResponse(BaseModel):
-    recommendations: List[RecommendedBook] = Field(default_factory=list)
\ No newline at end of file
+class SuggestResponse(BaseModel):
+    query: str
+    # Keyed by field ("title", "author", "genre", "theme"), most popular first
+    suggestions: Dict[str, List[Suggestion]] = Field(default_factory=dict)
+
+
+class CatalogUpdateAck(BaseModel):
+    added: int = 0
+    updated: int = 0
+    deleted: int = 0
+    catalog_size: int = 0
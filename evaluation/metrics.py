@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from math import log2
 from typing import List, Set
+import numpy as np
 
 
 def precision_at_k(recommended: List[str], relevant: Set[str], k: int) -> float:
@@ -30,4 +31,62 @@ def ndcg_at_k(recommended: List[str], relevant: Set[str], k: int) -> float:
     ideal_dcg = dcg(ideal)
     if ideal_dcg == 0:
         return 0.0
-    return dcg(gains) / ideal_dcg
\ No newline at end of file
+    return dcg(gains) / ideal_dcg
+
+
+# Vectorized counterparts over a hit matrix: hits[u, j] is True when user u's j-th
+# recommendation is relevant. Rows are users; same definitions as the functions above.
+
+def hit_matrix(recommended: np.ndarray, relevant_keys: np.ndarray, n_items: int) -> np.ndarray:
+    # `recommended`: (users x k) item ids, -1 padded; `relevant_keys`: sorted user * n_items + item
+    if len(relevant_keys) == 0:
+        return np.zeros(recommended.shape, dtype=bool)
+    keys = np.arange(recommended.shape[0], dtype=np.int64)[:, None] * n_items + recommended
+    loc = np.minimum(np.searchsorted(relevant_keys, keys), len(relevant_keys) - 1)
+    return (relevant_keys[loc] == keys) & (recommended >= 0)
+
+
+def precision_at_k_batch(hits: np.ndarray, k: int) -> np.ndarray:
+    if k <= 0:
+        return np.zeros(hits.shape[0])
+    return hits[:, :k].sum(axis=1) / k
+
+
+def recall_at_k_batch(hits: np.ndarray, n_relevant: np.ndarray, k: int) -> np.ndarray:
+    counts = hits[:, :k].sum(axis=1)
+    return np.divide(counts, n_relevant, out=np.zeros(len(counts)), where=n_relevant > 0)
+
+
+def ndcg_at_k_batch(hits: np.ndarray, k: int) -> np.ndarray:
+    hits = hits[:, :k]
+    discounts = 1.0 / np.log2(np.arange(hits.shape[1]) + 2)
+    dcg = hits @ discounts
+    # Ideal ordering of the same gains: all hits first
+    ideal = np.concatenate([[0.0], np.cumsum(discounts)])[hits.sum(axis=1)]
+    return np.divide(dcg, ideal, out=np.zeros(len(dcg)), where=ideal > 0)
+
+
+def catalog_coverage(recommended: np.ndarray, n_items: int) -> float:
+    # Fraction of the catalog that appears in at least one list
+    if n_items <= 0:
+        return 0.0
+    return len(np.unique(recommended[recommended >= 0])) / n_items
+
+
+def intra_list_diversity(codes: np.ndarray) -> np.ndarray:
+    # Per list: share of item pairs whose attribute codes (e.g. country) differ; -1 marks padding
+    valid = codes >= 0
+    same = (codes[:, :, None] == codes[:, None, :]) & valid[:, :, None] & valid[:, None, :]
+    n = valid.sum(axis=1)
+    pairs = n * (n - 1) / 2
+    same_pairs = (same.sum(axis=(1, 2)) - n) / 2
+    return np.divide(pairs - same_pairs, pairs, out=np.zeros(len(n)), where=pairs > 0)
+
+
+def novelty(recommended: np.ndarray, item_share: np.ndarray) -> np.ndarray:
+    # Mean self-information -log2(p) of the recommended items; p = share of users who interacted
+    valid = recommended >= 0
+    p = np.where(valid, item_share[np.where(valid, recommended, 0)], 1.0)
+    info = -np.log2(np.clip(p, 1e-12, 1.0))
+    n = valid.sum(axis=1)
+    return np.divide((info * valid).sum(axis=1), n, out=np.zeros(len(n)), where=n > 0)
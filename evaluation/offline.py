@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import yaml
+
+from data_pipeline.schemas import RecommendationRequest
+from evaluation import metrics
+from recommender.hybrid import HybridRecommender
+
+
+# Per-process recommender, loaded from the memory-mapped bundle the driver fitted on the train split
+_WORKER_RECOMMENDER: Optional[HybridRecommender] = None
+
+
+def _init_worker(config: dict) -> None:
+    global _WORKER_RECOMMENDER
+    _WORKER_RECOMMENDER = HybridRecommender(config)
+    _WORKER_RECOMMENDER.initialize()
+
+
+def _rank_batch(users: List[str], liked: List[List[str]], grid: List[Tuple[float, float]], k: int) -> np.ndarray:
+    # (grid points x users x k) catalog positions, -1 padded. Candidates are scored once per user
+    # and only the blend/diversity step is repeated per (hybrid_alpha, diversity_weight) point.
+    rec = _WORKER_RECOMMENDER
+    requests = [RecommendationRequest(user_id=user, liked_books=titles, limit=k) for user, titles in zip(users, liked)]
+    ranked = np.full((len(grid), len(requests), k), -1, dtype=np.int64)
+    original = rec.alpha, rec.diversity_weight
+    try:
+        for i, candidates, content_scores, collab_scores, graph_scores, mf_scores in rec.score_batch(requests):
+            for g, (alpha, diversity_weight) in enumerate(grid):
+                rec.alpha, rec.diversity_weight = alpha, diversity_weight
+                top = rec.rank_positions(requests[i], candidates, content_scores, collab_scores, graph_scores, mf_scores)
+                ranked[g, i, : len(top)] = top
+    finally:
+        rec.alpha, rec.diversity_weight = original
+    return ranked
+
+
+def time_holdout(interactions: pd.DataFrame, holdout_fraction: float = 0.2) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    # Global cutoff: the latest `holdout_fraction` of events (by timestamp, else file order) is held out
+    if "timestamp" in interactions.columns:
+        interactions = interactions.sort_values("timestamp", kind="stable")
+    cutoff = int(round(len(interactions) * (1.0 - holdout_fraction)))
+    return interactions.iloc[:cutoff], interactions.iloc[cutoff:]
+
+
+class OfflineEvaluator:
+    def __init__(self, config: dict | None = None) -> None:
+        self.config = config or {}
+        cfg = self.config.get("evaluation", {})
+        self.holdout_fraction = float(cfg.get("holdout_fraction", 0.2))
+        self.k = int(cfg.get("k", 10))
+        self.batch_size = int(cfg.get("batch_size", 1024))
+        self.workers = int(cfg.get("workers", os.cpu_count() or 1))
+        self.max_liked = int(cfg.get("max_liked", 20))
+        sweep = cfg.get("sweep", {})
+        recommendation = self.config.get("recommendation", {})
+        self.alphas = [float(a) for a in sweep.get("hybrid_alpha", [recommendation.get("hybrid_alpha", 0.6)])]
+        self.diversity_weights = [
+            float(d) for d in sweep.get("diversity_weight", [recommendation.get("diversity_weight", 0.15)])
+        ]
+
+    def run(self) -> List[Dict[str, float]]:
+        # One row of metrics per (hybrid_alpha, diversity_weight) point
+        paths = self.config.get("paths", {})
+        interactions = pd.read_csv(paths.get("interactions_csv", "sample_data/user_interactions_sample.csv"))
+        interactions["user_id"] = interactions["user_id"].astype(str)
+        interactions["book_id"] = interactions["book_id"].astype(str)
+        train, test = time_holdout(interactions, self.holdout_fraction)
+        with tempfile.TemporaryDirectory(prefix="offline-eval-") as tmp:
+            train_csv = os.path.join(tmp, "train.csv")
+            train.to_csv(train_csv, index=False)
+            # Fit once on the train split; workers memory-map the resulting bundle
+            fit_paths = {k: v for k, v in paths.items() if k != "artifacts_dir"}
+            recommender = HybridRecommender({**self.config, "paths": {**fit_paths, "interactions_csv": train_csv}})
+            recommender.initialize()
+            bundle_dir = os.path.join(tmp, "artifacts")
+            recommender.save_artifacts(bundle_dir)
+            worker_config = {**self.config, "paths": {**fit_paths, "artifacts_dir": bundle_dir}}
+            return self.evaluate(recommender, worker_config, train, test)
+
+    def evaluate(
+        self, recommender: HybridRecommender, worker_config: dict, train: pd.DataFrame, test: pd.DataFrame
+    ) -> List[Dict[str, float]]:
+        catalog = recommender.catalog
+        n_items = catalog.size
+        users, liked, relevant_keys, n_relevant = self._held_out(catalog, train, test)
+        grid = list(itertools.product(self.alphas, self.diversity_weights))
+        counts = np.bincount(catalog.lookup(train["book_id"].tolist()), minlength=n_items)
+        item_share = (counts + 1.0) / (train["user_id"].nunique() + 1.0)
+
+        sums = np.zeros((len(grid), 6))
+        seen = [np.zeros(n_items, dtype=bool) for _ in grid]
+        for start, ranked in self._ranked_batches(users, liked, grid, worker_config, recommender):
+            rows = np.arange(start, start + ranked.shape[1])
+            lo, hi = np.searchsorted(relevant_keys, [start * n_items, (start + len(rows)) * n_items])
+            keys = relevant_keys[lo:hi]
+            for g in range(len(grid)):
+                recommended = ranked[g]
+                hits = metrics.hit_matrix(recommended, keys - start * n_items, n_items)
+                padded = np.where(recommended >= 0, recommended, 0)
+                sums[g] += [
+                    metrics.precision_at_k_batch(hits, self.k).sum(),
+                    metrics.recall_at_k_batch(hits, n_relevant[rows], self.k).sum(),
+                    metrics.ndcg_at_k_batch(hits, self.k).sum(),
+                    metrics.intra_list_diversity(np.where(recommended >= 0, catalog.country_codes[padded], -1)).sum(),
+                    metrics.intra_list_diversity(np.where(recommended >= 0, catalog.language_codes[padded], -1)).sum(),
+                    metrics.novelty(recommended, item_share).sum(),
+                ]
+                seen[g][recommended[recommended >= 0]] = True
+
+        n_users = max(len(users), 1)
+        report = []
+        for g, (alpha, diversity_weight) in enumerate(grid):
+            precision, recall, ndcg, country_ild, language_ild, novelty = sums[g] / n_users
+            report.append(
+                {
+                    "hybrid_alpha": alpha,
+                    "diversity_weight": diversity_weight,
+                    "users": len(users),
+                    f"precision@{self.k}": precision,
+                    f"recall@{self.k}": recall,
+                    f"ndcg@{self.k}": ndcg,
+                    "coverage": float(seen[g].sum()) / max(n_items, 1),
+                    "diversity_country": country_ild,
+                    "diversity_language": language_ild,
+                    "novelty": novelty,
+                }
+            )
+        return report
+
+    def _held_out(
+        self, catalog, train: pd.DataFrame, test: pd.DataFrame
+    ) -> Tuple[List[str], List[List[str]], np.ndarray, np.ndarray]:
+        # Held-out users, their train titles (strongest first) as liked_books, and the relevance set:
+        # test items they had not seen in train, encoded as sorted user_row * n_items + position
+        n_items = catalog.size
+        users = pd.unique(test["user_id"]).tolist()
+        user_row = {u: i for i, u in enumerate(users)}
+        train = train[train["user_id"].isin(user_row)]
+        train = train.assign(position=catalog.lookup_or_missing(train["book_id"].tolist()))
+        train = train[train["position"] >= 0]
+        strongest = train.sort_values(["user_id", "event_strength"], ascending=[True, False], kind="stable")
+        titles = np.asarray(catalog.titles, dtype=object)
+        liked: List[List[str]] = [[] for _ in users]
+        for user, positions in strongest.groupby("user_id", sort=False)["position"]:
+            liked[user_row[user]] = titles[positions.to_numpy()[: self.max_liked]].tolist()
+
+        test = test.assign(position=catalog.lookup_or_missing(test["book_id"].tolist()))
+        test = test[test["position"] >= 0]
+        test_keys = test["user_id"].map(user_row).to_numpy(dtype=np.int64) * n_items + test["position"].to_numpy()
+        train_keys = train["user_id"].map(user_row).to_numpy(dtype=np.int64) * n_items + train["position"].to_numpy()
+        relevant_keys = np.setdiff1d(test_keys, train_keys)
+        n_relevant = np.bincount(relevant_keys // max(n_items, 1), minlength=len(users))
+        return users, liked, relevant_keys, n_relevant
+
+    def _ranked_batches(
+        self,
+        users: List[str],
+        liked: List[List[str]],
+        grid: List[Tuple[float, float]],
+        worker_config: dict,
+        recommender: HybridRecommender,
+    ) -> Iterator[Tuple[int, np.ndarray]]:
+        starts = range(0, len(liked), self.batch_size)
+        user_batches = [users[s:s + self.batch_size] for s in starts]
+        batches = [liked[s:s + self.batch_size] for s in starts]
+        if self.workers <= 1:
+            global _WORKER_RECOMMENDER
+            _WORKER_RECOMMENDER = recommender
+            for start, user_batch, batch in zip(starts, user_batches, batches):
+                yield start, _rank_batch(user_batch, batch, grid, self.k)
+            return
+        with ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker, initargs=(worker_config,)
+        ) as pool:
+            ranked_batches = pool.map(_rank_batch, user_batches, batches, itertools.repeat(grid), itertools.repeat(self.k))
+            for start, ranked in zip(starts, ranked_batches):
+                yield start, ranked
+
+
+def load_config(path: str = "config/config.yaml") -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline evaluation with a time-based holdout")
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--alpha", type=float, nargs="*", help="hybrid_alpha sweep")
+    parser.add_argument("--diversity", type=float, nargs="*", help="diversity_weight sweep")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--out", help="write the report as JSON")
+    args = parser.parse_args()
+    config = load_config(args.config)
+    evaluation = dict(config.get("evaluation", {}))
+    sweep = dict(evaluation.get("sweep", {}))
+    if args.alpha:
+        sweep["hybrid_alpha"] = args.alpha
+    if args.diversity:
+        sweep["diversity_weight"] = args.diversity
+    if args.workers is not None:
+        evaluation["workers"] = args.workers
+    config = {**config, "evaluation": {**evaluation, "sweep": sweep}}
+    started = time.perf_counter()
+    report = OfflineEvaluator(config).run()
+    print(pd.DataFrame(report).to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    print(f"[ok] evaluated {len(report)} configurations in {time.perf_counter() - started:.1f}s")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
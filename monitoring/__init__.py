@@ -0,0 +1 @@
+# package
\ No newline at end of file
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+from typing import Callable, Dict, List, Sequence, Tuple
+import bisect
+import threading
+
+from monitoring.trace import Trace
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (10, 100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> per-bucket counts (last slot is +Inf), then the sum
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[slot] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for labelvalues, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                labels = _labels(self.labelnames, labelvalues, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labelvalues)} {cumulative}")
+        return lines
+
+
+class Callback:
+    # Counter/gauge read at scrape time from existing stats (cache, executor); returns {label values: value}
+    def __init__(self, name: str, help: str, kind: str, labelnames: Sequence[str], read: Callable[[], Dict[Tuple[str, ...], float]]) -> None:
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.read = read
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labelvalues, value in sorted(self.read().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {float(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, object] = {}
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, help, labelnames, buckets))  # type: ignore[return-value]
+
+    def callback(self, name: str, help: str, kind: str, labelnames: Sequence[str], read: Callable[[], Dict[Tuple[str, ...], float]]) -> Callback:
+        # Re-registering replaces the reader (e.g. after the API swaps its cache)
+        self.metrics[name] = Callback(name, help, kind, labelnames, read)
+        return self.metrics[name]  # type: ignore[return-value]
+
+    def render(self) -> str:
+        # Prometheus text exposition format 0.0.4
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())  # type: ignore[attr-defined]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram(
+    "recommender_stage_duration_seconds", "Time spent per HybridRecommender.recommend stage", ("stage",)
+)
+CANDIDATES = REGISTRY.histogram(
+    "recommender_candidates", "Candidates and scored rows per request", ("kind",), COUNT_BUCKETS
+)
+INITIALIZE_SECONDS = REGISTRY.histogram(
+    "recommender_initialize_duration_seconds", "Time spent per HybridRecommender.initialize stage", ("stage",),
+    LATENCY_BUCKETS + (30.0, 60.0, 300.0),
+)
+
+
+DEGRADATIONS: Dict[Tuple[str, ...], float] = {}
+_DEGRADATIONS_LOCK = threading.Lock()
+REGISTRY.callback(
+    "recommender_degradations_total", "Requests that dropped work to meet their latency budget", "counter", ("kind",),
+    lambda: dict(DEGRADATIONS),
+)
+
+
+def observe_trace(trace: Trace, initialize: bool = False) -> None:
+    histogram = INITIALIZE_SECONDS if initialize else STAGE_SECONDS
+    for stage, seconds in trace.stages.items():
+        histogram.observe(seconds, stage)
+    for kind, value in trace.counts.items():
+        CANDIDATES.observe(value, kind)
+    if trace.degraded:
+        with _DEGRADATIONS_LOCK:
+            for kind in trace.degraded:
+                DEGRADATIONS[(kind,)] = DEGRADATIONS.get((kind,), 0) + 1
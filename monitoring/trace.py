@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List
+import time
+
+
+class _Stage:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace: "Trace", name: str) -> None:
+        self.trace = trace
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        elapsed = time.perf_counter() - self.started
+        self.trace.stages[self.name] = self.trace.stages.get(self.name, 0.0) + elapsed
+
+
+class Trace:
+    # Per-request stage timings (seconds) and counters; plain data so it crosses process pools
+    def __init__(self) -> None:
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        # Work dropped to meet the request's latency budget, in order
+        self.degraded: List[str] = []
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self, name)
+
+    def count(self, name: str, value: int) -> None:
+        self.counts[name] = int(value)
+
+    def degrade(self, kind: str) -> None:
+        self.degraded.append(kind)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            "counts": dict(self.counts),
+            "degraded": list(self.degraded),
+        }
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+
+class NullTrace(Trace):
+    # Used when nobody asked for timings: no clock reads, nothing recorded
+    _STAGE = _NullStage()
+
+    def stage(self, name: str) -> _NullStage:  # type: ignore[override]
+        return self._STAGE
+
+    def count(self, name: str, value: int) -> None:
+        return None
+
+    def degrade(self, kind: str) -> None:
+        return None
+
+
+NULL_TRACE = NullTrace()
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from typing import Callable, Dict
+import math
+import threading
+import time
+
+
+class LatencyBudget:
+    # Deadline of one recommend call, started when scoring starts (executor queueing is not counted);
+    # unlimited when seconds is None or 0
+    def __init__(self, seconds: float | None) -> None:
+        self.limited = bool(seconds and seconds > 0)
+        self.deadline = time.perf_counter() + seconds if self.limited else math.inf
+
+    def remaining(self) -> float:
+        return self.deadline - time.perf_counter() if self.limited else math.inf
+
+    def exceeded(self) -> bool:
+        return self.limited and time.perf_counter() >= self.deadline
+
+
+class StageCosts:
+    # Running (exponentially weighted) estimates of what the budget-controlled stages cost, learned
+    # from served requests: seconds per scored candidate across content..mf, kept per pool-size bucket
+    # (bit length of the pool size), and seconds per re-rank. Whole-catalog passes do not shrink with
+    # the pool, so small filtered pools cost more per candidate; separate buckets keep them from
+    # pricing large unfiltered pools out of scoring.
+    def __init__(self, config: dict | None = None) -> None:
+        cfg = (config or {}).get("recommendation", {})
+        self.smoothing = float(cfg.get("budget_smoothing", 0.1))
+        self.per_candidate = float(cfg.get("budget_seconds_per_candidate", 1e-6))  # until measured
+        self.probe_decay = float(cfg.get("budget_probe_decay", 0.9))
+        # Written from concurrent scoring threads: writers copy and republish `rates` under the lock,
+        # readers use whichever dict is current
+        self.rates: Dict[int, float] = {}
+        self.rerank = 0.0
+        self._lock = threading.Lock()
+
+    def _mix(self, current: float, observed: float) -> float:
+        return (1.0 - self.smoothing) * current + self.smoothing * observed
+
+    @staticmethod
+    def bucket(candidates: int) -> int:
+        return int(candidates).bit_length()
+
+    def rate(self, bucket: int) -> float:
+        rates = self.rates
+        if bucket in rates:
+            return rates[bucket]
+        # Unmeasured: the per-candidate cost falls as pools grow, so a larger measured pool's rate is
+        # the optimistic guess and gets the bucket measured
+        larger = [rate for b, rate in rates.items() if b > bucket]
+        return min(larger) if larger else self.per_candidate
+
+    def _set_rate(self, bucket: int, update: Callable[[float | None], float]) -> None:
+        with self._lock:
+            self.rates = {**self.rates, bucket: update(self.rates.get(bucket))}
+
+    def observe_scoring(self, candidates: int, seconds: float) -> None:
+        if candidates > 0:
+            bucket = self.bucket(candidates)
+            observed = seconds / candidates
+            self._set_rate(bucket, lambda current: observed if current is None else self._mix(current, observed))
+
+    def observe_rerank(self, seconds: float) -> None:
+        self.rerank = self._mix(self.rerank, seconds) if self.rerank else seconds
+
+    def decay(self, candidates: int) -> None:
+        # A pool the estimate degraded is never scored, so nothing would correct a stale estimate:
+        # it shrinks on every such request until one is scored in full and measured again
+        bucket = self.bucket(candidates)
+        self._set_rate(bucket, lambda current: self.rate(bucket) * self.probe_decay)
+
+    def affordable_candidates(self, seconds: float, candidates: int) -> int:
+        # Largest pool size up to `candidates` whose estimated scoring cost fits in `seconds`
+        for bucket in range(self.bucket(candidates), 0, -1):
+            n = min(candidates, (1 << bucket) - 1, int(max(seconds, 0.0) / max(self.rate(bucket), 1e-12)))
+            if n >= 1 << (bucket - 1):
+                return n
+        return 0
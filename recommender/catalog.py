@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Tuple
+import re
+import numpy as np
+import pandas as pd
+
+from recommender.title_index import TitleIndex
+
+
+def _text_column(books: pd.DataFrame, col: str) -> pd.Series:
+    if col not in books.columns:
+        return pd.Series([""] * len(books), dtype=object)
+    return books[col].fillna("").astype(str).reset_index(drop=True)
+
+
+def _numeric_column(books: pd.DataFrame, col: str) -> np.ndarray:
+    if col not in books.columns:
+        return np.zeros(len(books), dtype=float)
+    return pd.to_numeric(books[col], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+
+
+def positive_max(scores: np.ndarray) -> float:
+    # Largest positive score, the divisor bringing a row into [0, 1]; 0 when nothing is positive
+    return float(np.nanmax(np.where(scores > 0, scores, np.nan), initial=0.0))
+
+
+class CodeSets:
+    # Per-row sets of lowercased value codes (CSR: row i owns codes[indptr[i]:indptr[i + 1]]), so
+    # membership tests run vectorised over many rows instead of string checks per row
+    def __init__(self, multi: bool = True) -> None:
+        self.multi = multi
+        self.values: List[str] = []
+        # First-seen spelling of each value, for display
+        self.display: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.codes = np.zeros(0, dtype=np.int32)
+
+    def append(self, column: pd.Series) -> None:
+        raw = column.str.split("|").tolist() if self.multi else [[v] for v in column.tolist()]
+        rows = [list(dict.fromkeys(v.strip().lower() for v in row if v.strip())) for row in raw]
+        flat = [v for row in rows for v in row]
+        if any(v not in self.index for v in flat):
+            for spelling in (v.strip() for row in raw for v in row):
+                value = spelling.lower()
+                if value and value not in self.index:
+                    self.index[value] = len(self.values)
+                    self.values.append(value)
+                    self.display.append(spelling)
+        codes = np.array([self.index[v] for v in flat], dtype=np.int32)
+        lengths = np.array([len(row) for row in rows], dtype=np.int64)
+        # Codes first, offsets last: a concurrent reader's indptr never points past its codes
+        self.codes = np.concatenate([self.codes, codes])
+        self.indptr = np.concatenate([self.indptr, self.indptr[-1] + np.cumsum(lengths)])
+
+    def lookup(self, values: List[str]) -> np.ndarray:
+        # Codes of the known values among `values` (case-insensitive, exact)
+        return np.array([self.index[k] for k in {v.strip().lower() for v in values} if k in self.index], dtype=np.int32)
+
+    def matching(self, terms: List[str]) -> np.ndarray:
+        # Codes of values containing any of `terms` as a whole word (FilterIndex.match_genres semantics)
+        pattern = re.compile("|".join(rf"(?<!\w){re.escape(t.strip().lower())}(?!\w)" for t in terms if t.strip()))
+        if not pattern.pattern:
+            return np.zeros(0, dtype=np.int32)
+        return np.array([i for i, v in enumerate(self.values) if pattern.search(v)], dtype=np.int32)
+
+    def any_of(self, positions: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # Per position: does its set intersect `codes`
+        positions = np.asarray(positions, dtype=np.int64)
+        found = np.zeros(len(positions), dtype=bool)
+        if not len(codes) or not len(positions):
+            return found
+        starts = self.indptr[positions]
+        lengths = self.indptr[positions + 1] - starts
+        owner = np.repeat(np.arange(len(positions)), lengths)
+        offsets = np.arange(len(owner)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        hits = np.isin(self.codes[np.repeat(starts, lengths) + offsets], codes)
+        found[owner[hits]] = True
+        return found
+
+
+class Catalog:
+    def __init__(self, config: dict | None = None) -> None:
+        self.config = config or {}
+        self.size = 0
+        self.book_ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.titles: List[str] = []
+        self.authors: List[str] = []
+        self.countries: List[Optional[str]] = []
+        self.languages: List[Optional[str]] = []
+        self.genres: List[List[str]] = []
+        self.years: List[Optional[int]] = []
+        self.popularity: np.ndarray = np.zeros(0, dtype=float)
+        # Lowercased fields used for diversity; code sets for explanations
+        self.author_lower: List[str] = []
+        self.genre_sets = CodeSets()
+        self.theme_sets = CodeSets()
+        self.author_sets = CodeSets(multi=False)
+        self.country_codes: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.country_values: List[str] = []
+        self.language_codes: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.language_values: List[str] = []
+        # Tombstones: replaced or deleted rows stay in place (positions never shift) but are skipped
+        self.alive: np.ndarray = np.zeros(0, dtype=bool)
+        self.live: np.ndarray = np.zeros(0, dtype=np.int64)
+        # Normalized title keys and trigrams for liked_books resolution over the whole catalog
+        threshold = float(self.config.get("catalog", {}).get("title_match_threshold", 0.7))
+        self.title_index = TitleIndex(threshold)
+        # All rows by descending popularity; recomputed on first use after an append
+        self._popularity_order = np.zeros(0, dtype=np.int64)
+
+    def build(self, books: pd.DataFrame) -> None:
+        self.size = len(books)
+        self.book_ids = books["book_id"].astype(str).tolist()
+        self.positions = {bid: pos for pos, bid in enumerate(self.book_ids)}
+        titles = _text_column(books, "title")
+        authors = _text_column(books, "author")
+        countries = _text_column(books, "country")
+        languages = _text_column(books, "language")
+        genres = _text_column(books, "genres")
+        self.titles = titles.tolist()
+        self.authors = authors.tolist()
+        self.countries = [c or None for c in countries.tolist()]
+        self.languages = [l or None for l in languages.tolist()]
+        self.genres = [[g.strip() for g in value.split("|") if g.strip()] for value in genres.tolist()]
+        years = pd.to_numeric(books["year"], errors="coerce") if "year" in books.columns else pd.Series([np.nan] * self.size)
+        self.years = [None if pd.isna(y) else int(y) for y in years.tolist()]
+        self.popularity = _numeric_column(books, "rating_count") * _numeric_column(books, "avg_rating")
+
+        self.author_lower = authors.str.lower().tolist()
+        self.genre_sets, self.theme_sets, self.author_sets = CodeSets(), CodeSets(), CodeSets(multi=False)
+        self.genre_sets.append(genres)
+        self.theme_sets.append(_text_column(books, "themes"))
+        self.author_sets.append(authors)
+        codes, uniques = pd.factorize(countries.str.lower())
+        self.country_codes, self.country_values = codes.astype(np.int32), [str(u) for u in uniques]
+        codes, uniques = pd.factorize(languages.str.lower())
+        self.language_codes, self.language_values = codes.astype(np.int32), [str(u) for u in uniques]
+        self.alive = np.ones(self.size, dtype=bool)
+        self.live = np.arange(self.size, dtype=np.int64)
+        self.title_index = TitleIndex(self.title_index.threshold)
+        self.title_index.build(self.titles)
+        self._popularity_order = np.argsort(-self.popularity, kind="stable")
+
+    def append(self, books: pd.DataFrame) -> np.ndarray:
+        # Add rows after the current ones and return their positions. Arrays are swapped in whole and
+        # `size` is published last, so concurrent readers only ever see fully populated rows.
+        delta = Catalog()
+        delta.build(books)
+        offset = self.size
+        new_positions = np.arange(offset, offset + delta.size, dtype=np.int64)
+        self.book_ids.extend(delta.book_ids)
+        self.titles.extend(delta.titles)
+        self.authors.extend(delta.authors)
+        self.countries.extend(delta.countries)
+        self.languages.extend(delta.languages)
+        self.genres.extend(delta.genres)
+        self.years.extend(delta.years)
+        self.author_lower.extend(delta.author_lower)
+        self.genre_sets.append(_text_column(books, "genres"))
+        self.theme_sets.append(_text_column(books, "themes"))
+        self.author_sets.append(_text_column(books, "author"))
+        self.popularity = np.concatenate([self.popularity, delta.popularity])
+        self.country_codes = np.concatenate(
+            [self.country_codes, self._merge_codes(self.country_values, delta.country_codes, delta.country_values)]
+        )
+        self.language_codes = np.concatenate(
+            [self.language_codes, self._merge_codes(self.language_values, delta.language_codes, delta.language_values)]
+        )
+        self.alive = np.concatenate([self.alive, np.ones(delta.size, dtype=bool)])
+        self.live = np.concatenate([self.live, new_positions])
+        for bid, pos in zip(delta.book_ids, new_positions.tolist()):
+            self.positions[bid] = pos
+        self.title_index.add(delta.titles, offset)
+        self.size = offset + delta.size
+        return new_positions
+
+    def title_positions(self, titles: List[str]) -> np.ndarray:
+        # Live positions matching any of `titles` (normalized exact key, else the closest trigram
+        # match above catalog.title_match_threshold), ascending; independent of request filters
+        if not titles:
+            return np.zeros(0, dtype=np.int64)
+        return self.title_index.resolve(titles, self.alive)
+
+    def title_matches(self, titles: List[str]) -> Dict[str, Tuple[float, List[int]]]:
+        # title_positions per normalized title, with each match's quality (see TitleIndex.matches)
+        return self.title_index.matches(titles, self.alive) if titles else {}
+
+    def popularity_order(self) -> np.ndarray:
+        # Tombstoned rows included; callers mask them
+        order = self._popularity_order
+        if len(order) != self.size:
+            order = np.argsort(-self.popularity[: self.size], kind="stable")
+            self._popularity_order = order
+        return order
+
+    def retire(self, positions: np.ndarray) -> None:
+        # Tombstone rows; a book id keeps pointing at its newest row
+        if not len(positions):
+            return
+        alive = self.alive.copy()
+        alive[positions] = False
+        for pos in np.asarray(positions).tolist():
+            bid = self.book_ids[pos]
+            if self.positions.get(bid) == pos:
+                del self.positions[bid]
+        self.alive = alive
+        self.live = np.flatnonzero(alive).astype(np.int64)
+
+    @staticmethod
+    def _merge_codes(values: List[str], codes: np.ndarray, delta_values: List[str]) -> np.ndarray:
+        # Re-code a delta's factorized column against (and extend) the existing value list
+        known = {v: i for i, v in enumerate(values)}
+        for v in delta_values:
+            if v not in known:
+                known[v] = len(values)
+                values.append(v)
+        mapping = np.array([known[v] for v in delta_values], dtype=np.int32)
+        return mapping[codes] if len(mapping) else codes.astype(np.int32)
+
+    @staticmethod
+    def value_codes(values: List[str], wanted: List[str]) -> np.ndarray:
+        # Codes of `wanted` in a small factorized vocabulary (countries, languages)
+        keys = {w.strip().lower() for w in wanted}
+        return np.array([i for i, v in enumerate(values) if v in keys], dtype=np.int32)
+
+    def lookup(self, book_ids: List[str]) -> np.ndarray:
+        return np.array([self.positions[b] for b in book_ids if b in self.positions], dtype=np.int64)
+
+    def lookup_or_missing(self, book_ids: List[str]) -> np.ndarray:
+        # Aligned with `book_ids`; -1 for unknown ids
+        return pd.Series(book_ids, dtype=object).map(self.positions).fillna(-1).to_numpy(dtype=np.int64)
@@ -1,79 +1,443 @@
 from __future__ import annotations
 
-from typing import Dict, List
+from typing import Dict, Iterable, List, Set, Tuple
 import os
 import numpy as np
 import pandas as pd
+from scipy import sparse
 
 from data_pipeline.schemas import RecommendationRequest
+from recommender.catalog import Catalog, positive_max
+from recommender.matrix_factorization import ImplicitALS
+from storage.artifacts import ArtifactBundle
+
+
+def prune_top_n(matrix: sparse.csr_matrix, top_n: int) -> sparse.csr_matrix:
+    # Keep the `top_n` largest entries of every row
+    if top_n <= 0 or matrix.nnz == 0:
+        return matrix
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    order = np.lexsort((-matrix.data, rows))
+    rank = np.arange(len(order)) - matrix.indptr[rows[order]]
+    keep = order[rank < top_n]
+    pruned = sparse.csr_matrix(
+        (matrix.data[keep], (rows[keep], matrix.indices[keep])), shape=matrix.shape, dtype=matrix.dtype
+    )
+    pruned.sort_indices()
+    return pruned
+
+
+class Interactions:
+    # The interaction matrices scoring reads together. Writers publish a new object rather than
+    # assigning fields, so a reader holding one never mixes a compacted matrix with a stale delta.
+    def __init__(
+        self,
+        user_item: sparse.csr_matrix | None = None,
+        cooccurrence: sparse.csr_matrix | None = None,
+        cooccurrence_delta: sparse.csr_matrix | None = None,
+    ) -> None:
+        self.user_item = user_item
+        self.cooccurrence = cooccurrence
+        # Online updates applied since the last fit/compaction
+        self.cooccurrence_delta = cooccurrence_delta
+
+    def replace(self, **changes) -> "Interactions":
+        return Interactions(**{**vars(self), **changes})
 
 
 class CollaborativeRecommender:
     def __init__(self, config: dict | None = None) -> None:
         self.config = config or {}
-        self.user_item: pd.DataFrame | None = None
-        self.item_popularity: Dict[str, float] = {}
-        self.cooccurrence: Dict[str, Dict[str, int]] = {}
-        self.items_set: set[str] = set()
+        self.top_n = int(self.config.get("recommendation", {}).get("cooccurrence_top_n", 0))
+        self.interactions = Interactions()
+        self.user_ids: List[str] = []
+        self.book_ids: List[str] = []
+        self.item_index: Dict[str, int] = {}
+        self.item_popularity: np.ndarray = np.zeros(0, dtype=float)
+        self.has_popularity: np.ndarray = np.zeros(0, dtype=bool)
+        # Catalog row position -> item column (-1: no column); None when items are not catalog rows
+        self.catalog_items: np.ndarray | None = None
+        self._pending: List[Tuple[int, int, float]] = []
+        self._baskets: Dict[int, Set[int]] = {}
+        self._user_index: Dict[str, int] | None = None
+        # Implicit ALS user/item factors over user_item; fitted by fit_factors()
+        self.mf: ImplicitALS | None = ImplicitALS(self.config) if self.config.get("mf", {}).get("enabled", True) else None
+        # Set on a detached copy: (pending events it folds, the delta they produced)
+        self._folded: Tuple[int, sparse.csr_matrix | None] | None = None
+
+    @property
+    def user_item(self) -> sparse.csr_matrix | None:
+        return self.interactions.user_item
+
+    @user_item.setter
+    def user_item(self, value: sparse.csr_matrix | None) -> None:
+        self.interactions = self.interactions.replace(user_item=value)
+
+    @property
+    def cooccurrence(self) -> sparse.csr_matrix | None:
+        return self.interactions.cooccurrence
+
+    @cooccurrence.setter
+    def cooccurrence(self, value: sparse.csr_matrix | None) -> None:
+        self.interactions = self.interactions.replace(cooccurrence=value)
+
+    @property
+    def cooccurrence_delta(self) -> sparse.csr_matrix | None:
+        return self.interactions.cooccurrence_delta
+
+    @cooccurrence_delta.setter
+    def cooccurrence_delta(self, value: sparse.csr_matrix | None) -> None:
+        self.interactions = self.interactions.replace(cooccurrence_delta=value)
 
     def fit(self, interactions_csv: str, books: pd.DataFrame | None = None) -> None:
+        # Item columns follow the catalog row order when books are given
+        self.catalog_items = None
+        if books is not None:
+            self._set_items(books["book_id"].astype(str).tolist())
+            self.catalog_items = np.arange(len(self.book_ids), dtype=np.int64)
         if not os.path.exists(interactions_csv):
             # Build trivial popularity from books
             if books is not None and not books.empty:
-                for _, row in books.iterrows():
-                    self.item_popularity[str(row["book_id"])] = float(row.get("rating_count", 1.0)) * float(row.get("avg_rating", 0.0))
+                rc = pd.to_numeric(books["rating_count"], errors="coerce").to_numpy(dtype=float) if "rating_count" in books.columns else np.ones(len(books))
+                ar = pd.to_numeric(books["avg_rating"], errors="coerce").to_numpy(dtype=float) if "avg_rating" in books.columns else np.zeros(len(books))
+                self.item_popularity = np.nan_to_num(rc * ar)
+                self.has_popularity = np.ones(len(books), dtype=bool)
             return
         df = pd.read_csv(interactions_csv)
         required_cols = {"user_id", "book_id", "event_strength"}
         if not required_cols.issubset(set(df.columns)):
             return
         df["book_id"] = df["book_id"].astype(str)
-        self.user_item = df
+        if books is None:
+            self._set_items(pd.unique(df["book_id"]).tolist())
+        items = df["book_id"].map(self.item_index)
+        df = df[items.notna()]
+        user_codes, user_ids = pd.factorize(df["user_id"].astype(str))
+        self.user_ids = [str(u) for u in user_ids]
+        # Duplicate (user, book) events are summed by the COO -> CSR conversion
+        self.user_item = sparse.csr_matrix(
+            (df["event_strength"].to_numpy(dtype=float), (user_codes, items[items.notna()].to_numpy(dtype=np.int64))),
+            shape=(len(self.user_ids), len(self.book_ids)),
+        )
         # Compute popularity
-        pop = df.groupby("book_id")["event_strength"].sum().to_dict()
-        self.item_popularity = {str(k): float(v) for k, v in pop.items()}
-        # Compute simple co-occurrence counts per user baskets
-        self.cooccurrence = {}
-        for user_id, group in df.groupby("user_id"):
-            items = group.sort_values("event_strength", ascending=False)["book_id"].tolist()
-            for i in range(len(items)):
-                a = items[i]
-                self.items_set.add(a)
-                self.cooccurrence.setdefault(a, {})
-                for j in range(i + 1, len(items)):
-                    b = items[j]
-                    self.items_set.add(b)
-                    self.cooccurrence[a][b] = self.cooccurrence[a].get(b, 0) + 1
-                    self.cooccurrence.setdefault(b, {})
-                    self.cooccurrence[b][a] = self.cooccurrence[b].get(a, 0) + 1
-
-    def _score_by_cooccurrence(self, liked_book_ids: List[str]) -> Dict[str, float]:
-        scores: Dict[str, float] = {}
-        for lb in liked_book_ids:
-            if lb not in self.cooccurrence:
+        self.item_popularity = np.asarray(self.user_item.sum(axis=0), dtype=float).ravel()
+        self.has_popularity = np.diff(self.user_item.tocsc().indptr) > 0
+        self.cooccurrence = self._cooccurrence(self.user_item)
+
+    def fit_factors(self) -> None:
+        if self.mf is not None and self.user_item is not None:
+            self.mf.fit(self.user_item)
+
+    def save(self, bundle: ArtifactBundle) -> None:
+        bundle.save_array("popularity", self.item_popularity)
+        bundle.save_array("has_popularity", self.has_popularity)
+        if self.user_item is not None:
+            bundle.save_csr("user_item", self.user_item)
+            bundle.save_json("user_ids.json", self.user_ids)
+        if self.cooccurrence is not None:
+            bundle.save_csr("cooccurrence", self.cooccurrence)
+        if self.mf is not None and len(self.mf.user_factors):
+            self.mf.save(bundle)
+        bundle.save_json("item_ids.json", self.book_ids)
+        if self.catalog_items is not None:
+            bundle.save_array("catalog_items", self.catalog_items)
+
+    def load(self, bundle: ArtifactBundle, books: pd.DataFrame) -> None:
+        if bundle.has("catalog_items"):
+            # Saved after catalog upserts: item columns are no longer the catalog rows one-to-one
+            self._set_items(bundle.load_json("item_ids.json"))
+            self.catalog_items = np.array(bundle.load_array("catalog_items"))
+        else:
+            self._set_items(books["book_id"].astype(str).tolist())
+            self.catalog_items = np.arange(len(self.book_ids), dtype=np.int64)
+        self.item_popularity = bundle.load_array("popularity")
+        self.has_popularity = bundle.load_array("has_popularity")
+        if bundle.has("user_ids.json"):
+            self.user_item = bundle.load_csr("user_item")
+            self.user_ids = bundle.load_json("user_ids.json")
+        if bundle.has("cooccurrence.shape.json"):
+            self.cooccurrence = bundle.load_csr("cooccurrence")
+        if self.mf is not None and not self.mf.load(bundle):
+            # Older bundle or other mf settings
+            self.fit_factors()
+
+    def restore(self, bundle: ArtifactBundle) -> None:
+        # Adopt a snapshot saved against another catalog: its history is keyed by book_id and moves to
+        # this model's item columns; books no longer in the catalog drop out, new ones keep their prior.
+        # Item factors stay this model's, and every snapshot user is folded in against them.
+        columns = np.array([self.item_index.get(str(b), -1) for b in bundle.load_json("item_ids.json")], dtype=np.int64)
+        known = columns >= 0
+        if not self.item_popularity.flags.writeable:
+            self.item_popularity = np.array(self.item_popularity)
+            self.has_popularity = np.array(self.has_popularity)
+        self.item_popularity[columns[known]] = np.asarray(bundle.load_array("popularity"))[known]
+        self.has_popularity[columns[known]] = np.asarray(bundle.load_array("has_popularity"))[known]
+        if not bundle.has("user_ids.json"):
+            return
+        user_ids = [str(u) for u in bundle.load_json("user_ids.json")]
+        saved = bundle.load_csr("user_item").tocoo()
+        keep = known[saved.col]
+        user_item = sparse.csr_matrix(
+            (saved.data[keep], (saved.row[keep], columns[saved.col[keep]])), shape=(len(user_ids), len(self.book_ids))
+        )
+        self.interactions = Interactions(user_item, self._cooccurrence(user_item), None)
+        self.user_ids = user_ids
+        self._pending, self._baskets, self._user_index = [], {}, None
+        if self.mf is not None:
+            self.mf.fold_in(user_item, np.arange(len(user_ids)))
+
+    def _set_items(self, book_ids: List[str]) -> None:
+        self.book_ids = book_ids
+        self.item_index = {bid: i for i, bid in enumerate(book_ids)}
+        self.item_popularity = np.zeros(len(book_ids), dtype=float)
+        self.has_popularity = np.zeros(len(book_ids), dtype=bool)
+        self.interactions = Interactions()
+        self.user_ids = []
+        self._pending = []
+        self._baskets = {}
+        self._user_index = None
+
+    def add_catalog_rows(self, book_ids: List[str]) -> None:
+        # Map catalog rows appended after the existing ones. A changed book keeps its item column (and
+        # history); only unseen books get new, empty columns, so the cost follows the delta.
+        new_ids = [b for b in dict.fromkeys(book_ids) if b not in self.item_index]
+        n_old, n_new = len(self.book_ids), len(self.book_ids) + len(new_ids)
+        if new_ids:
+            self.item_popularity = np.concatenate([self.item_popularity, np.zeros(len(new_ids))])
+            self.has_popularity = np.concatenate([self.has_popularity, np.zeros(len(new_ids), dtype=bool)])
+            self.interactions = self._widen_all(self.interactions, n_new)
+            self.book_ids = self.book_ids + new_ids
+            self.item_index.update({b: n_old + i for i, b in enumerate(new_ids)})
+        if self.catalog_items is not None:
+            columns = np.array([self.item_index[b] for b in book_ids], dtype=np.int64)
+            self.catalog_items = np.concatenate([self.catalog_items, columns])
+
+    @classmethod
+    def _widen_all(cls, interactions: Interactions, n_items: int) -> Interactions:
+        user_item, cooc, delta = interactions.user_item, interactions.cooccurrence, interactions.cooccurrence_delta
+        return Interactions(
+            cls._widen(user_item, user_item.shape[0], n_items) if user_item is not None else None,
+            cls._widen(cooc, n_items, n_items) if cooc is not None else None,
+            cls._widen(delta, n_items, n_items) if delta is not None else None,
+        )
+
+    @staticmethod
+    def _widen(matrix: sparse.csr_matrix, n_rows: int, n_cols: int) -> sparse.csr_matrix:
+        # Grow a CSR matrix with empty rows/columns, sharing its data and index buffers
+        indptr = np.concatenate([matrix.indptr, np.full(n_rows - matrix.shape[0], matrix.indptr[-1])])
+        widened = sparse.csr_matrix((n_rows, n_cols), dtype=matrix.dtype)
+        widened.data, widened.indices, widened.indptr = matrix.data, matrix.indices, indptr.astype(matrix.indptr.dtype)
+        return widened
+
+    def _basket(self, user: int) -> Set[int]:
+        basket = self._baskets.get(user)
+        if basket is None:
+            basket = set()
+            if self.user_item is not None and user < self.user_item.shape[0]:
+                start, end = self.user_item.indptr[user], self.user_item.indptr[user + 1]
+                basket.update(int(i) for i in self.user_item.indices[start:end])
+            self._baskets[user] = basket
+        return basket
+
+    def partial_fit(self, events: Iterable[Tuple[str, str, float]]) -> int:
+        # Apply (user_id, book_id, event_strength) events in place; cost grows with the events
+        # and the touched baskets, not with the interaction history
+        if not self.item_index:
+            return 0
+        if not self.item_popularity.flags.writeable:
+            # Memory-mapped arrays from an artifact bundle are read-only
+            self.item_popularity = np.array(self.item_popularity)
+            self.has_popularity = np.array(self.has_popularity)
+        if self._user_index is None:
+            self._user_index = {u: i for i, u in enumerate(self.user_ids)}
+        n_items = len(self.book_ids)
+        if self.cooccurrence is None:
+            self.cooccurrence = sparse.csr_matrix((n_items, n_items), dtype=np.float32)
+        rows: List[int] = []
+        cols: List[int] = []
+        applied = 0
+        for user_id, book_id, strength in events:
+            item = self.item_index.get(str(book_id))
+            if item is None:
                 continue
-            for other, cnt in self.cooccurrence[lb].items():
-                scores[other] = scores.get(other, 0.0) + float(cnt)
-        # Add popularity prior
-        for item, prior in self.item_popularity.items():
-            scores[item] = scores.get(item, 0.0) + 0.05 * prior
-        return scores
+            user = self._user_index.get(str(user_id))
+            if user is None:
+                user = len(self.user_ids)
+                self.user_ids.append(str(user_id))
+                self._user_index[str(user_id)] = user
+            self.item_popularity[item] += float(strength)
+            self.has_popularity[item] = True
+            basket = self._basket(user)
+            if item not in basket:
+                for other in basket:
+                    rows.extend((item, other))
+                    cols.extend((other, item))
+                basket.add(item)
+            self._pending.append((user, item, float(strength)))
+            applied += 1
+        if rows:
+            delta = sparse.csr_matrix(
+                (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(n_items, n_items)
+            )
+            self.cooccurrence_delta = delta if self.cooccurrence_delta is None else self.cooccurrence_delta + delta
+        return applied
+
+    def compact(self) -> None:
+        # Fold pending events into the user-item matrix and rebuild co-occurrence from it
+        if not self._pending and self.cooccurrence_delta is None:
+            return
+        n_users, n_items = len(self.user_ids), len(self.book_ids)
+        users, items, strengths = zip(*self._pending) if self._pending else ((), (), ())
+        user_item = sparse.csr_matrix((strengths, (users, items)), shape=(n_users, n_items), dtype=float)
+        if self.user_item is not None:
+            base = self.user_item.copy()
+            base.resize((n_users, n_items))
+            user_item = user_item + base
+        cooccurrence = self._cooccurrence(user_item)
+        if self.mf is not None:
+            self.mf.fold_in(user_item, np.unique(np.asarray(users, dtype=np.int64)))
+        self.interactions = Interactions(user_item, cooccurrence, None)
+        self._pending = []
+        self._baskets = {}
+
+    def detach(self) -> "CollaborativeRecommender":
+        # A copy of the current state to compact and save without holding the update lock: what
+        # partial_fit mutates in place is copied, the rest shared. Call under the update lock.
+        copy = CollaborativeRecommender.__new__(CollaborativeRecommender)
+        copy.__dict__.update(self.__dict__)
+        copy.item_popularity = np.array(self.item_popularity)
+        copy.has_popularity = np.array(self.has_popularity)
+        copy.user_ids = list(self.user_ids)
+        copy.item_index = dict(self.item_index)
+        copy._pending = list(self._pending)
+        copy._baskets = {}
+        copy._user_index = None
+        if self.mf is not None:
+            copy.mf = ImplicitALS(self.config)
+            copy.mf.user_factors, copy.mf.item_factors = self.mf.user_factors, self.mf.item_factors
+        copy._folded = (len(self._pending), self.cooccurrence_delta)
+        return copy
+
+    def adopt(self, compacted: "CollaborativeRecommender") -> None:
+        # Publish a compacted detached copy. Events applied since detach() stay pending, and the
+        # delta keeps only their co-occurrence. Call under the update lock.
+        folded, folded_delta = compacted._folded
+        n_items = len(self.book_ids)
+        current = self.interactions
+        delta = current.cooccurrence_delta
+        if delta is not None and folded_delta is not None:
+            delta = delta - self._widen(folded_delta, n_items, n_items)
+            delta.eliminate_zeros()
+            delta = delta if delta.nnz else None
+        self._pending = self._pending[folded:]
+        # Baskets of users with remaining pending events still hold items user_item does not
+        touched = {user for user, _, _ in self._pending}
+        self._baskets = {user: basket for user, basket in self._baskets.items() if user in touched}
+        if self.mf is not None and compacted.mf is not None:
+            self.mf.user_factors = compacted.mf.user_factors
+        self.interactions = self._widen_all(compacted.interactions.replace(cooccurrence_delta=delta), n_items)
+
+    def _cooccurrence(self, user_item: sparse.csr_matrix) -> sparse.csr_matrix:
+        # Number of users that interacted with both items: B^T B over the binary basket matrix
+        baskets = user_item.copy()
+        baskets.data = np.ones_like(baskets.data, dtype=np.float32)
+        cooc = (baskets.T @ baskets).tocsr()
+        cooc.setdiag(0)
+        cooc.eliminate_zeros()
+        return prune_top_n(cooc, self.top_n)
 
-    def score_candidates(self, request: RecommendationRequest, candidate_df: pd.DataFrame) -> Dict[str, float]:
-        if candidate_df.empty:
-            return {}
-        candidate_ids = set(candidate_df["book_id"].astype(str).tolist())
-        liked_titles = [t.lower() for t in request.liked_books]
-        # Map liked titles to ids using candidate_df
-        title_to_id = {str(row["title"]).lower(): str(row["book_id"]) for _, row in candidate_df.iterrows()}
-        liked_ids = [title_to_id[t] for t in liked_titles if t in title_to_id]
-        if not liked_ids and not self.item_popularity:
-            # popularity only from candidate_df
-            return {str(row["book_id"]): float(row.get("rating_count", 0.0)) * float(row.get("avg_rating", 0.0)) for _, row in candidate_df.iterrows()}
-        co_scores = self._score_by_cooccurrence(liked_ids)
-        # Filter to candidates
-        filtered = {bid: sc for bid, sc in co_scores.items() if bid in candidate_ids}
-        if not filtered:
-            # fallback to popularity within candidates
-            filtered = {str(row["book_id"]): float(row.get("rating_count", 0.0)) * float(row.get("avg_rating", 0.0)) for _, row in candidate_df.iterrows()}
-        return filtered
\ No newline at end of file
+    def _user_rows(self, user_ids: List[str | None]) -> np.ndarray:
+        if self._user_index is None:
+            self._user_index = {u: i for i, u in enumerate(self.user_ids)}
+        return np.array([self._user_index.get(u, -1) if u is not None else -1 for u in user_ids], dtype=np.int64)
+
+    def history_positions(self, user_id: str, catalog: Catalog) -> np.ndarray:
+        # Catalog rows of the books in a user's compacted history
+        user = int(self._user_rows([user_id])[0])
+        user_item = self.user_item
+        if user < 0 or user_item is None or user >= user_item.shape[0]:
+            return np.zeros(0, dtype=np.int64)
+        items = user_item.indices[user_item.indptr[user]:user_item.indptr[user + 1]]
+        return catalog.lookup([self.book_ids[i] for i in items.tolist()])
+
+    def score_users(self, user_ids: List[str | None], positions: np.ndarray, catalog: Catalog, scaled: bool = True) -> np.ndarray:
+        # (users x candidates) factor scores scaled so each user's best candidate is 1 (raw when not
+        # `scaled`); NaN without a user vector (no or unknown user_id) or an item vector (books added
+        # since the fit)
+        scores = np.full((len(user_ids), len(positions)), np.nan)
+        if self.mf is None or not len(positions) or all(u is None for u in user_ids):
+            return scores
+        scores = self.mf.scores(self._user_rows(user_ids), self._items_for(positions, catalog))
+        if not scaled:
+            return scores
+        best = np.nanmax(np.where(scores > 0, scores, np.nan), axis=1, initial=0.0)
+        return scores / np.where(best > 0, best, 1.0)[:, None]
+
+    def _items_for(self, positions: np.ndarray, catalog: Catalog) -> np.ndarray:
+        if self.catalog_items is not None:
+            return self.catalog_items[positions]
+        return np.array([self.item_index.get(catalog.book_ids[p], -1) for p in positions], dtype=np.int64)
+
+    def _liked_items(self, request: RecommendationRequest, catalog: Catalog, positions: np.ndarray | None = None) -> np.ndarray:
+        # Items of the liked titles anywhere in the live catalog, whatever the request's filters, or of
+        # their already resolved `positions`
+        if positions is None:
+            positions = catalog.title_positions(request.liked_books)
+        items = self._items_for(positions, catalog)
+        return items[items >= 0]
+
+    def _score_by_cooccurrence(self, liked: List[np.ndarray], items: np.ndarray) -> np.ndarray:
+        # One row per liked-item list, scored at `items`; NaN where neither co-occurrence nor a popularity prior exists
+        scores = np.tile(0.05 * self.item_popularity[items], (len(liked), 1))
+        present = np.tile(self.has_popularity[items], (len(liked), 1))
+        state = self.interactions
+        if state.cooccurrence is not None and any(len(l) for l in liked):
+            # Sparse row-sum over each list of liked items: indicator (lists x items) @ co-occurrence
+            rows = np.repeat(np.arange(len(liked)), [len(l) for l in liked])
+            cols = np.concatenate(liked)
+            indicator = sparse.csr_matrix(
+                (np.ones(len(cols), dtype=np.float32), (rows, cols)), shape=(len(liked), state.cooccurrence.shape[0])
+            )
+            co = indicator @ state.cooccurrence
+            if state.cooccurrence_delta is not None:
+                co = co + indicator @ state.cooccurrence_delta
+            co = co[:, items].toarray()
+            scores += co
+            present |= co > 0
+        return np.where(present, scores, np.nan)
+
+    def score_candidates(
+        self, request: RecommendationRequest, positions: np.ndarray, catalog: Catalog, fallback: bool = True,
+        liked: np.ndarray | None = None,
+    ) -> np.ndarray:
+        # Scores aligned with `positions` (catalog rows); NaN marks "no signal". `liked`: the liked
+        # titles' rows when already resolved.
+        return self.score_group([request], positions, catalog, fallback, None if liked is None else [liked])[0]
+
+    def score_group(
+        self, requests: List[RecommendationRequest], positions: np.ndarray, catalog: Catalog, fallback: bool = True,
+        liked_positions: List[np.ndarray] | None = None,
+    ) -> np.ndarray:
+        # Batched scoring of requests sharing one candidate set: (requests x candidates). A row that is
+        # only a popularity prior (no liked item, or catalog popularity when no candidate has a signal)
+        # is scaled so its best candidate is 1, like the mf signal it is blended with. Without
+        # `fallback`, rows stay unscaled and candidates without any signal stay NaN instead of taking
+        # catalog popularity.
+        scores = np.full((len(requests), len(positions)), np.nan)
+        if len(positions) == 0:
+            return scores
+        items = self._items_for(positions, catalog)
+        valid = items >= 0
+        liked_positions = liked_positions or [None] * len(requests)
+        liked = [self._liked_items(r, catalog, p) for r, p in zip(requests, liked_positions)]
+        scores[:, valid] = self._score_by_cooccurrence(liked, items[valid])
+        if not fallback:
+            return scores
+        for i, liked_items in enumerate(liked):
+            if np.isnan(scores[i]).all():
+                # fallback to popularity within candidates
+                scores[i] = catalog.popularity[positions]
+            elif len(liked_items):
+                continue
+            scores[i] = scores[i] / (positive_max(scores[i]) or 1.0)
+        return scores
@@ -1,43 +1,204 @@
 from __future__ import annotations
 
-from typing import Dict
+from typing import Dict, List
+import pickle
 import numpy as np
+from scipy import sparse
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
+from data_pipeline.catalog_ingest import build_corpus
 from data_pipeline.schemas import RecommendationRequest
+from recommender.catalog import positive_max
+from recommender.embeddings import make_encoder
+from search.ann_index import AnnIndex
+from search.quantization import QuantizedMatrix, quantize_int8
+from storage.artifacts import ArtifactBundle
 
 
 class ContentBasedRecommender:
+    EMBED_BATCH_ROWS = 50000
+
     def __init__(self, config: dict | None = None) -> None:
         self.config = config or {}
+        # Dense retrieval: int8 embeddings (LSA or a local encoder) are searched instead of TF-IDF rows
+        deep = self.config.get("recommendation", {}).get("enable_deep_embeddings", False)
+        self.encoder = make_encoder(self.config) if deep else None
+        self.embeddings: QuantizedMatrix | None = None
         self.vectorizer: TfidfVectorizer | None = None
         self.tfidf_matrix: np.ndarray | None = None
         self.book_ids: list[str] = []
         self.books_df: pd.DataFrame | None = None
+        self.popularity: np.ndarray = np.zeros(0, dtype=float)
+        self.ann_index: AnnIndex | None = None
 
     def fit(self, books_df: pd.DataFrame) -> None:
         self.books_df = books_df.copy()
         self.book_ids = [str(x) for x in self.books_df["book_id"].tolist()]
+        self.popularity = self._popularity(self.books_df)
         corpus = self._build_corpus(self.books_df)
-        self.vectorizer = TfidfVectorizer(max_features=20000, ngram_range=(1, 2))
-        self.tfidf_matrix = self.vectorizer.fit_transform(corpus)
+        shared = self.config.get("paths", {}).get("vectorizer_pkl")
+        if shared:
+            # Vocabulary and idf fitted over the whole catalog (a shard, see recommender/sharding.py), so
+            # similarities compare across shards
+            with open(shared, "rb") as f:
+                self.vectorizer = pickle.load(f)
+            self.tfidf_matrix = self.vectorizer.transform(corpus)
+        else:
+            self.vectorizer = self._new_vectorizer()
+            self.tfidf_matrix = self.vectorizer.fit_transform(corpus)
+        if self.encoder is not None:
+            self.encoder.fit(corpus, self.tfidf_matrix)
+            self.embeddings = self._embed(corpus, self.tfidf_matrix)
+        self.build_index()
+
+    def _new_vectorizer(self) -> TfidfVectorizer:
+        return TfidfVectorizer(max_features=20000, ngram_range=(1, 2))
+
+    def save(self, bundle: ArtifactBundle) -> None:
+        bundle.save_csr("tfidf", self.tfidf_matrix)
+        bundle.save_array("idf", self.vectorizer.idf_)
+        bundle.save_json("vocabulary.json", {term: int(col) for term, col in self.vectorizer.vocabulary_.items()})
+        if self.embeddings is not None:
+            bundle.save_array("embeddings.codes", self.embeddings.codes)
+            bundle.save_array("embeddings.scale", self.embeddings.scale)
+            bundle.save_json("embeddings.json", self._encoder_key())
+            self.encoder.save(bundle)
+        self.ann_index.save(bundle.path_for("ann"))
+
+    def load(self, bundle: ArtifactBundle, books_df: pd.DataFrame) -> None:
+        # Restore a fitted model without refitting; the TF-IDF matrix stays memory-mapped
+        self.books_df = books_df
+        self.book_ids = [str(x) for x in self.books_df["book_id"].tolist()]
+        self.popularity = self._popularity(self.books_df)
+        self.vectorizer = self._new_vectorizer()
+        self.vectorizer.vocabulary_ = bundle.load_json("vocabulary.json")
+        self.vectorizer.idf_ = np.array(bundle.load_array("idf"))
+        self.tfidf_matrix = bundle.load_csr("tfidf")
+        reencoded = False
+        if self.encoder is not None:
+            if bundle.has("embeddings.codes") and bundle.has("embeddings.json") and bundle.load_json("embeddings.json") == self._encoder_key():
+                # int8 codes stay memory-mapped; the index only pages in what it touches
+                self.encoder.load(bundle)
+                self.embeddings = QuantizedMatrix(bundle.load_array("embeddings.codes"), np.array(bundle.load_array("embeddings.scale")))
+            else:
+                corpus = self._build_corpus(self.books_df)
+                self.encoder.fit(corpus, self.tfidf_matrix)
+                self.embeddings = self._embed(corpus, self.tfidf_matrix)
+                reencoded = True
+        # A prebuilt engine from the bundle is attached instead of rebuilt when its settings still match;
+        # like the matrices, it stays mapped until the first catalog add copies it
+        matrix = self._search_matrix()
+        index = self._index_for(matrix)
+        if reencoded or not index.load(bundle.path_for("ann"), matrix, mmap=True):
+            index.build(matrix, labels=self.book_ids)
+        self.ann_index = index
+
+    def build_index(self) -> None:
+        self.ann_index = self._new_index(self._search_matrix())
+
+    def _search_matrix(self):
+        return self.tfidf_matrix if self.embeddings is None else self.embeddings
+
+    def _index_for(self, matrix) -> AnnIndex:
+        ann = self.config.get("ann", {})
+        return AnnIndex(
+            dim=matrix.shape[1],
+            engine=ann.get("engine", "auto"),
+            exact_threshold=int(ann.get("exact_threshold", 5000)),
+            params=ann,
+        )
+
+    def _new_index(self, matrix) -> AnnIndex:
+        index = self._index_for(matrix)
+        index.build(matrix, labels=self.book_ids)
+        return index
+
+    def _encoder_key(self) -> Dict[str, object]:
+        return {"encoder": self.encoder.name, "dim": getattr(self.encoder, "dim", None)}
+
+    def _embed(self, texts: List[str] | None, tfidf: sparse.csr_matrix, scale: np.ndarray | None = None) -> QuantizedMatrix:
+        # Encode in batches straight into int8 codes; the per-dimension scale comes from a row sample
+        # so no float copy of the whole catalog is ever held
+        n = tfidf.shape[0]
+        if scale is None:
+            sample = np.sort(np.random.default_rng(0).choice(n, size=min(n, 20000), replace=False))
+            sample_texts = None if texts is None else [texts[i] for i in sample]
+            _, scale = quantize_int8(self.encoder.transform(sample_texts, tfidf[sample]))
+        codes = np.empty((n, len(scale)), dtype=np.int8)
+        for start in range(0, n, self.EMBED_BATCH_ROWS):
+            stop = start + self.EMBED_BATCH_ROWS
+            batch = self.encoder.transform(None if texts is None else texts[start:stop], tfidf[start:stop])
+            codes[start:stop], _ = quantize_int8(batch, scale)
+        return QuantizedMatrix(codes, scale)
+
+    def _encode_queries(self, queries: List[str]):
+        query_vecs = self.vectorizer.transform(queries)
+        if self.encoder is not None:
+            return self.encoder.transform(queries, query_vecs)
+        return query_vecs
 
     def _build_corpus(self, df: pd.DataFrame) -> list[str]:
-        corpus: list[str] = []
-        for _, row in df.iterrows():
-            fields = [
-                str(row.get("title", "")),
-                str(row.get("author", "")),
-                str(row.get("genres", "")).replace("|", " "),
-                str(row.get("themes", "")).replace("|", " "),
-                str(row.get("description", "")),
-                str(row.get("country", "")),
-                str(row.get("language", "")),
-            ]
-            corpus.append(" ".join([t for t in fields if t]))
-        return corpus
+        return build_corpus(df).tolist()
+
+    def add_rows(self, books_df: pd.DataFrame) -> None:
+        # Append rows for new or changed books with the current vocabulary and idf: cost follows the
+        # delta. Terms unseen at fit time are ignored until the next full rebuild.
+        corpus = self._build_corpus(books_df)
+        rows = self.vectorizer.transform(corpus)
+        matrix = sparse.vstack([self.tfidf_matrix, rows], format="csr")
+        self.popularity = np.concatenate([self.popularity, self._popularity(books_df)])
+        self.book_ids = self.book_ids + [str(x) for x in books_df["book_id"].tolist()]
+        embeddings = None
+        if self.embeddings is not None:
+            new = self._embed(corpus, rows, self.embeddings.scale)
+            embeddings = self.embeddings.append(new.codes)
+            rows, items = new, embeddings
+        else:
+            items = matrix
+        if self.ann_index is not None:
+            self.ann_index.add(rows, items=items, labels=books_df["book_id"].astype(str).tolist())
+        self.tfidf_matrix, self.embeddings = matrix, embeddings
+
+    def remove_rows(self, positions: np.ndarray) -> None:
+        # Retired catalog rows leave the ANN engine too; row ids of the others are unchanged
+        if self.ann_index is not None and len(positions):
+            self.ann_index.remove(positions)
+
+    def reweight(self, alive: np.ndarray) -> None:
+        # Recompute idf over the live rows with the vocabulary fixed. Rows are l2(tf * idf), so each row
+        # is rescaled by idf_new / idf_old and renormalised; no text is re-tokenized.
+        matrix = self.tfidf_matrix
+        n_docs = int(alive.sum())
+        live_rows = np.repeat(alive, np.diff(matrix.indptr))
+        df = np.bincount(matrix.indices[live_rows], minlength=matrix.shape[1])
+        # sklearn's smooth_idf formula
+        idf = np.log((1.0 + n_docs) / (1.0 + df)) + 1.0
+        old_idf = np.asarray(self.vectorizer.idf_, dtype=float)
+        data = matrix.data * (idf / old_idf)[matrix.indices]
+        reweighted = sparse.csr_matrix((data, matrix.indices, matrix.indptr), shape=matrix.shape)
+        norms = np.sqrt(np.asarray(reweighted.multiply(reweighted).sum(axis=1), dtype=float).ravel())
+        norms[norms == 0] = 1.0
+        reweighted = sparse.csr_matrix(sparse.diags(1.0 / norms) @ reweighted)
+        embeddings, index = self.embeddings, self.ann_index
+        if self.encoder is None:
+            index = self._new_index(reweighted)
+        elif self.encoder.uses_tfidf:
+            embeddings = self._embed(None, reweighted)
+            index = self._new_index(embeddings)
+        if index is not self.ann_index:
+            index.remove(np.flatnonzero(~alive))
+        # Readers may briefly pair the new rows with the old idf; dimensions are unchanged either way
+        self.tfidf_matrix, self.embeddings, self.ann_index = reweighted, embeddings, index
+        self.vectorizer.idf_ = idf
+
+    def _popularity(self, df: pd.DataFrame) -> np.ndarray:
+        pop = np.ones(len(df), dtype=float)
+        for col in ("rating_count", "avg_rating"):
+            if col not in df.columns:
+                return np.zeros(len(df), dtype=float)
+            pop *= pd.to_numeric(df[col], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+        return pop
 
     def _request_to_query_text(self, request: RecommendationRequest) -> str:
         tokens = []
@@ -49,34 +210,100 @@ class ContentBasedRecommender:
         tokens.extend(request.liked_books)
         return " ".join(tokens)
 
-    def score_candidates(self, request: RecommendationRequest, candidate_df: pd.DataFrame) -> Dict[str, float]:
+    def has_query(self, request: RecommendationRequest) -> bool:
+        return bool(self._request_to_query_text(request).strip())
+
+    def _popularity_prior(self, positions: np.ndarray) -> np.ndarray:
+        # Popularity proxy scaled so the most popular candidate is 1, the range of the similarities
+        popularity = self.popularity[positions]
+        return popularity / (positive_max(popularity) or 1.0)
+
+    def score_candidates(
+        self, request: RecommendationRequest, positions: np.ndarray, top_k: int | None = None, scaled: bool = True
+    ) -> np.ndarray:
+        # Scores aligned with `positions` (sorted rows of the fitted catalog); NaN marks "no signal".
+        # With `top_k`, only the nearest neighbours retrieved through the ANN index are scored.
+        scores = np.full(len(positions), np.nan)
         if self.vectorizer is None or self.tfidf_matrix is None or self.books_df is None:
-            return {}
-        if candidate_df.empty:
-            return {}
+            return scores
+        if len(positions) == 0:
+            return scores
         query = self._request_to_query_text(request)
         if not query.strip():
-            # No preferences -> use popularity proxy (rating_count * avg_rating)
-            scores: Dict[str, float] = {}
-            for _, row in candidate_df.iterrows():
-                rc = float(row.get("rating_count", 0.0))
-                ar = float(row.get("avg_rating", 0.0))
-                scores[str(row["book_id"])] = rc * ar
+            # No preferences -> use popularity proxy (rating_count * avg_rating); raw when not `scaled`
+            return self._popularity_prior(positions) if scaled else self.popularity[positions]
+        query_vec = self._encode_queries([query])
+        items = self._search_matrix()
+        if top_k is None or len(positions) <= top_k or self.ann_index is None:
+            # Rows and query are L2-normalised, so the dot product is the cosine similarity
+            sims = items[positions] @ query_vec.T
+            return np.asarray(sims.todense() if sparse.issparse(sims) else sims, dtype=float).ravel()
+        allowed = None if len(positions) == items.shape[0] else positions
+        ids, sims = self.ann_index.search(query_vec, top_k, allowed)
+        ids, sims = ids[0], sims[0]
+        found = ids >= 0
+        scores[np.searchsorted(positions, ids[found])] = sims[found]
+        return scores
+
+    def unit_rows(self, positions: np.ndarray) -> sparse.csr_matrix | np.ndarray:
+        # L2-normalised search rows for `positions`, for list-level re-ranking
+        items = self._search_matrix()[positions]
+        if sparse.issparse(items):
+            return items  # TF-IDF rows are already L2-normalised
+        vectors = items.dequantize() if isinstance(items, QuantizedMatrix) else np.asarray(items, dtype=np.float32)
+        return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-9)
+
+    def transform_queries(self, requests: List[RecommendationRequest]) -> tuple[sparse.csr_matrix | np.ndarray, np.ndarray]:
+        # All query texts in one vectorizer call; the mask marks requests that carry any preference
+        queries = [self._request_to_query_text(r) for r in requests]
+        has_query = np.array([bool(q.strip()) for q in queries], dtype=bool)
+        return self._encode_queries(queries), has_query
+
+    def score_group(
+        self,
+        query_vecs: sparse.csr_matrix,
+        has_query: np.ndarray,
+        positions: np.ndarray,
+        top_k: List[int | None],
+    ) -> np.ndarray:
+        # Batched scoring of queries sharing one candidate set: (queries x candidates).
+        # Exact top-k per query, i.e. what the single-request ANN retrieval approximates.
+        scores = np.full((query_vecs.shape[0], len(positions)), np.nan)
+        if self.tfidf_matrix is None or len(positions) == 0:
+            return scores
+        scores[~has_query] = self._popularity_prior(positions)
+        rows = np.flatnonzero(has_query)
+        if not len(rows):
             return scores
-        query_vec = self.vectorizer.transform([query])
-
-        # Map candidate indices to global tfidf matrix rows
-        id_to_idx = {bid: i for i, bid in enumerate(self.book_ids)}
-        candidate_indices = [id_to_idx.get(str(bid), -1) for bid in candidate_df["book_id"].astype(str).tolist()]
-        valid_mask = [i for i, idx in enumerate(candidate_indices) if idx >= 0]
-        if not valid_mask:
-            return {}
-        idxs = [candidate_indices[i] for i in valid_mask]
-        sub_matrix = self.tfidf_matrix[idxs]
-        sims = cosine_similarity(query_vec, sub_matrix)[0]
-        scores: Dict[str, float] = {}
-        candidate_ids = candidate_df["book_id"].astype(str).tolist()
-        for local_i, sim in zip(valid_mask, sims):
-            bid = str(candidate_ids[local_i])
-            scores[bid] = float(sim)
-        return scores
\ No newline at end of file
+        items = self._search_matrix()
+        items = items if len(positions) == items.shape[0] else items[positions]
+        if sparse.issparse(query_vecs):
+            sims = (query_vecs[rows] @ items.T).toarray()
+        else:
+            sims = (items @ query_vecs[rows].T).T
+        for i, row in enumerate(rows):
+            k = top_k[row]
+            if k is None or len(positions) <= k:
+                scores[row] = sims[i]
+            else:
+                keep = np.argpartition(-sims[i], k - 1)[:k]
+                scores[row, keep] = sims[i, keep]
+        return scores
+
+    def dense_report(self, top_k: int = 50, sample_rows: int = 256) -> Dict[str, float]:
+        # recall@k of the dense path against exact TF-IDF search (catalog rows as queries) and bytes per book
+        n = self.tfidf_matrix.shape[0]
+        sample = np.sort(np.random.default_rng(0).choice(n, size=min(n, sample_rows), replace=False))
+        exact = AnnIndex(dim=self.tfidf_matrix.shape[1], engine="none")
+        exact.build(self.tfidf_matrix)
+        expected, _ = exact.exact_search(self.tfidf_matrix[sample], top_k)
+        texts = self._build_corpus(self.books_df.iloc[sample])
+        found, _ = self.ann_index.search(self.encoder.transform(texts, self.tfidf_matrix[sample]), top_k)
+        hits = sum(len(set(f.tolist()) & set(e.tolist())) for f, e in zip(found, expected))
+        tfidf = self.tfidf_matrix
+        return {
+            "recall": hits / expected.size if expected.size else 1.0,
+            "tfidf_bytes_per_book": (tfidf.data.nbytes + tfidf.indices.nbytes + tfidf.indptr.nbytes) / n,
+            "codes_bytes_per_book": self.embeddings.nbytes / n,
+            "index_bytes_per_book": self.ann_index.engine_nbytes() / n,
+        }
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from typing import List
+import numpy as np
+from scipy import sparse
+
+from storage.artifacts import ArtifactBundle
+
+try:
+    from sklearn.decomposition import TruncatedSVD
+except Exception:  # pragma: no cover
+    TruncatedSVD = None
+
+try:
+    from sentence_transformers import SentenceTransformer  # type: ignore
+except Exception:
+    SentenceTransformer = None
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-9)
+
+
+class SvdEncoder:
+    # LSA: a truncated SVD of the TF-IDF matrix; queries are projected with the same components
+    name = "svd"
+    uses_tfidf = True
+
+    def __init__(self, dim: int = 128, seed: int = 42) -> None:
+        self.dim = dim
+        self.seed = seed
+        self.components: np.ndarray | None = None
+
+    def fit(self, texts: List[str], tfidf: sparse.csr_matrix) -> None:
+        if TruncatedSVD is None:
+            raise ImportError("scikit-learn is required for the svd encoder")
+        dim = max(1, min(self.dim, tfidf.shape[1] - 1, tfidf.shape[0] - 1))
+        svd = TruncatedSVD(n_components=dim, algorithm="randomized", random_state=self.seed)
+        svd.fit(tfidf)
+        self.components = np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+
+    def transform(self, texts: List[str], tfidf: sparse.csr_matrix) -> np.ndarray:
+        return _unit(np.asarray(tfidf @ self.components))
+
+    def save(self, bundle: ArtifactBundle) -> None:
+        bundle.save_array("embeddings.components", self.components)
+
+    def load(self, bundle: ArtifactBundle) -> None:
+        self.components = np.array(bundle.load_array("embeddings.components"))
+
+
+class SentenceEncoder:
+    # Any local sentence-transformers model (a name cached on disk or a directory); encodes the corpus text
+    uses_tfidf = False
+
+    def __init__(self, model: str) -> None:
+        if SentenceTransformer is None:
+            raise ImportError("sentence-transformers is not installed")
+        self.name = f"sentence-transformers:{model}"
+        self.model = SentenceTransformer(model)
+
+    def fit(self, texts: List[str], tfidf: sparse.csr_matrix) -> None:
+        return None
+
+    def transform(self, texts: List[str], tfidf: sparse.csr_matrix) -> np.ndarray:
+        return _unit(self.model.encode(texts, batch_size=256, show_progress_bar=False))
+
+    def save(self, bundle: ArtifactBundle) -> None:
+        return None
+
+    def load(self, bundle: ArtifactBundle) -> None:
+        return None
+
+
+def make_encoder(config: dict):
+    # embeddings.encoder: "svd" or "sentence-transformers:<model>"
+    cfg = config.get("embeddings", {})
+    encoder = str(cfg.get("encoder", "svd"))
+    if encoder.startswith("sentence-transformers:"):
+        return SentenceEncoder(encoder.split(":", 1)[1])
+    if encoder != "svd":
+        raise ValueError(f"Unknown embeddings.encoder: {encoder}")
+    return SvdEncoder(dim=int(cfg.get("dim", 128)), seed=int(cfg.get("seed", 42)))
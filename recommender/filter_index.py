@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional
+import re
+import numpy as np
+import pandas as pd
+
+from data_pipeline.schemas import RecommendationRequest
+
+
+def _split_multi(series: pd.Series) -> tuple[np.ndarray, pd.Series]:
+    # Explode pipe-delimited values into (row position, lowercased token) pairs
+    tokens = series.fillna("").astype(str).str.lower().str.split("|")
+    lengths = tokens.str.len().to_numpy()
+    positions = np.repeat(np.arange(len(series), dtype=np.int64), lengths)
+    flat = pd.Series([t.strip() for row in tokens for t in row], dtype=object)
+    return positions, flat
+
+
+def _build_postings(positions: np.ndarray, values: pd.Series) -> Dict[str, np.ndarray]:
+    mask = (values != "").to_numpy()
+    positions = positions[mask]
+    codes, uniques = pd.factorize(values[mask])
+    if len(uniques) == 0:
+        return {}
+    order = np.lexsort((positions, codes))
+    counts = np.bincount(codes, minlength=len(uniques))
+    lists = np.split(positions[order], np.cumsum(counts)[:-1])
+    return {str(v): np.unique(p) for v, p in zip(uniques, lists)}
+
+
+class FilterIndex:
+    MULTI_VALUED = ("genres", "themes")
+    SINGLE_VALUED = ("author", "country", "language")
+
+    def __init__(self) -> None:
+        self.size = 0
+        self.postings: Dict[str, Dict[str, np.ndarray]] = {}
+        self.year_positions: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.sorted_years: np.ndarray = np.zeros(0, dtype=float)
+
+    def build(self, books: pd.DataFrame) -> None:
+        self.size = len(books)
+        self.postings = {}
+        for col in self.MULTI_VALUED:
+            if col in books.columns:
+                positions, values = _split_multi(books[col])
+                self.postings[col] = _build_postings(positions, values)
+        for col in self.SINGLE_VALUED:
+            if col in books.columns:
+                values = books[col].fillna("").astype(str).str.lower().reset_index(drop=True)
+                self.postings[col] = _build_postings(np.arange(self.size, dtype=np.int64), values)
+        if "year" in books.columns:
+            years = pd.to_numeric(books["year"], errors="coerce").to_numpy(dtype=float)
+            valid = np.flatnonzero(~np.isnan(years))
+            order = np.argsort(years[valid], kind="stable")
+            self.year_positions = valid[order]
+            self.sorted_years = years[valid][order]
+
+    def add(self, books: pd.DataFrame, offset: int) -> None:
+        # Index rows appended at `offset`; new positions sort after every existing one, so postings
+        # are extended rather than rebuilt. Tombstoned rows are filtered by the caller.
+        delta = FilterIndex()
+        delta.build(books)
+        for field, index in delta.postings.items():
+            merged = dict(self.postings.get(field, {}))
+            for value, positions in index.items():
+                positions = positions + offset
+                merged[value] = np.concatenate([merged[value], positions]) if value in merged else positions
+            self.postings[field] = merged
+        if len(delta.sorted_years):
+            at = np.searchsorted(self.sorted_years, delta.sorted_years, side="right")
+            year_positions = np.insert(self.year_positions, at, delta.year_positions + offset)
+            self.sorted_years, self.year_positions = np.insert(self.sorted_years, at, delta.sorted_years), year_positions
+        self.size = offset + delta.size
+
+    def lookup(self, field: str, values: List[str]) -> np.ndarray:
+        index = self.postings.get(field, {})
+        hits = [index[v.lower()] for v in values if v.lower() in index]
+        return self._union(hits)
+
+    def match_genres(self, genres: List[str]) -> np.ndarray:
+        # Same word-boundary, case-insensitive semantics as the former regex column scan,
+        # evaluated against the (small) genre vocabulary instead of every row. Genres are user text:
+        # escaped, and bounded by non-word characters so "C++" or "Sci-Fi (Hard)" match literally.
+        pattern = re.compile("|".join(rf"(?<!\w){re.escape(g.strip())}(?!\w)" for g in genres if g.strip()), re.IGNORECASE)
+        if not pattern.pattern:
+            return np.zeros(0, dtype=np.int64)
+        index = self.postings.get("genres", {})
+        return self._union([postings for value, postings in index.items() if pattern.search(value)])
+
+    def year_range(self, min_year: Optional[int], max_year: Optional[int]) -> np.ndarray:
+        lo = 0 if min_year is None else int(np.searchsorted(self.sorted_years, min_year, side="left"))
+        hi = len(self.sorted_years) if max_year is None else int(np.searchsorted(self.sorted_years, max_year, side="right"))
+        if hi <= lo:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(self.year_positions[lo:hi])
+
+    def filter(self, request: RecommendationRequest) -> Optional[np.ndarray]:
+        # Sorted row positions matching the request, or None when no filter applies
+        selections: List[np.ndarray] = []
+        if request.genres:
+            selections.append(self.match_genres(request.genres))
+        if request.authors:
+            selections.append(self.lookup("author", request.authors))
+        if request.countries:
+            selections.append(self.lookup("country", request.countries))
+        if request.languages:
+            selections.append(self.lookup("language", request.languages))
+        if request.min_year is not None or request.max_year is not None:
+            selections.append(self.year_range(request.min_year, request.max_year))
+        if not selections:
+            return None
+        selections.sort(key=len)
+        result = selections[0]
+        for other in selections[1:]:
+            if result.size == 0:
+                break
+            result = np.intersect1d(result, other, assume_unique=True)
+        return result
+
+    @staticmethod
+    def _union(arrays: List[np.ndarray]) -> np.ndarray:
+        if not arrays:
+            return np.zeros(0, dtype=np.int64)
+        if len(arrays) == 1:
+            return arrays[0]
+        return np.unique(np.concatenate(arrays))
@@ -1,163 +1,703 @@
 from __future__ import annotations
 
-from typing import List, Optional, Tuple
+from typing import Dict, Iterator, List, Tuple
 import os
-import math
+import threading
+import time
 import numpy as np
 import pandas as pd
 
+from data_pipeline import catalog_ingest
 from data_pipeline.schemas import RecommendationRequest, RecommendedBook
+from graph.book_graph import BookGraph
+from monitoring.trace import NULL_TRACE, Trace
+from recommender.budget import LatencyBudget, StageCosts
+from recommender.catalog import Catalog, positive_max
 from recommender.content_based import ContentBasedRecommender
 from recommender.collaborative import CollaborativeRecommender
+from recommender.filter_index import FilterIndex
+from recommender.reranking import make_reranker
+from recommender.suggest import SuggestIndex
+from storage.artifacts import ArtifactBundle
+
+
+# Book columns left out of artifact bundles (raw and precomputed text)
+SERVING_EXCLUDED = ("description", "corpus")
+
+
+class CandidatePool:
+    # One shard's part of a request in scatter-gather serving (recommender/sharding.py): its re-rank pool
+    # as result rows, with what blending and re-ranking the pools of several shards as one catalog needs.
+    # `signals` are the raw (rows x 4) content, collab, graph and mf scores: graph path sums, factor
+    # scores and popularity priors unscaled (this shard's divisors are the `*_scale` fields), collab
+    # without its popularity fallback (`collab_missing`: no candidate of this shard had a collab
+    # signal; `collab_prior`: collab is only a popularity prior here, no liked item had co-readers).
+    # With `fallback` the budget only afforded popularity and `books` are the most popular candidates.
+    def __init__(
+        self,
+        books: List[RecommendedBook],
+        signals: np.ndarray,
+        popularity: np.ndarray,
+        vectors,
+        coverage: List[np.ndarray],
+        authors: np.ndarray,
+        scales: Dict[str, float] | None = None,
+        collab_missing: bool = False,
+        collab_prior: bool = False,
+        fallback: bool = False,
+    ) -> None:
+        self.books = books
+        self.signals = signals
+        self.popularity = popularity
+        self.vectors = vectors
+        self.coverage = coverage
+        self.authors = authors
+        scales = scales or {}
+        self.content_scale = scales.get("content", 0.0)
+        self.graph_scale = scales.get("graph", 0.0)
+        self.mf_scale = scales.get("mf", 0.0)
+        self.collab_scale = scales.get("collab", 0.0)
+        self.popularity_scale = scales.get("popularity", 0.0)
+        self.collab_missing = collab_missing
+        self.collab_prior = collab_prior
+        self.fallback = fallback
+
+
+class LikedBooks:
+    # A request's liked titles as resolved across a sharded catalog (recommender/sharding.py), in place
+    # of this shard's own resolution: the matching `positions` here, how many books matched on any shard
+    # (`found`), and the graph path sums from every liked book to rows here (`graph_positions`,
+    # ascending) with the catalog-wide divisor
+    def __init__(
+        self,
+        positions: np.ndarray,
+        found: int = 0,
+        graph_positions: np.ndarray | None = None,
+        graph_sums: np.ndarray | None = None,
+        graph_scale: float = 0.0,
+    ) -> None:
+        self.positions = np.asarray(positions, dtype=np.int64)
+        self.found = found
+        self.graph_positions = np.zeros(0, dtype=np.int64) if graph_positions is None else graph_positions
+        self.graph_sums = np.zeros(0, dtype=float) if graph_sums is None else graph_sums
+        self.graph_scale = graph_scale
+
+    def graph_scores(self, candidates: np.ndarray) -> np.ndarray:
+        # Raw path sums at `candidates` (sorted); NaN where no liked book reaches a candidate
+        scores = np.full(len(candidates), np.nan)
+        if len(candidates) and len(self.graph_positions):
+            loc = np.minimum(np.searchsorted(candidates, self.graph_positions), len(candidates) - 1)
+            hit = candidates[loc] == self.graph_positions
+            scores[loc[hit]] = self.graph_sums[hit]
+        return scores
 
 
 class HybridRecommender:
+    BATCH_SCORE_CELLS = 4_000_000
+
     def __init__(self, config: dict | None = None) -> None:
         self.config = config or {}
         self.alpha = float(self.config.get("recommendation", {}).get("hybrid_alpha", 0.6))
         self.diversity_weight = float(self.config.get("recommendation", {}).get("diversity_weight", 0.15))
+        # Added on top of the content/collab blend for books reachable from the liked titles
+        self.graph_weight = float(self.config.get("recommendation", {}).get("graph_weight", 0.2))
+        # Added for candidates scored by the request user's matrix-factorization vector
+        self.mf_weight = float(self.config.get("recommendation", {}).get("mf_weight", 0.3))
+        self.ann_top_k = int(self.config.get("ann", {}).get("top_k", 50))
+        # Per-request deadline for recommend (0 = none; requests may set budget_ms). Candidates beyond
+        # what budget_scoring_share of the remaining time affords are cut to the most popular ones; if
+        # fewer than budget_min_pool are affordable the request is answered from popularity alone.
+        self.latency_budget_ms = float(self.config.get("recommendation", {}).get("latency_budget_ms", 0))
+        self.budget_scoring_share = float(self.config.get("recommendation", {}).get("budget_scoring_share", 0.6))
+        self.budget_min_pool = int(self.config.get("recommendation", {}).get("budget_min_pool", 500))
+        self.stage_costs = StageCosts(self.config)
+        # List-level re-ranking of the best blended candidates (MMR + calibrated coverage)
+        self.reranker = make_reranker(self.config)
         paths = self.config.get("paths", {})
         self.books_csv = paths.get("books_csv", "sample_data/books_sample.csv")
+        self.books_parquet = paths.get("books_parquet")
         self.interactions_csv = paths.get("interactions_csv", "sample_data/user_interactions_sample.csv")
+        self.artifacts_dir = paths.get("artifacts_dir")
+        self.model_version: str | None = None
+        self.reweight_after_rows = int(self.config.get("catalog", {}).get("reweight_after_rows", 10000))
+        # Serializes writers (catalog upserts, idf re-weighting, interaction updates); readers never take it
+        self.update_lock = threading.RLock()
+        self.catalog_revision = 0
+        self.rows_since_reweight = 0
+        self._reweighting = False
 
         self.books: pd.DataFrame | None = None
         self.content_model: ContentBasedRecommender | None = None
         self.collab_model: CollaborativeRecommender | None = None
+        self.graph_model: BookGraph | None = None
+        self.filter_index: FilterIndex | None = None
+        self.catalog: Catalog | None = None
+        self.suggest_index: SuggestIndex | None = None
+
+    def initialize(self, trace: Trace = NULL_TRACE) -> None:
+        # Prefer a prebuilt artifact bundle (a file open) over refitting from CSV
+        bundle = ArtifactBundle.open_current(self.artifacts_dir) if self.artifacts_dir else None
+        if bundle is not None:
+            with trace.stage("load_artifacts"):
+                self._load_artifacts(bundle)
+        else:
+            with trace.stage("load_books"):
+                self._load_books()
+            with trace.stage("fit_content"):
+                self.content_model = ContentBasedRecommender(self.config)
+                self.content_model.fit(self.books)
+            with trace.stage("fit_collab"):
+                self.collab_model = CollaborativeRecommender(self.config)
+                self.collab_model.fit(self.interactions_csv, self.books)
+            with trace.stage("fit_mf"):
+                self.collab_model.fit_factors()
+            with trace.stage("fit_graph"):
+                self.graph_model = BookGraph(self.config)
+                self.graph_model.build(self.books)
+            self.model_version = "live-" + time.strftime("%Y%m%dT%H%M%S")
+        with trace.stage("catalog"):
+            self.catalog = Catalog(self.config)
+            self.catalog.build(self.books)
+        with trace.stage("filter_index"):
+            self.filter_index = FilterIndex()
+            self.filter_index.build(self.books)
+        if bundle is not None and bundle.has("alive"):
+            dead = np.flatnonzero(~bundle.load_array("alive"))
+            self.catalog.retire(dead)
+            self.content_model.remove_rows(dead)
+        with trace.stage("suggest_index"):
+            self.suggest_index = SuggestIndex(self.config)
+            self.suggest_index.build(self.catalog)
+        trace.count("books", self.catalog.size)
 
-    def initialize(self) -> None:
-        self._load_books()
+    def _load_artifacts(self, bundle: ArtifactBundle) -> None:
+        self.books = bundle.load_frame("books")
         self.content_model = ContentBasedRecommender(self.config)
-        self.content_model.fit(self.books)
+        self.content_model.load(bundle, self.books)
         self.collab_model = CollaborativeRecommender(self.config)
-        self.collab_model.fit(self.interactions_csv, self.books)
+        self.collab_model.load(bundle, self.books)
+        self.graph_model = BookGraph(self.config)
+        if not self.graph_model.load(bundle):
+            self.graph_model.build(self.books)
+        self.model_version = bundle.version
+
+    def save_artifacts(self, root: str | None = None) -> str:
+        root = root or self.artifacts_dir or "data/artifacts"
+        bundle = ArtifactBundle.create(root)
+        with self.update_lock:
+            # Serving columns only: the content model's text is already in the TF-IDF matrix and codes
+            bundle.save_frame("books", self.books.drop(columns=[c for c in SERVING_EXCLUDED if c in self.books.columns]))
+            if self.catalog is not None and len(self.catalog.live) < self.catalog.size:
+                bundle.save_array("alive", self.catalog.alive)
+            self.content_model.save(bundle)
+            self.collab_model.save(bundle)
+            self.graph_model.save(bundle)
+            self.model_version = bundle.commit({"books": len(self.books)})
+            self.catalog_revision = 0
+        return self.model_version
 
     def _load_books(self) -> None:
+        if self.books_parquet and os.path.exists(self.books_parquet) and catalog_ingest.pq is not None:
+            # Written by data_pipeline/catalog_ingest.py: already normalized, only the needed columns
+            self.books = catalog_ingest.load_books(self.books_parquet)
+            return
         if not os.path.exists(self.books_csv):
             raise ValueError(f"Books CSV not found: {self.books_csv}")
-        self.books = pd.read_csv(self.books_csv)
+        self.books = self._normalize_books(pd.read_csv(self.books_csv))
+
+    @staticmethod
+    def _normalize_books(books: pd.DataFrame) -> pd.DataFrame:
         # Normalize columns
-        if "genres" in self.books.columns:
-            self.books["genres"] = self.books["genres"].fillna("")
-        if "themes" in self.books.columns:
-            self.books["themes"] = self.books["themes"].fillna("")
+        if "genres" in books.columns:
+            books["genres"] = books["genres"].fillna("")
+        if "themes" in books.columns:
+            books["themes"] = books["themes"].fillna("")
         for col in ["author", "country", "language", "title"]:
-            if col in self.books.columns:
-                self.books[col] = self.books[col].fillna("")
+            if col in books.columns:
+                books[col] = books[col].fillna("")
+        return books
+
+    def upsert_books(self, books: pd.DataFrame) -> Dict[str, int]:
+        # Incremental catalog update: new and changed books are appended as new rows (a changed book's
+        # old row is tombstoned) without refitting the vocabulary; cost follows the delta. Components
+        # grow before the catalog publishes the new size, so queries are served throughout.
+        if self.books is None:
+            raise ValueError("Books not loaded")
+        books = self._normalize_books(books.copy())
+        books["book_id"] = books["book_id"].astype(str)
+        books = books.drop_duplicates("book_id", keep="last").reset_index(drop=True)
+        if "corpus" in self.books.columns:
+            books["corpus"] = catalog_ingest.build_corpus(books)
+        with self.update_lock:
+            replaced = self.catalog.lookup(books["book_id"].tolist())
+            offset = self.catalog.size
+            self.content_model.add_rows(books)
+            self.collab_model.add_catalog_rows(books["book_id"].tolist())
+            self.graph_model.add(books, offset)
+            self.books = pd.concat([self.books, books], ignore_index=True)
+            self.catalog.append(books)
+            self.filter_index.add(books, offset)
+            self.catalog.retire(replaced)
+            self.content_model.remove_rows(replaced)
+            self.suggest_index.update(self.catalog)
+            self._catalog_changed(len(books))
+        return {"added": len(books) - len(replaced), "updated": len(replaced)}
 
-    def _apply_filters(self, df: pd.DataFrame, request: RecommendationRequest) -> pd.DataFrame:
-        filtered = df
+    def delete_books(self, book_ids: List[str]) -> int:
+        if self.books is None:
+            raise ValueError("Books not loaded")
+        with self.update_lock:
+            positions = self.catalog.lookup([str(b) for b in book_ids])
+            self.catalog.retire(positions)
+            self.content_model.remove_rows(positions)
+            if len(positions):
+                self.suggest_index.update(self.catalog)
+                self._catalog_changed(len(positions))
+        return len(positions)
+
+    def live_count(self) -> int:
+        return len(self.catalog.live)
+
+    def _bump_version(self) -> None:
+        # New version so cached recommendations from the previous catalog are not served
+        self.catalog_revision += 1
+        self.model_version = f"{(self.model_version or 'live').split('+')[0]}+{self.catalog_revision}"
+
+    def interactions_changed(self) -> None:
+        # Online interaction updates and their compaction move collaborative and mf scores too; call
+        # under the update lock
+        self._bump_version()
+
+    def _catalog_changed(self, rows: int) -> None:
+        self._bump_version()
+        self.rows_since_reweight += rows
+        if 0 < self.reweight_after_rows <= self.rows_since_reweight and not self._reweighting:
+            self._reweighting = True
+            threading.Thread(target=self.reweight, name="idf-reweight", daemon=True).start()
+
+    def reweight(self) -> None:
+        # Refresh idf over the live catalog (O(nnz), no re-tokenization)
+        try:
+            with self.update_lock:
+                self.content_model.reweight(self.catalog.alive)
+                self.rows_since_reweight = 0
+                self._bump_version()
+        finally:
+            self._reweighting = False
+
+    def _apply_filters(self, request: RecommendationRequest) -> np.ndarray:
+        catalog = self.catalog
+        positions = self.filter_index.filter(request)
+        if positions is None:
+            return catalog.live
+        if len(catalog.live) < catalog.size:
+            positions = positions[catalog.alive[positions]]
+        return positions
+
+    def _blend_scores(
+        self, content_scores: np.ndarray, collab_scores: np.ndarray, graph_scores: np.ndarray, mf_scores: np.ndarray
+    ) -> np.ndarray:
+        blended = self.alpha * np.nan_to_num(content_scores) + (1.0 - self.alpha) * np.nan_to_num(collab_scores)
+        return blended + self.graph_weight * np.nan_to_num(graph_scores) + self.mf_weight * np.nan_to_num(mf_scores)
+
+    def _graph_scores(
+        self, requests: List[RecommendationRequest], candidates: np.ndarray, scaled: bool = True,
+        liked: List[LikedBooks | None] | None = None,
+    ) -> np.ndarray:
+        # Path-count similarity to each request's liked titles anywhere in the live catalog, or to the
+        # paths summed across shards where they were resolved there (`liked`)
+        liked = liked or [None] * len(requests)
+        resolved_elsewhere = np.zeros(0, dtype=np.int64)
+        scores = self.graph_model.score(
+            [self._liked_positions(r) if l is None else resolved_elsewhere for r, l in zip(requests, liked)], candidates, scaled
+        )
+        for i, resolved in enumerate(liked):
+            if resolved is not None:
+                scores[i] = resolved.graph_scores(candidates) / ((resolved.graph_scale or 1.0) if scaled else 1.0)
+        return scores
+
+    def _liked_positions(self, request: RecommendationRequest, liked: LikedBooks | None = None) -> np.ndarray:
+        # Rows of the liked titles anywhere in the live catalog, or as resolved across shards
+        return liked.positions if liked is not None else self.catalog.title_positions(request.liked_books)
+
+    def _explanations(self, request: RecommendationRequest, positions: np.ndarray, signals: np.ndarray) -> List[str]:
+        # Reasons come from intersecting each result's precomputed code sets with the request's codes
+        catalog = self.catalog
+        matches = []
         if request.genres:
-            filtered = filtered[filtered["genres"].str.contains("|".join(map(lambda g: rf"\b{g}\b", request.genres)), case=False, regex=True)]
+            matches.append((catalog.genre_sets.any_of(positions, catalog.genre_sets.matching(request.genres)), "matches your preferred genre"))
+        if request.themes:
+            matches.append((catalog.theme_sets.any_of(positions, catalog.theme_sets.lookup(request.themes)), "aligns with your themes"))
         if request.authors:
-            filtered = filtered[filtered["author"].str.lower().isin([a.lower() for a in request.authors])]
+            matches.append((catalog.author_sets.any_of(positions, catalog.author_sets.lookup(request.authors)), "by your preferred author"))
         if request.countries:
-            filtered = filtered[filtered["country"].str.lower().isin([c.lower() for c in request.countries])]
+            codes = catalog.value_codes(catalog.country_values, request.countries)
+            matches.append((np.isin(catalog.country_codes[positions], codes), "from your selected country"))
         if request.languages:
-            filtered = filtered[filtered["language"].str.lower().isin([l.lower() for l in request.languages])]
-        if request.min_year is not None:
-            filtered = filtered[filtered["year"] >= request.min_year]
-        if request.max_year is not None:
-            filtered = filtered[filtered["year"] <= request.max_year]
-        return filtered
-
-    def _blend_scores(self, content_scores: dict[str, float], collab_scores: dict[str, float]) -> dict[str, float]:
-        all_ids = set(content_scores) | set(collab_scores)
-        blended: dict[str, float] = {}
-        for book_id in all_ids:
-            cs = content_scores.get(book_id, 0.0)
-            ms = collab_scores.get(book_id, 0.0)
-            blended[book_id] = self.alpha * cs + (1.0 - self.alpha) * ms
-        return blended
-
-    def _apply_diversity_boost(self, df: pd.DataFrame, scores: dict[str, float]) -> dict[str, float]:
-        if df.empty or not scores:
-            return scores
-        # Simple diversity term: penalize over-represented countries/languages among top candidates
-        diversity_weight = self.diversity_weight
-        counts_country = df["country"].str.lower().value_counts(dropna=False).to_dict()
-        counts_language = df["language"].str.lower().value_counts(dropna=False).to_dict()
-        max_cc = max(counts_country.values()) if counts_country else 1
-        max_cl = max(counts_language.values()) if counts_language else 1
-        adjusted = {}
-        for book_id, base in scores.items():
-            row = df[df["book_id"].astype(str) == str(book_id)]
-            if row.empty:
-                adjusted[book_id] = base
-                continue
-            country = str(row.iloc[0]["country"]).lower()
-            language = str(row.iloc[0]["language"]).lower()
-            rarity = 0.0
-            if country:
-                rarity += 1.0 - (counts_country.get(country, 0) / max_cc)
-            if language:
-                rarity += 1.0 - (counts_language.get(language, 0) / max_cl)
-            adjusted[book_id] = base * (1.0 + diversity_weight * (rarity / 2.0))
-        return adjusted
-
-    def _build_explanation(self, row: pd.Series, request: RecommendationRequest, source_notes: List[str]) -> str:
-        reasons: List[str] = []
-        if request.genres and any(g.lower() in str(row.get("genres", "")).lower() for g in request.genres):
-            reasons.append("matches your preferred genre")
-        if request.themes and any(t.lower() in str(row.get("themes", "")).lower() for t in request.themes):
-            reasons.append("aligns with your themes")
-        if request.authors and str(row.get("author", "")).lower() in [a.lower() for a in request.authors]:
-            reasons.append("by your preferred author")
-        if request.countries and str(row.get("country", "")).lower() in [c.lower() for c in request.countries]:
-            reasons.append("from your selected country")
-        if request.languages and str(row.get("language", "")).lower() in [l.lower() for l in request.languages]:
-            reasons.append("in your preferred language")
+            codes = catalog.value_codes(catalog.language_values, request.languages)
+            matches.append((np.isin(catalog.language_codes[positions], codes), "in your preferred language"))
         if request.min_year or request.max_year:
-            reasons.append("within your publication year range")
-        explanation = "; ".join(reasons[:2]) if reasons else "personalized based on your preferences"
-        if source_notes:
-            explanation += f"; signal: {', '.join(source_notes)}"
-        return explanation
+            matches.append((np.ones(len(positions), dtype=bool), "within your publication year range"))
+        explanations = []
+        for i in range(len(positions)):
+            reasons = [reason for found, reason in matches if found[i]]
+            explanation = "; ".join(reasons[:2]) if reasons else "personalized based on your preferences"
+            source_notes = [name for name, present in zip(("content", "collab", "graph", "mf"), signals[i]) if present]
+            if source_notes:
+                explanation += f"; signal: {', '.join(source_notes)}"
+            explanations.append(explanation)
+        return explanations
+
+    def _top_k(self, scores: np.ndarray, k: int) -> np.ndarray:
+        # Partial sort: indices of the k best scores, best first
+        if k >= len(scores):
+            return np.argsort(-scores, kind="stable")
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top], kind="stable")]
 
-    def recommend(self, request: RecommendationRequest) -> List[RecommendedBook]:
+    def _candidates(self, request: RecommendationRequest) -> np.ndarray:
+        candidates = self._apply_filters(request)
+        if len(candidates) == 0:
+            # Fallback to popularity among all books
+            candidates = self.catalog.live
+        return candidates
+
+    def _filter_key(self, request: RecommendationRequest) -> tuple:
+        # Requests with equal keys select the same candidate set (filters are case-insensitive)
+        lists = (request.genres, request.authors, request.countries, request.languages)
+        return tuple(tuple(sorted({v.lower() for v in values})) for values in lists) + (request.min_year, request.max_year)
+
+    def _content_top_k(self, request: RecommendationRequest) -> int:
+        return max(self.ann_top_k, max(1, request.limit) + len(request.liked_books))
+
+    def recommend(self, request: RecommendationRequest, trace: Trace = NULL_TRACE) -> List[RecommendedBook]:
+        budget, candidates, scores = self._score(request, trace)
+        if scores is None:
+            return self._rank_by_popularity(request, candidates, budget, trace)
+        return self._rank(request, candidates, *scores, trace, budget)
+
+    def _score(
+        self, request: RecommendationRequest, trace: Trace = NULL_TRACE, raw: bool = False, liked: LikedBooks | None = None,
+    ) -> Tuple[LatencyBudget, np.ndarray, Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray] | None]:
+        # Filtered candidates and their content, collab, graph and mf scores within the request's
+        # latency budget; None for the scores when only the popularity fallback fits. `raw` leaves graph
+        # and mf unscaled and collab without its popularity fallback (see candidate_pool).
         if self.books is None:
             raise ValueError("Books not loaded")
 
-        candidate_df = self._apply_filters(self.books.copy(), request)
-        if candidate_df.empty:
-            # Fallback to popularity among all books
-            candidate_df = self.books.copy()
-
-        content_scores = self.content_model.score_candidates(request, candidate_df)
-        collab_scores = self.collab_model.score_candidates(request, candidate_df)
-
-        blended = self._blend_scores(content_scores, collab_scores)
-        blended = self._apply_diversity_boost(candidate_df, blended)
-
-        # Rank and build response
-        ranked = sorted(blended.items(), key=lambda kv: kv[1], reverse=True)
-        results: List[RecommendedBook] = []
-        used_ids: set[str] = set([str(t).lower() for t in request.liked_books])
-        for book_id, score in ranked:
-            if len(results) >= max(1, request.limit):
-                break
-            row = candidate_df[candidate_df["book_id"].astype(str) == str(book_id)]
-            if row.empty:
-                continue
-            title_lower = str(row.iloc[0]["title"]).lower()
-            if title_lower in used_ids:
-                continue
-            source_notes = []
-            if book_id in content_scores:
-                source_notes.append("content")
-            if book_id in collab_scores:
-                source_notes.append("collab")
-            explanation = self._build_explanation(row.iloc[0], request, source_notes)
-            results.append(
-                RecommendedBook(
-                    book_id=str(row.iloc[0]["book_id"]),
-                    title=str(row.iloc[0]["title"]),
-                    author=str(row.iloc[0]["author"]),
-                    country=str(row.iloc[0].get("country", "")) or None,
-                    language=str(row.iloc[0].get("language", "")) or None,
-                    genres=[g.strip() for g in str(row.iloc[0].get("genres", "")).split("|") if g.strip()],
-                    year=int(row.iloc[0]["year"]) if not pd.isna(row.iloc[0]["year"]) else None,
-                    score=float(score),
-                    explanation=explanation,
+        budget = LatencyBudget(self._budget_seconds(request))
+        with trace.stage("filter"):
+            candidates = self._candidates(request)
+        trace.count("candidates", len(candidates))
+        if budget.limited:
+            share = self.budget_scoring_share * budget.remaining()
+            affordable = self.stage_costs.affordable_candidates(share, len(candidates))
+            if affordable < len(candidates):
+                self.stage_costs.decay(len(candidates))
+                if affordable < max(self.budget_min_pool, request.limit):
+                    trace.degrade("popularity_fallback")
+                    return budget, candidates, None
+                trace.degrade("candidates_shrunk")
+                candidates = np.sort(self._most_popular(candidates, affordable))
+                trace.count("budget_candidates", len(candidates))
+        started = time.perf_counter()
+        with trace.stage("content"):
+            content_scores = self.content_model.score_candidates(request, candidates, self._content_top_k(request), scaled=not raw)
+        with trace.stage("collab"):
+            collab_scores = self.collab_model.score_candidates(
+                request, candidates, self.catalog, fallback=not raw, liked=self._liked_positions(request, liked)
+            )
+        # Graph and mf only add to content/collab: the first stages dropped when time runs out
+        complete = not budget.exceeded()
+        if complete:
+            with trace.stage("graph"):
+                graph_scores = self._graph_scores([request], candidates, scaled=not raw, liked=[liked])[0]
+        else:
+            trace.degrade("graph_skipped")
+            graph_scores = np.full(len(candidates), np.nan)
+        complete = complete and not budget.exceeded()
+        if complete:
+            with trace.stage("mf"):
+                mf_scores = self.collab_model.score_users([request.user_id], candidates, self.catalog, scaled=not raw)[0]
+        else:
+            trace.degrade("mf_skipped")
+            mf_scores = np.full(len(candidates), np.nan)
+        if complete:
+            self.stage_costs.observe_scoring(len(candidates), time.perf_counter() - started)
+        return budget, candidates, (content_scores, collab_scores, graph_scores, mf_scores)
+
+    def candidate_pool(
+        self, request: RecommendationRequest, trace: Trace = NULL_TRACE, liked: LikedBooks | None = None
+    ) -> CandidatePool:
+        # What `recommend` would hand the re-ranker, for a shard of a sharded catalog. The pool is picked
+        # by this shard's own blend; the gathering side re-blends the raw signals across shards. `liked`
+        # replaces this shard's resolution of the liked titles with the catalog-wide one.
+        budget, candidates, scores = self._score(request, trace, raw=True, liked=liked)
+        if scores is None:
+            books = self._rank_by_popularity(request, candidates, budget, trace, liked)
+            positions = self.catalog.lookup([b.book_id for b in books])
+            return self._pool(books, positions, np.full((len(books), 4), np.nan), fallback=True)
+        content_scores, collab_scores, graph_scores, mf_scores = scores
+        popularity = self.catalog.popularity[candidates]
+        collab_missing = bool(np.isnan(collab_scores).all())
+        liked_positions = self._liked_positions(request, liked)
+        # Collab is a popularity prior only if no liked book matched, on this shard or (resolved across
+        # shards) any other
+        if liked is None:
+            collab_prior = not len(self.collab_model._liked_items(request, self.catalog, liked_positions))
+        else:
+            collab_prior = not liked.found
+        graph_scale = liked.graph_scale if liked is not None else float(self.graph_model.scales([liked_positions])[0])
+        scales = {
+            "content": positive_max(content_scores) if not self.content_model.has_query(request) else 0.0,
+            "graph": graph_scale,
+            "mf": positive_max(mf_scores),
+            "collab": positive_max(collab_scores) if collab_prior and not collab_missing else 0.0,
+            "popularity": positive_max(popularity),
+        }
+        # This shard's blend, as `recommend` would score it alone
+        local = (
+            content_scores / (scales["content"] or 1.0),
+            popularity / (scales["popularity"] or 1.0) if collab_missing else collab_scores / (scales["collab"] or 1.0),
+            graph_scores / (scales["graph"] or 1.0),
+            mf_scores / (scales["mf"] or 1.0),
+        )
+        raw = np.column_stack(scores)[~np.isnan(np.column_stack(local)).all(axis=1)]
+        positions, blended, signals = self._blend_candidates(candidates, *local, trace)
+        with trace.stage("rerank"):
+            pool_size = max(request.limit, self.reranker.pool_size) if self.reranker.uses_features else request.limit
+            selected = self._select(request.model_copy(update={"limit": pool_size}), positions, blended, rerank=False, liked=liked)
+        with trace.stage("results"):
+            books = self._build_results(request, positions, blended, signals, selected, self._explain(request, budget, trace))
+            return self._pool(books, positions[selected], raw[selected], scales, collab_missing, collab_prior)
+
+    def _pool(
+        self,
+        books: List[RecommendedBook],
+        positions: np.ndarray,
+        signals: np.ndarray,
+        scales: Dict[str, float] | None = None,
+        collab_missing: bool = False,
+        collab_prior: bool = False,
+        fallback: bool = False,
+    ) -> CandidatePool:
+        vectors, coverage, authors = self._rerank_features(positions)
+        # Coverage values rather than this shard's codes, which other shards do not share
+        catalog = self.catalog
+        coverage[0] = np.asarray(catalog.country_values, dtype=object)[coverage[0]]
+        coverage[1] = np.asarray(catalog.language_values, dtype=object)[coverage[1]]
+        return CandidatePool(
+            books, signals, catalog.popularity[positions], vectors, coverage, authors,
+            scales, collab_missing, collab_prior, fallback,
+        )
+
+    def _budget_seconds(self, request: RecommendationRequest) -> float:
+        budget_ms = self.latency_budget_ms if request.budget_ms is None else request.budget_ms
+        return budget_ms / 1000.0
+
+    def _most_popular(self, candidates: np.ndarray, n: int, excluded: np.ndarray | None = None) -> np.ndarray:
+        # Up to n of `candidates` (minus `excluded`) by descending popularity, walking the catalog's
+        # precomputed order in growing blocks, so popular candidates are found without a full sort
+        order = self.catalog.popularity_order()
+        wanted = np.zeros(len(order), dtype=bool)
+        wanted[candidates[candidates < len(order)]] = True
+        if excluded is not None:
+            wanted[excluded[excluded < len(order)]] = False
+        found, total, start, step = [], 0, 0, max(4 * n, 1024)
+        while start < len(order) and total < n:
+            block = order[start:start + step]
+            found.append(block[wanted[block]])
+            total += len(found[-1])
+            start, step = start + step, 2 * step
+        return np.concatenate(found)[:n] if found else np.zeros(0, dtype=np.int64)
+
+    def _rank_by_popularity(
+        self, request: RecommendationRequest, candidates: np.ndarray, budget: LatencyBudget, trace: Trace = NULL_TRACE,
+        liked: LikedBooks | None = None,
+    ) -> List[RecommendedBook]:
+        # Budget fallback: the precomputed popularity order over the filtered candidates, no scoring
+        with trace.stage("rerank"):
+            positions = self._most_popular(candidates, max(1, request.limit), self._excluded_positions(request, liked))
+            popularity = self.catalog.popularity[positions]
+            scores = popularity / popularity[0] if len(positions) and popularity[0] > 0 else np.zeros(len(positions))
+        with trace.stage("results"):
+            signals = np.zeros((len(positions), 4), dtype=bool)
+            selected = np.arange(len(positions))
+            return self._build_results(request, positions, scores, signals, selected, self._explain(request, budget, trace))
+
+    def _explain(self, request: RecommendationRequest, budget: LatencyBudget, trace: Trace) -> bool:
+        if not request.wants_explanation():
+            return False
+        if budget.exceeded():
+            trace.degrade("explanations_skipped")
+            return False
+        return True
+
+    def recommend_traced(self, request: RecommendationRequest) -> Tuple[List[RecommendedBook], Trace]:
+        # Single-argument entry point for the scoring executor; the trace is plain data
+        trace = Trace()
+        with trace.stage("total"):
+            results = self.recommend(request, trace)
+        return results, trace
+
+    def recommend_batch(self, requests: List[RecommendationRequest]) -> List[List[RecommendedBook]]:
+        results: List[List[RecommendedBook]] = [[] for _ in requests]
+        for i, candidates, content_scores, collab_scores, graph_scores, mf_scores in self.score_batch(requests):
+            results[i] = self._rank(requests[i], candidates, content_scores, collab_scores, graph_scores, mf_scores)
+        return results
+
+    def score_batch(
+        self, requests: List[RecommendationRequest]
+    ) -> Iterator[Tuple[int, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        # Yields (request index, candidates, content, collab, graph and mf scores) per request, before blending
+        if self.books is None:
+            raise ValueError("Books not loaded")
+
+        # Requests that share a filter set share one candidate set
+        groups: dict[tuple, List[int]] = {}
+        for i, request in enumerate(requests):
+            groups.setdefault(self._filter_key(request), []).append(i)
+        query_vecs, has_query = self.content_model.transform_queries(requests)
+        top_k = [self._content_top_k(r) for r in requests]
+        for members in groups.values():
+            candidates = self._candidates(requests[members[0]])
+            # Bound the dense (requests x candidates) score blocks
+            chunk = max(1, self.BATCH_SCORE_CELLS // max(len(candidates), 1))
+            for start in range(0, len(members), chunk):
+                rows = members[start:start + chunk]
+                chunk_requests = [requests[i] for i in rows]
+                content_scores = self.content_model.score_group(
+                    query_vecs[rows], has_query[rows], candidates, [top_k[i] for i in rows]
                 )
+                collab_scores = self.collab_model.score_group(chunk_requests, candidates, self.catalog)
+                graph_scores = self._graph_scores(chunk_requests, candidates)
+                mf_scores = self.collab_model.score_users([r.user_id for r in chunk_requests], candidates, self.catalog)
+                for j, i in enumerate(rows):
+                    yield i, candidates, content_scores[j], collab_scores[j], graph_scores[j], mf_scores[j]
+
+    def _blend_candidates(
+        self,
+        candidates: np.ndarray,
+        content_scores: np.ndarray,
+        collab_scores: np.ndarray,
+        graph_scores: np.ndarray,
+        mf_scores: np.ndarray,
+        trace: Trace = NULL_TRACE,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # (scored positions, final scores, signals present) over candidates with any signal; `signals`
+        # is (scored x 4) booleans for content, collab, graph and mf
+        with trace.stage("blend"):
+            signals = ~np.isnan(np.column_stack([content_scores, collab_scores, graph_scores, mf_scores]))
+            scored = signals.any(axis=1)
+            positions = candidates[scored]
+            blended = self._blend_scores(
+                content_scores[scored], collab_scores[scored], graph_scores[scored], mf_scores[scored]
+            )
+        trace.count("scored", len(positions))
+        return positions, blended, signals[scored]
+
+    def _rank(
+        self,
+        request: RecommendationRequest,
+        candidates: np.ndarray,
+        content_scores: np.ndarray,
+        collab_scores: np.ndarray,
+        graph_scores: np.ndarray,
+        mf_scores: np.ndarray,
+        trace: Trace = NULL_TRACE,
+        budget: LatencyBudget | None = None,
+    ) -> List[RecommendedBook]:
+        budget = budget or LatencyBudget(None)
+        positions, blended, signals = self._blend_candidates(
+            candidates, content_scores, collab_scores, graph_scores, mf_scores, trace
+        )
+        with trace.stage("rerank"):
+            rerank = self.reranker.uses_features
+            if rerank and budget.limited and budget.remaining() < self.stage_costs.rerank:
+                trace.degrade("rerank_skipped")
+                rerank = False
+            started = time.perf_counter()
+            selected = self._select(request, positions, blended, rerank)
+            if rerank:
+                self.stage_costs.observe_rerank(time.perf_counter() - started)
+        with trace.stage("results"):
+            return self._build_results(request, positions, blended, signals, selected, self._explain(request, budget, trace))
+
+    def rank_positions(
+        self,
+        request: RecommendationRequest,
+        candidates: np.ndarray,
+        content_scores: np.ndarray,
+        collab_scores: np.ndarray,
+        graph_scores: np.ndarray,
+        mf_scores: np.ndarray,
+    ) -> np.ndarray:
+        # Catalog positions `recommend` would return, without building response objects
+        positions, blended, _ = self._blend_candidates(candidates, content_scores, collab_scores, graph_scores, mf_scores)
+        return positions[self._select(request, positions, blended)]
+
+    def _excluded_positions(self, request: RecommendationRequest, liked: LikedBooks | None = None) -> np.ndarray:
+        # Never recommended back: the liked titles and the user's history
+        excluded = self._liked_positions(request, liked)
+        if request.user_id is not None:
+            excluded = np.concatenate([excluded, self.collab_model.history_positions(request.user_id, self.catalog)])
+        return excluded
+
+    def _select(
+        self, request: RecommendationRequest, positions: np.ndarray, scores: np.ndarray, rerank: bool = True,
+        liked: LikedBooks | None = None,
+    ) -> np.ndarray:
+        # Indices of the `limit` rows to return, in order, skipping liked titles and the user's history.
+        # Only the best `rerank_pool` blended scores reach the re-ranker.
+        limit = max(1, request.limit)
+        excluded = np.isin(positions, self._excluded_positions(request, liked))
+        rerank = rerank and self.reranker.uses_features
+        pool_size = max(limit, self.reranker.pool_size) if rerank else limit
+        pool = self._top_k(scores, min(len(scores), pool_size + int(excluded.sum())))
+        pool = pool[~excluded[pool]]
+        if not rerank or len(pool) <= 1:
+            return pool[:limit]
+        return pool[self._rerank(positions[pool], scores[pool], limit)]
+
+    def _rerank(self, positions: np.ndarray, scores: np.ndarray, limit: int) -> np.ndarray:
+        vectors, coverage, authors = self._rerank_features(positions)
+        return self.reranker.rerank(scores, vectors, coverage, authors, limit, self.diversity_weight)
+
+    def _rerank_features(self, positions: np.ndarray) -> Tuple[object, List[np.ndarray], np.ndarray]:
+        # Unit vectors, coverage codes (country, language, primary genre) and authors of `positions`
+        catalog = self.catalog
+        primary_genres = np.array([catalog.genres[p][0].lower() if catalog.genres[p] else "" for p in positions.tolist()], dtype=object)
+        authors = np.array([catalog.author_lower[p] for p in positions.tolist()], dtype=object)
+        coverage = [catalog.country_codes[positions], catalog.language_codes[positions], primary_genres]
+        return self.content_model.unit_rows(positions), coverage, authors
+
+    def _build_results(
+        self,
+        request: RecommendationRequest,
+        positions: np.ndarray,
+        scores: np.ndarray,
+        signals: np.ndarray,
+        selected: np.ndarray,
+        explain: bool = True,
+    ) -> List[RecommendedBook]:
+        catalog = self.catalog
+        selected_positions = positions[selected]
+        explanations = (
+            self._explanations(request, selected_positions, signals[selected])
+            if explain and request.wants_explanation() else [""] * len(selected)
+        )
+        # Built from trusted catalog columns, so pydantic validation is skipped
+        return [
+            RecommendedBook.model_construct(
+                book_id=catalog.book_ids[pos],
+                title=catalog.titles[pos],
+                author=catalog.authors[pos],
+                country=catalog.countries[pos],
+                language=catalog.languages[pos],
+                genres=list(catalog.genres[pos]),
+                year=catalog.years[pos],
+                score=float(score),
+                explanation=explanation,
             )
-        return results
\ No newline at end of file
+            for pos, score, explanation in zip(selected_positions.tolist(), scores[selected].tolist(), explanations)
+        ]
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import numpy as np
+from scipy import sparse
+
+from storage.artifacts import ArtifactBundle
+
+
+class ImplicitALS:
+    # Implicit-feedback matrix factorization (Hu, Koren & Volinsky): every (user, item) pair is a
+    # preference p = [r > 0] with confidence c = 1 + alpha * r, r the summed event_strength. Each
+    # half-step solves all user (or item) vectors in closed form against the other side's factors.
+    BLOCK_CELLS = 8_000_000  # nnz x factors^2 floats materialised per solver block
+
+    def __init__(self, config: dict | None = None) -> None:
+        self.config = config or {}
+        cfg = self.config.get("mf", {})
+        self.factors = int(cfg.get("factors", 32))
+        self.iterations = int(cfg.get("iterations", 10))
+        self.regularization = float(cfg.get("regularization", 0.05))
+        self.alpha = float(cfg.get("alpha", 10.0))
+        self.seed = int(cfg.get("seed", 42))
+        self.threads = int(cfg.get("threads", 0)) or (os.cpu_count() or 1)
+        self.user_factors = np.zeros((0, self.factors), dtype=np.float32)
+        self.item_factors = np.zeros((0, self.factors), dtype=np.float32)
+
+    def fit(self, user_item: sparse.csr_matrix) -> None:
+        user_item = user_item.tocsr().astype(np.float32)
+        item_user = user_item.T.tocsr()
+        rng = np.random.default_rng(self.seed)
+        scale = 0.1 / np.sqrt(self.factors)
+        self.user_factors = (rng.standard_normal((user_item.shape[0], self.factors)) * scale).astype(np.float32)
+        self.item_factors = (rng.standard_normal((user_item.shape[1], self.factors)) * scale).astype(np.float32)
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            for _ in range(self.iterations):
+                self.user_factors = self._solve(user_item, self.item_factors, pool)
+                self.item_factors = self._solve(item_user, self.user_factors, pool)
+
+    def fold_in(self, user_item: sparse.csr_matrix, users: np.ndarray) -> None:
+        # Re-solve `users` (rows of `user_item`) against the fixed item factors; the cost follows the
+        # touched users, so online events update their vectors without a refit
+        users = np.asarray(users, dtype=np.int64)
+        n_users = user_item.shape[0]
+        if not len(users) or not len(self.item_factors):
+            return
+        user_factors = np.zeros((n_users, self.factors), dtype=np.float32)
+        user_factors[: len(self.user_factors)] = self.user_factors[:n_users]
+        rows = user_item[users][:, : len(self.item_factors)].tocsr().astype(np.float32)
+        user_factors[users] = self._solve(rows, self.item_factors)
+        self.user_factors = user_factors
+
+    def _solve(self, rows: sparse.csr_matrix, other: np.ndarray, pool: ThreadPoolExecutor | None = None) -> np.ndarray:
+        # Per row u: (Y^T Y + Y_u^T (C_u - I) Y_u + reg I) x_u = Y_u^T C_u p_u, in blocks of rows
+        gram = other.T.astype(np.float64) @ other + self.regularization * np.eye(self.factors)
+        lengths = np.diff(rows.indptr)
+        per_block = max(1, self.BLOCK_CELLS // (self.factors * self.factors))
+        # Contiguous row ranges holding at most `per_block` nonzeros each (one row may exceed it)
+        bounds = [0]
+        cumulative = rows.indptr[1:]
+        while bounds[-1] < rows.shape[0]:
+            start = bounds[-1]
+            stop = int(np.searchsorted(cumulative, rows.indptr[start] + per_block, side="right"))
+            bounds.append(min(rows.shape[0], max(start + 1, stop)))
+        blocks = list(zip(bounds[:-1], bounds[1:]))
+        out = np.zeros((rows.shape[0], self.factors), dtype=np.float32)
+
+        def run(block) -> None:
+            start, stop = block
+            lo, hi = rows.indptr[start], rows.indptr[stop]
+            if hi == lo:
+                return
+            vectors = other[rows.indices[lo:hi]]
+            confidence = 1.0 + self.alpha * rows.data[lo:hi]
+            # Per-row sums over the row's nonzeros as one sparse (rows x nonzeros) product
+            segments = sparse.csr_matrix(
+                (confidence - 1.0, np.arange(hi - lo), rows.indptr[start:stop + 1] - lo),
+                shape=(stop - start, hi - lo),
+            )
+            outer = (vectors[:, :, None] * vectors[:, None, :]).reshape(hi - lo, -1)
+            lhs = gram + (segments @ outer).reshape(-1, self.factors, self.factors)
+            segments.data = confidence
+            rhs = segments @ vectors
+            filled = np.flatnonzero(lengths[start:stop])
+            out[start + filled] = np.linalg.solve(lhs[filled], rhs[filled, :, None].astype(np.float64))[..., 0]
+
+        if pool is None or len(blocks) == 1:
+            for block in blocks:
+                run(block)
+        else:
+            # The sparse products and the batched np.linalg.solve run without the GIL, so blocks overlap
+            list(pool.map(run, blocks))
+        return out
+
+    def scores(self, users: np.ndarray, items: np.ndarray) -> np.ndarray:
+        # (users x items) predicted preference; NaN for users or items without a fitted vector
+        users, items = np.asarray(users, dtype=np.int64), np.asarray(items, dtype=np.int64)
+        out = np.full((len(users), len(items)), np.nan)
+        known_users = (users >= 0) & (users < len(self.user_factors))
+        known_items = (items >= 0) & (items < len(self.item_factors))
+        if not known_users.any() or not known_items.any():
+            return out
+        # One product against the whole item table (contiguous), then gather the candidates
+        full = self.item_factors @ self.user_factors[users[known_users]].T
+        out[np.ix_(known_users, known_items)] = full[items[known_items]].T
+        return out
+
+    def save(self, bundle: ArtifactBundle) -> None:
+        bundle.save_array("mf.user_factors", self.user_factors)
+        bundle.save_array("mf.item_factors", self.item_factors)
+        bundle.save_json("mf.json", {"factors": self.factors, "alpha": self.alpha, "regularization": self.regularization})
+
+    def load(self, bundle: ArtifactBundle) -> bool:
+        # False when the bundle has no factors or they were trained with other settings
+        if not bundle.has("mf.json"):
+            return False
+        meta = bundle.load_json("mf.json")
+        if meta != {"factors": self.factors, "alpha": self.alpha, "regularization": self.regularization}:
+            return False
+        # Memory-mapped; fold_in copies into a new array
+        self.user_factors = bundle.load_array("mf.user_factors")
+        self.item_factors = bundle.load_array("mf.item_factors")
+        return True
+
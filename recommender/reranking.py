@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from typing import List, Tuple
+import numpy as np
+from scipy import sparse
+
+
+def _similarity_to(vectors: sparse.csr_matrix | np.ndarray, row: int) -> np.ndarray:
+    if sparse.issparse(vectors):
+        # Sparse matrix x dense vector avoids building a sparse product per step
+        start, stop = vectors.indptr[row], vectors.indptr[row + 1]
+        query = np.zeros(vectors.shape[1], dtype=vectors.dtype)
+        query[vectors.indices[start:stop]] = vectors.data[start:stop]
+        return vectors @ query
+    return vectors @ vectors[row]
+
+
+class ScoreReranker:
+    # No re-ranking: the best `limit` blended scores
+    name = "none"
+    uses_features = False
+
+    def __init__(self, config: dict | None = None) -> None:
+        cfg = (config or {}).get("recommendation", {})
+        self.pool_size = int(cfg.get("rerank_pool", 300))
+
+    def rerank(
+        self,
+        relevance: np.ndarray,
+        vectors: sparse.csr_matrix | np.ndarray | None,
+        coverage: List[np.ndarray],
+        authors: np.ndarray,
+        limit: int,
+        diversity_weight: float,
+    ) -> np.ndarray:
+        return np.argsort(-relevance, kind="stable")[:limit]
+
+
+class MMRReranker(ScoreReranker):
+    # Greedy list construction over the top `pool_size` candidates. Each step picks the candidate maximising
+    #   (1 - d) * relevance - d * max cosine similarity to the picked items
+    #   - coverage_weight * picks beyond a value's quota (country, language, genre)
+    #   - author_penalty * picks already by the same author
+    # where d is diversity_weight and quotas follow the pool's relevance-weighted value distribution,
+    # smoothed towards uniform. `vectors` are the pool's L2-normalised rows; only the similarities to
+    # picked items are computed, so a list costs O(limit x pool) rather than a pool x pool Gram matrix.
+    name = "mmr"
+    uses_features = True
+
+    def __init__(self, config: dict | None = None) -> None:
+        super().__init__(config)
+        cfg = (config or {}).get("recommendation", {})
+        self.coverage_weight = float(cfg.get("coverage_weight", 0.3))
+        self.author_penalty = float(cfg.get("author_penalty", 0.5))
+        self.calibration_uniform = float(cfg.get("calibration_uniform", 0.5))
+
+    def _quotas(self, codes: np.ndarray, relevance: np.ndarray, limit: int) -> np.ndarray:
+        n_values = int(codes.max()) + 1 if len(codes) else 0
+        pool = np.bincount(codes, weights=relevance + 1e-9, minlength=n_values)
+        target = (1.0 - self.calibration_uniform) * pool / pool.sum() + self.calibration_uniform / max(n_values, 1)
+        return np.ceil(target * limit - 1e-9)
+
+    def rerank(
+        self,
+        relevance: np.ndarray,
+        vectors: sparse.csr_matrix | np.ndarray | None,
+        coverage: List[np.ndarray],
+        authors: np.ndarray,
+        limit: int,
+        diversity_weight: float,
+    ) -> np.ndarray:
+        n = len(relevance)
+        limit = min(limit, n)
+        if limit <= 0:
+            return np.zeros(0, dtype=np.int64)
+        # Relevance on the same [0, 1] scale as cosine similarity
+        span = relevance.max() - relevance.min()
+        rel = (relevance - relevance.min()) / span if span > 0 else np.ones(n)
+        quotas: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        for codes in coverage:
+            codes = np.unique(codes, return_inverse=True)[1]  # values present in the pool only
+            quota = self._quotas(codes, rel, limit)
+            quotas.append((codes, quota, np.zeros(len(quota))))
+        authors = np.unique(authors, return_inverse=True)[1]
+        author_counts = np.zeros(int(authors.max()) + 1)
+        max_sim = np.zeros(n)
+        objective_base = (1.0 - diversity_weight) * rel
+        picked = np.zeros(n, dtype=bool)
+        order = np.empty(limit, dtype=np.int64)
+        for step in range(limit):
+            objective = objective_base - diversity_weight * max_sim
+            for codes, quota, counts in quotas:
+                objective -= self.coverage_weight * np.maximum(counts[codes] + 1.0 - quota[codes], 0.0)
+            objective -= self.author_penalty * author_counts[authors]
+            objective[picked] = -np.inf
+            best = int(np.argmax(objective))
+            order[step] = best
+            picked[best] = True
+            if vectors is not None:
+                np.maximum(max_sim, _similarity_to(vectors, best), out=max_sim)
+            for codes, _, counts in quotas:
+                counts[codes[best]] += 1
+            author_counts[authors[best]] += 1
+        return order
+
+
+RERANKERS = {"none": ScoreReranker, "mmr": MMRReranker}
+
+
+def make_reranker(config: dict | None = None) -> ScoreReranker:
+    # recommendation.reranker: "mmr" (default) or "none"
+    name = str((config or {}).get("recommendation", {}).get("reranker", "mmr"))
+    if name not in RERANKERS:
+        raise ValueError(f"Unknown recommendation.reranker: {name}")
+    return RERANKERS[name](config)
@@ -0,0 +1,423 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from typing import Dict, List, Optional, Tuple
+import copy
+import os
+import pickle
+import threading
+import time
+import zlib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from data_pipeline.catalog_ingest import build_corpus
+from data_pipeline.schemas import RecommendationRequest, RecommendedBook
+from graph.book_graph import BookGraph
+from monitoring.trace import NULL_TRACE, Trace
+from recommender.content_based import ContentBasedRecommender
+from recommender.hybrid import CandidatePool, HybridRecommender, LikedBooks
+
+
+SHARD_KEYS = ("language", "country", "hash")
+
+# Per-process shard recommender (one worker process per shard)
+_SHARD: Optional[HybridRecommender] = None
+
+
+def _init_shard(config: dict) -> None:
+    global _SHARD
+    _SHARD = HybridRecommender(config)
+    _SHARD.initialize()
+
+
+def _shard_ready() -> int:
+    return len(_SHARD.catalog.live)
+
+
+def _call_shard(method: str, arg) -> object:
+    return getattr(_SHARD, method)(arg)
+
+
+def _shard_matches(request: RecommendationRequest) -> bool:
+    # Whether the request's filters select any live book of this shard
+    return len(_SHARD._apply_filters(request)) > 0
+
+
+def _shard_titles(titles: List[List[str]]) -> List[Dict[str, Tuple[float, List[int], List[List[str]]]]]:
+    # Per title list: normalized title -> (match quality, matching rows here, each row's graph entities)
+    found = []
+    for matches in map(_SHARD.catalog.title_matches, titles):
+        found.append({
+            key: (quality, rows, _SHARD.graph_model.entity_keys(np.asarray(rows, dtype=np.int64)))
+            for key, (quality, rows) in matches.items()
+        })
+    return found
+
+
+def _shard_graph_paths(liked: List[Tuple[List[str], int]]) -> List[Tuple[np.ndarray, np.ndarray]]:
+    # Per liked book (its path entities, its row here or -1): the top-N paths to rows here
+    if not liked:
+        return []
+    return _SHARD.graph_model.entity_paths([entities for entities, _ in liked], [own for _, own in liked])
+
+
+def _shard_pool(
+    request: RecommendationRequest, fallback: bool, liked: Optional[LikedBooks] = None
+) -> Optional[Tuple[CandidatePool, Trace]]:
+    # None when the filters match nothing here: an empty filter falls back to the whole catalog only
+    # if no shard matched (`fallback`)
+    if not fallback and not _shard_matches(request):
+        return None
+    trace = Trace()
+    return _SHARD.candidate_pool(request, trace, liked), trace
+
+
+def _shard_pool_batch(
+    requests: List[RecommendationRequest], fallback: bool, liked: List[Optional[LikedBooks]]
+) -> List[Optional[CandidatePool]]:
+    return [_SHARD.candidate_pool(r, liked=l) if fallback or _shard_matches(r) else None for r, l in zip(requests, liked)]
+
+
+class ShardPlan:
+    # Which shard holds each book. With key language or country every distinct (lower-cased) value
+    # lives on one shard, values packed largest first onto the least loaded shard, so a request
+    # filtering on that field only reaches the shards holding its values; key hash spreads books by
+    # crc32(book_id) and every request fans out.
+    def __init__(self, shards: int, key: str = "language") -> None:
+        if key not in SHARD_KEYS:
+            raise ValueError(f"Unknown sharding key: {key}")
+        self.shards = shards
+        self.key = key
+        self.owner: Dict[str, int] = {}
+        self.loads = np.zeros(shards, dtype=np.int64)
+
+    def _values(self, books: pd.DataFrame) -> pd.Series:
+        column = books[self.key] if self.key in books.columns else pd.Series("", index=books.index)
+        return column.fillna("").astype(str).str.lower()
+
+    def assign(self, books: pd.DataFrame) -> np.ndarray:
+        # Shard of every row; values not seen before are placed now
+        if self.key == "hash":
+            shards = np.array([zlib.crc32(str(b).encode("utf-8")) % self.shards for b in books["book_id"]], dtype=np.int64)
+        else:
+            values = self._values(books)
+            for value, count in values[~values.isin(self.owner)].value_counts().items():
+                self.owner[value] = int(np.argmin(self.loads))
+                self.loads[self.owner[value]] += count
+            shards = values.map(self.owner).to_numpy(dtype=np.int64)
+        return shards
+
+    def route(self, request: RecommendationRequest) -> List[int]:
+        # Shards a request has to reach: those owning its filter values, else all of them. A value
+        # no shard owns matches nothing, so the request falls back to popularity across all shards.
+        values = {"language": request.languages, "country": request.countries}.get(self.key)
+        if values and all(v.lower() in self.owner for v in values):
+            return sorted({self.owner[v.lower()] for v in values})
+        return list(range(self.shards))
+
+
+class ShardedRecommender:
+    # Scatter-gather serving: the catalog is partitioned by a ShardPlan into shard HybridRecommenders,
+    # each in its own worker process over its own books and interactions, so per-shard memory and
+    # latency follow the shard size rather than the global catalog. A request is sent to the shards
+    # it routes to; each returns its re-rank pool with raw signal scores (TF-IDF over one vocabulary
+    # and idf fitted on the whole catalog, graph and mf unscaled), and the pools are blended and
+    # re-ranked here once, as one recommender would over the whole catalog. Liked titles are resolved
+    # here across shards first (best match per title, as one TitleIndex would pick), and the graph
+    # signal is the catalog-wide top-N paths from them, merged from every shard's paths under the
+    # entity degrees counted here. Liked titles and history are excluded by the shard holding them;
+    # co-reader (co-occurrence) and mf signals stay within a shard, whose interactions only cover its books.
+    def __init__(self, config: dict | None = None) -> None:
+        self.config = config or {}
+        cfg = self.config.get("sharding", {})
+        self.shards = int(cfg.get("shards", 0))
+        self.key = str(cfg.get("key", "language"))
+        self.dir = str(cfg.get("dir", "data/shards"))
+        self.plan: ShardPlan | None = None
+        self.pools: List[ProcessPoolExecutor] = []
+        self.books_per_shard: List[int] = []
+        self.model_version: str | None = None
+        self.catalog_revision = 0
+        # Blend weights and re-ranker of one recommender (never initialized)
+        self.ranking = HybridRecommender(self.config)
+        # book_id -> row in the unsharded catalog order, so ties break as one recommender breaks them
+        self.rows: Dict[str, int] = {}
+        self.next_row = 0
+        # Entity degrees over every shard's books (no matrices): which entities are hubs catalog-wide
+        self.graph = BookGraph(self.config)
+        # Serializes catalog writers (the plan's value placement); requests never take it
+        self.update_lock = threading.Lock()
+
+    def initialize(self, trace: Trace = NULL_TRACE) -> None:
+        with trace.stage("partition"):
+            configs = self._partition()
+        with trace.stage("start_shards"):
+            self.shutdown()
+            self.pools = [
+                ProcessPoolExecutor(max_workers=1, initializer=_init_shard, initargs=(config,)) for config in configs
+            ]
+            # Shards build their models in parallel
+            self.books_per_shard = [f.result() for f in [pool.submit(_shard_ready) for pool in self.pools]]
+        self.model_version = "shards-" + time.strftime("%Y%m%dT%H%M%S")
+        trace.count("books", sum(self.books_per_shard))
+        trace.count("shards", len(self.pools))
+
+    def _partition(self) -> List[dict]:
+        # Writes each shard's books and interactions under `dir` and returns the shard configs
+        loader = HybridRecommender(self.config)
+        loader._load_books()
+        books = loader.books
+        books["book_id"] = books["book_id"].astype(str)
+        shards = max(1, min(self.shards, len(books)))
+        if self.key != "hash":
+            # Values are never split, so there cannot be more shards than values
+            shards = max(1, min(shards, ShardPlan(shards, self.key)._values(books).nunique()))
+        self.plan = ShardPlan(shards, self.key)
+        assigned = self.plan.assign(books)
+        self.rows = {b: i for i, b in enumerate(books["book_id"])}
+        self.next_row = len(books)
+        self.graph = BookGraph(self.config)
+        self.graph.count_entities(books)
+        os.makedirs(self.dir, exist_ok=True)
+        # One vocabulary and idf for every shard, so content similarities compare across shards
+        vectorizer_pkl = os.path.join(self.dir, "vectorizer.pkl")
+        vectorizer = ContentBasedRecommender(self.config)._new_vectorizer().fit(build_corpus(books))
+        with open(vectorizer_pkl, "wb") as f:
+            pickle.dump(vectorizer, f)
+        configs = []
+        for shard in range(shards):
+            paths = {
+                "books_csv": os.path.join(self.dir, f"books-{shard}.csv"),
+                "interactions_csv": os.path.join(self.dir, f"interactions-{shard}.csv"),
+            }
+            books[assigned == shard].to_csv(paths["books_csv"], index=False)
+            config = copy.deepcopy(self.config)
+            # Whole-catalog bundles do not apply to a shard
+            config["paths"] = {
+                **config.get("paths", {}), **paths, "books_parquet": None, "artifacts_dir": None, "vectorizer_pkl": vectorizer_pkl,
+            }
+            config["sharding"] = {**config.get("sharding", {}), "shards": 0}
+            # A shard re-weighting idf over its own books would leave the shared idf
+            config["catalog"] = {**config.get("catalog", {}), "reweight_after_rows": 0}
+            configs.append(config)
+        self._partition_interactions(dict(zip(books["book_id"], assigned.tolist())), configs)
+        return configs
+
+    def _partition_interactions(self, shard_of: Dict[str, int], configs: List[dict]) -> None:
+        # Each interaction goes to the shard holding its book; read in chunks
+        source = self.config.get("paths", {}).get("interactions_csv", "sample_data/user_interactions_sample.csv")
+        targets = [c["paths"]["interactions_csv"] for c in configs]
+        for target in targets:
+            if os.path.exists(target):
+                os.remove(target)
+        if not os.path.exists(source):
+            return
+        for chunk in pd.read_csv(source, chunksize=1_000_000):
+            if "book_id" not in chunk.columns:
+                return
+            shards = chunk["book_id"].astype(str).map(shard_of)
+            for shard, rows in chunk.groupby(shards):
+                target = targets[int(shard)]
+                rows.to_csv(target, mode="a", header=not os.path.exists(target), index=False)
+
+    def shutdown(self) -> None:
+        for pool in self.pools:
+            pool.shutdown(wait=False)
+        self.pools = []
+
+    def live_count(self) -> int:
+        return sum(self.books_per_shard)
+
+    def _merge(self, pools: List[CandidatePool], request: RecommendationRequest) -> List[RecommendedBook]:
+        # Blend and re-rank the shards' pools together, as HybridRecommender._rank over one catalog
+        pools = [p for p in pools if len(p.books)]
+        if not pools:
+            return []
+        ranking, limit = self.ranking, max(1, request.limit)
+        books = list(chain.from_iterable(p.books for p in pools))
+        order = np.argsort([self.rows.get(b.book_id, self.next_row) for b in books], kind="stable")
+        books = [books[i] for i in order.tolist()]
+        popularity = np.concatenate([p.popularity for p in pools])[order]
+        if any(p.fallback for p in pools):
+            # The budget only afforded popularity somewhere: the most popular books overall
+            top = ranking._top_k(popularity, min(len(books), limit))
+            scores = popularity / popularity[top[0]] if popularity[top[0]] > 0 else np.zeros(len(books))
+            return [books[i].model_copy(update={"score": float(scores[i])}) for i in top.tolist()]
+        content, collab, graph, mf = np.concatenate([p.signals for p in pools])[order].T
+        # Popularity priors (requests without preferences) over the candidates of every shard
+        content = content / (max(p.content_scale for p in pools) or 1.0)
+        if all(p.collab_missing for p in pools):
+            collab = popularity / (max(p.popularity_scale for p in pools) or 1.0)
+        elif all(p.collab_prior for p in pools):
+            collab = collab / (max(p.collab_scale for p in pools) or 1.0)
+        graph_scale = max(p.graph_scale for p in pools) or 1.0
+        mf_scale = max(p.mf_scale for p in pools) or 1.0
+        blended = ranking._blend_scores(content, collab, graph / graph_scale, mf / mf_scale)
+        rerank = ranking.reranker.uses_features
+        top = ranking._top_k(blended, min(len(books), max(limit, ranking.reranker.pool_size) if rerank else limit))
+        if rerank and len(top) > 1:
+            vectors = [p.vectors for p in pools]
+            vectors = (sparse.vstack(vectors, format="csr") if sparse.issparse(vectors[0]) else np.vstack(vectors))[order]
+            coverage = [np.concatenate([p.coverage[i] for p in pools])[order] for i in range(len(pools[0].coverage))]
+            authors = np.concatenate([p.authors for p in pools])[order]
+            top = top[ranking.reranker.rerank(
+                blended[top], vectors[top], [c[top] for c in coverage], authors[top], limit, ranking.diversity_weight
+            )]
+        return [books[i].model_copy(update={"score": float(blended[i])}) for i in top[:limit].tolist()]
+
+    def recommend_traced(self, request: RecommendationRequest) -> Tuple[List[RecommendedBook], Trace]:
+        trace = Trace()
+        with trace.stage("total"):
+            results = self.recommend(request, trace)
+        return results, trace
+
+    def _resolve_liked(self, requests: List[RecommendationRequest]) -> List[Optional[List[LikedBooks]]]:
+        # Per request with liked titles, one LikedBooks per shard. Two round trips to every shard: each
+        # resolves the titles against its books, and per title the best match quality any shard found
+        # wins (exact keys before the closest fuzzy ones); then each shard returns its top-N paths from
+        # every liked book, merged here into the catalog-wide top-N per book and summed.
+        resolved: List[Optional[List[LikedBooks]]] = [None] * len(requests)
+        wanted = [i for i, r in enumerate(requests) if r.liked_books]
+        if not wanted:
+            return resolved
+        titles = [requests[i].liked_books for i in wanted]
+        replies = [f.result() for f in [pool.submit(_shard_titles, titles) for pool in self.pools]]
+        # (request, shard, row here, path entities) of every liked book
+        liked: List[Tuple[int, int, int, List[str]]] = []
+        for j, i in enumerate(wanted):
+            best: Dict[str, float] = {}
+            for reply in replies:
+                for key, (quality, _, _) in reply[j].items():
+                    best[key] = max(best.get(key, 0.0), quality)
+            rows = {}
+            for shard, reply in enumerate(replies):
+                for key, (quality, positions, entities) in reply[j].items():
+                    if quality == best[key]:
+                        rows.update({(shard, p): e for p, e in zip(positions, entities)})
+            liked.extend((i, shard, p, self.graph.path_entities(e)) for (shard, p), e in rows.items())
+        queries = [[(e, p if shard == s else -1) for _, shard, p, e in liked] for s in range(len(self.pools))]
+        paths = [f.result() for f in [pool.submit(_shard_graph_paths, q) for pool, q in zip(self.pools, queries)]]
+        sums: Dict[int, Dict[Tuple[int, int], float]] = {i: {} for i in wanted}
+        for k, (i, _, _, _) in enumerate(liked):
+            shards = np.concatenate([np.full(len(reply[k][0]), s) for s, reply in enumerate(paths)])
+            positions = np.concatenate([reply[k][0] for reply in paths])
+            weights = np.concatenate([reply[k][1] for reply in paths])
+            for t in np.argsort(-weights, kind="stable")[: self.graph.top_n].tolist():
+                key = (int(shards[t]), int(positions[t]))
+                sums[i][key] = sums[i].get(key, 0.0) + float(weights[t])
+        for i in wanted:
+            scale = max(sums[i].values(), default=0.0)
+            resolved[i] = []
+            for s in range(len(self.pools)):
+                mine = sorted((p, total) for (shard, p), total in sums[i].items() if shard == s)
+                resolved[i].append(LikedBooks(
+                    np.array(sorted(p for r, shard, p, _ in liked if r == i and shard == s), dtype=np.int64),
+                    sum(r == i for r, _, _, _ in liked),
+                    np.array([p for p, _ in mine], dtype=np.int64), np.array([t for _, t in mine], dtype=float), scale,
+                ))
+        return resolved
+
+    def recommend(self, request: RecommendationRequest, trace: Trace = NULL_TRACE) -> List[RecommendedBook]:
+        if not self.pools:
+            raise ValueError("Books not loaded")
+        shards = self.plan.route(request)
+        trace.count("shards", len(shards))
+        with trace.stage("liked"):
+            liked = self._resolve_liked([request])[0]
+        replies = self._scatter(shards, request, fallback=False, liked=liked)
+        if all(reply is None for reply in replies):
+            # No shard matched the filters: the whole catalog, as one recommender would fall back to
+            shards = list(range(len(self.pools)))
+            replies = self._scatter(shards, request, fallback=True, liked=liked)
+        replies = [reply for reply in replies if reply is not None]
+        for _, shard_trace in replies:
+            # Shards run in parallel: the slowest one's stage time, summed counts
+            for name, seconds in shard_trace.stages.items():
+                trace.stages[name] = max(trace.stages.get(name, 0.0), seconds)
+            for name, value in shard_trace.counts.items():
+                trace.count(name, trace.counts.get(name, 0) + value)
+            for kind in shard_trace.degraded:
+                if kind not in trace.degraded:
+                    trace.degrade(kind)
+        with trace.stage("merge"):
+            return self._merge([pool for pool, _ in replies], request)
+
+    def _scatter(
+        self, shards: List[int], request: RecommendationRequest, fallback: bool, liked: Optional[List[LikedBooks]] = None
+    ) -> list:
+        futures = [self.pools[s].submit(_shard_pool, request, fallback, liked[s] if liked else None) for s in shards]
+        return [f.result() for f in futures]
+
+    def recommend_batch(self, requests: List[RecommendationRequest]) -> List[List[RecommendedBook]]:
+        if not self.pools:
+            raise ValueError("Books not loaded")
+        routed: Dict[int, List[int]] = {}
+        for i, request in enumerate(requests):
+            for shard in self.plan.route(request):
+                routed.setdefault(shard, []).append(i)
+        liked = self._resolve_liked(requests)
+        gathered: List[List[CandidatePool]] = [[] for _ in requests]
+        matched = np.zeros(len(requests), dtype=bool)
+        for fallback in (False, True):
+            futures = {
+                shard: self.pools[shard].submit(
+                    _shard_pool_batch, [requests[i] for i in members], fallback,
+                    [liked[i][shard] if liked[i] else None for i in members],
+                )
+                for shard, members in routed.items()
+            }
+            for shard, future in futures.items():
+                for i, pool in zip(routed[shard], future.result()):
+                    if pool is not None:
+                        gathered[i].append(pool)
+                        matched[i] = True
+            # Second round: requests no shard matched, sent to every shard
+            unmatched = np.flatnonzero(~matched).tolist()
+            if not unmatched:
+                break
+            routed = {shard: unmatched for shard in range(len(self.pools))}
+        return [self._merge(pools, r) for pools, r in zip(gathered, requests)]
+
+    def upsert_books(self, books: pd.DataFrame) -> Dict[str, int]:
+        # Each book goes to its plan shard; a book whose key value changed is deleted from the others
+        books = books.copy()
+        books["book_id"] = books["book_id"].astype(str)
+        books = books.drop_duplicates("book_id", keep="last").reset_index(drop=True)
+        with self.update_lock:
+            assigned = self.plan.assign(books)
+            # Every upserted row links its entities, as in one catalog's graph (replaced rows stay counted)
+            self.graph.count_entities(books)
+            for book_id in books["book_id"]:
+                # Replaced books take a new row at the end, as in one catalog
+                self.rows.pop(book_id, None)
+                self.rows[book_id] = self.next_row
+                self.next_row += 1
+            upserts, moves = [], []
+            for shard, pool in enumerate(self.pools):
+                rows = books[assigned == shard]
+                others = books.loc[assigned != shard, "book_id"].tolist()
+                if len(rows):
+                    upserts.append(pool.submit(_call_shard, "upsert_books", rows))
+                if others:
+                    moves.append(pool.submit(_call_shard, "delete_books", others))
+            counts = [f.result() for f in upserts]
+            moved = sum(f.result() for f in moves)
+            self._refresh_counts()
+        return {"added": sum(c["added"] for c in counts) - moved, "updated": sum(c["updated"] for c in counts) + moved}
+
+    def delete_books(self, book_ids: List[str]) -> int:
+        book_ids = [str(b) for b in book_ids]
+        with self.update_lock:
+            deleted = sum(f.result() for f in [pool.submit(_call_shard, "delete_books", book_ids) for pool in self.pools])
+            if deleted:
+                self._refresh_counts()
+        return deleted
+
+    def _refresh_counts(self) -> None:
+        self.books_per_shard = [f.result() for f in [pool.submit(_shard_ready) for pool in self.pools]]
+        # New version so cached recommendations from the previous catalog are not served
+        self.catalog_revision += 1
+        self.model_version = f"{(self.model_version or 'shards').split('+')[0]}+{self.catalog_revision}"
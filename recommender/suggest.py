@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+import re
+import numpy as np
+
+from recommender.catalog import Catalog, CodeSets
+from recommender.title_index import fold_text
+
+
+SUGGEST_FIELDS = ("title", "author", "genre", "theme")
+# Later words of a text are also keys, so "potter" finds "Harry Potter"; single letters are not
+_WORD_START = re.compile(r"(?<= )\w\w")
+
+
+class PrefixIndex:
+    # Sorted fixed-width keys: the UTF-8 bytes (truncated to key_bytes) of every entity's folded text
+    # and of its suffixes starting at later words, each pointing at the entity. A prefix is a
+    # contiguous key range; prefixes covering more than scan_limit keys keep a precomputed list of
+    # their top_n most popular entities, so no query scans more than scan_limit keys.
+    def __init__(self, key_bytes: int = 16, scan_limit: int = 2048, top_n: int = 40) -> None:
+        self.key_bytes = key_bytes
+        self.scan_limit = scan_limit
+        self.top_n = top_n
+        self.keys = np.zeros(0, dtype=f"S{key_bytes}")
+        self.entities = np.zeros(0, dtype=np.int64)
+        self.top: Dict[bytes, np.ndarray] = {}
+
+    def build(self, texts: List[str], first_entity: int, popularity: np.ndarray) -> None:
+        # Entities first_entity..first_entity+len(texts); popularity is indexed by entity
+        keys: List[bytes] = []
+        owners: List[int] = []
+        for entity, text in enumerate(texts, start=first_entity):
+            if not text:
+                continue
+            for start in [0] + [m.start() for m in _WORD_START.finditer(text)]:
+                keys.append(text[start:].encode("utf-8")[: self.key_bytes])
+                owners.append(entity)
+        key_array = np.array(keys, dtype=f"S{self.key_bytes}")
+        order = np.argsort(key_array, kind="stable")
+        self.keys, self.entities = key_array[order], np.array(owners, dtype=np.int64)[order]
+        self.top = self._top_lists(popularity) if len(self.keys) > self.scan_limit else {}
+
+    def _top_lists(self, popularity: np.ndarray) -> Dict[bytes, np.ndarray]:
+        n = len(self.keys)
+        raw = self.keys.view(np.uint8).reshape(n, self.key_bytes)
+        # shared[i]: leading bytes key i has in common with key i - 1
+        shared = np.zeros(n, dtype=np.int64)
+        for start in range(1, n, 1 << 16):
+            stop = min(n, start + (1 << 16))
+            differs = raw[start:stop] != raw[start - 1:stop - 1]
+            shared[start:stop] = np.where(differs.any(axis=1), differs.argmax(axis=1), self.key_bytes)
+        lengths = (raw != 0).sum(axis=1)  # keys are NUL-padded and UTF-8 text has no NUL
+        top: Dict[bytes, np.ndarray] = {}
+        for depth in range(1, self.key_bytes + 1):
+            # Ranges of keys sharing their first `depth` bytes
+            starts = np.flatnonzero(shared < depth)
+            stops = np.r_[starts[1:], n]
+            wide = (stops - starts > self.scan_limit) & (lengths[starts] >= depth)
+            for start, stop in zip(starts[wide].tolist(), stops[wide].tolist()):
+                top[raw[start, :depth].tobytes()] = self.best(self.entities[start:stop], popularity, self.top_n)
+        return top
+
+    @staticmethod
+    def best(entities: np.ndarray, popularity: np.ndarray, n: int) -> np.ndarray:
+        # Up to n distinct entities, most popular first
+        if len(entities) > 2 * n:
+            entities = entities[np.argpartition(-popularity[entities], 2 * n - 1)[: 2 * n]]
+        entities = np.unique(entities)
+        return entities[np.argsort(-popularity[entities], kind="stable")[:n]]
+
+    def range(self, prefix: bytes) -> Tuple[int, int]:
+        # Needles keep the keys' dtype: a wider one would make searchsorted cast the whole key array
+        needle = np.array([prefix], dtype=self.keys.dtype)
+        lo = int(np.searchsorted(self.keys, needle)[0])
+        if len(prefix) >= self.key_bytes:
+            return lo, int(np.searchsorted(self.keys, needle, side="right")[0])
+        return lo, int(np.searchsorted(self.keys, np.array([prefix + b"\xff"], dtype=self.keys.dtype))[0])
+
+    def candidates(self, prefix: bytes, scan: bool = False) -> Tuple[np.ndarray, bool]:
+        # (entities with a key starting with `prefix`, complete): a wide range returns its precomputed
+        # top list (incomplete) unless `scan`
+        lo, hi = self.range(prefix)
+        if hi - lo > self.scan_limit and prefix in self.top and not scan:
+            return self.top[prefix], False
+        return self.entities[lo:hi], True
+
+
+class FieldSuggestions:
+    # One suggest field. Entities are catalog rows (titles) or CodeSets values (authors, genres,
+    # themes), with a base PrefixIndex plus a small tail for entities added since, rebuilt into the
+    # base once the tail outgrows an eighth of it. Writers swap the (base, tail) pair whole.
+    TAIL_MIN = 10_000
+
+    def __init__(self, key_bytes: int, scan_limit: int, top_n: int) -> None:
+        self.params = (key_bytes, scan_limit, top_n)
+        self.texts: List[str] = []
+        self.tail_from = 0
+        self.indexes = (PrefixIndex(*self.params), PrefixIndex(*self.params))
+
+    def extend(self, texts: List[str], popularity: np.ndarray) -> None:
+        self.texts.extend(texts)
+        base, tail = self.indexes
+        if len(self.texts) - self.tail_from > max(self.TAIL_MIN, self.tail_from // 8):
+            base, tail = PrefixIndex(*self.params), PrefixIndex(*self.params)
+            base.build(self.texts, 0, popularity)
+            self.tail_from = len(self.texts)
+        else:
+            tail = PrefixIndex(*self.params)
+            tail.build(self.texts[self.tail_from:], self.tail_from, popularity)
+        self.indexes = (base, tail)
+
+    def candidates(self, prefix: bytes, scan: bool = False) -> Tuple[np.ndarray, bool]:
+        base, tail = self.indexes
+        base_entities, base_complete = base.candidates(prefix, scan)
+        tail_entities, tail_complete = tail.candidates(prefix, scan)
+        return np.concatenate([base_entities, tail_entities]), base_complete and tail_complete
+
+
+class SuggestIndex:
+    # Typeahead over catalog titles, authors, genres and themes, ranked by popularity (rating_count x
+    # avg_rating; summed over live books for authors, genres and themes). Built from the Catalog at
+    # initialize and extended on catalog changes, so a keystroke costs a few binary searches and
+    # array operations over at most scan_limit keys per field.
+    def __init__(self, config: dict | None = None) -> None:
+        self.config = config or {}
+        cfg = self.config.get("suggest", {})
+        self.key_bytes = int(cfg.get("key_bytes", 16))
+        self.scan_limit = int(cfg.get("scan_limit", 2048))
+        self.max_limit = int(cfg.get("max_limit", 20))
+        self.fields = {f: FieldSuggestions(self.key_bytes, self.scan_limit, 2 * self.max_limit) for f in SUGGEST_FIELDS}
+        # Per value field: (popularity, live book count) by value code
+        self.stats: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.catalog: Catalog | None = None
+
+    @staticmethod
+    def _sets(catalog: Catalog) -> Dict[str, CodeSets]:
+        return {"author": catalog.author_sets, "genre": catalog.genre_sets, "theme": catalog.theme_sets}
+
+    def build(self, catalog: Catalog) -> None:
+        self.fields = {
+            f: FieldSuggestions(self.key_bytes, self.scan_limit, 2 * self.max_limit) for f in SUGGEST_FIELDS
+        }
+        self.update(catalog)
+
+    def update(self, catalog: Catalog) -> None:
+        # After rows were appended or retired: index new titles and values, refresh value popularity
+        for field, sets in self._sets(catalog).items():
+            self.stats[field] = self._value_stats(sets, catalog)
+        titles = self.fields["title"]
+        if len(titles.texts) < catalog.size:
+            titles.extend([fold_text(t) for t in catalog.titles[len(titles.texts):catalog.size]], catalog.popularity)
+        for field, sets in self._sets(catalog).items():
+            values = self.fields[field]
+            if len(values.texts) < len(sets.values):
+                values.extend([fold_text(v) for v in sets.values[len(values.texts):]], self.stats[field][0])
+        self.catalog = catalog
+
+    @staticmethod
+    def _value_stats(sets: CodeSets, catalog: Catalog) -> Tuple[np.ndarray, np.ndarray]:
+        rows = np.repeat(np.arange(catalog.size), np.diff(sets.indptr[: catalog.size + 1]))
+        codes = sets.codes[: len(rows)]
+        alive = catalog.alive[rows]
+        popularity = np.bincount(codes, weights=catalog.popularity[rows] * alive, minlength=len(sets.values))
+        return popularity, np.bincount(codes, weights=alive, minlength=len(sets.values)).astype(np.int64)
+
+    def _matches(
+        self, index: FieldSuggestions, query: str, encoded: bytes, live: np.ndarray, scan: bool = False
+    ) -> Tuple[np.ndarray, bool]:
+        # (live entities matching the whole query, complete)
+        entities, complete = index.candidates(encoded[: self.key_bytes], scan)
+        entities = entities[live[entities]]
+        if len(encoded) > self.key_bytes:
+            # Keys hold only key_bytes: match the whole query against the candidates' word starts
+            padded = " " + query
+            entities = np.array([e for e in entities.tolist() if padded in " " + index.texts[e]], dtype=np.int64)
+        return entities, complete
+
+    def suggest(self, prefix: str, fields: List[str] | None = None, limit: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+        catalog = self.catalog
+        fields = list(fields or SUGGEST_FIELDS)
+        limit = max(1, min(limit, self.max_limit))
+        query = fold_text(prefix)
+        out: Dict[str, List[Dict[str, Any]]] = {f: [] for f in fields}
+        if not query or catalog is None:
+            return out
+        encoded = query.encode("utf-8")
+        for field in fields:
+            index = self.fields[field]
+            if field == "title":
+                popularity, live = catalog.popularity, catalog.alive
+            else:
+                popularity, counts = self.stats[field]
+                live = counts > 0
+            entities, complete = self._matches(index, query, encoded, live)
+            if not complete and len(np.unique(entities)) < limit:
+                # Deletions or a longer query than the keys hold used up a precomputed top list: scan
+                # the whole range
+                entities, _ = self._matches(index, query, encoded, live, scan=True)
+            ranked = PrefixIndex.best(entities, popularity, limit)
+            if field == "title":
+                out[field] = [
+                    {"value": catalog.titles[p], "book_id": catalog.book_ids[p], "author": catalog.authors[p], "score": float(popularity[p])}
+                    for p in ranked.tolist()
+                ]
+            else:
+                display = self._sets(catalog)[field].display
+                out[field] = [
+                    {"value": display[v], "books": int(counts[v]), "score": float(popularity[v])} for v in ranked.tolist()
+                ]
+        return out
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+from typing import Dict, List, Tuple
+import math
+import re
+import unicodedata
+import numpy as np
+
+
+# Trailing series / edition markers: "(Harry Potter, #1)", "[Illustrated]", ", Book 2", "#3"
+_SERIES_SUFFIX = re.compile(
+    r"(?:[\(\[][^\(\)\[\]]*[\)\]]"
+    r"|(?:[,:;-]\s*)?\b(?:book|vol\.?|volume|part)\s+(?:\d+|[ivxlc]+|one|two|three|four|five)"
+    r"|#\s*\d+(?:\.\d+)?)(?:\s*(?:[\(\[][^\(\)\[\]]*[\)\]]|#\s*\d+(?:\.\d+)?))*\s*$"
+)
+_SEPARATORS = re.compile(r"[\W_]+")
+GRAM_CHARS = 96  # trigrams come from the first GRAM_CHARS characters of a key
+GRAM_BLOCK = 20_000  # keys per trigram extraction block
+UNMATCHED_MAX = 10_000  # remembered keys without a fuzzy match
+EMPTY = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+EXACT = 2.0  # match quality of an exact key; fuzzy matches rank by their Dice similarity (<= 1)
+
+
+def _fold(text: str) -> str:
+    text = str(text)
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return text.casefold().replace("&", " and ")
+
+
+def fold_text(text: str) -> str:
+    # Case- and accent-folded words separated by single spaces
+    return _SEPARATORS.sub(" ", _fold(text)).strip()
+
+
+def normalize_title(title: str) -> str:
+    # fold_text without series suffixes; "" stays ""
+    text = _fold(title)
+    # A title that is only a suffix keeps its text
+    key = _SEPARATORS.sub(" ", _SERIES_SUFFIX.sub("", text)).strip()
+    return key or _SEPARATORS.sub(" ", text).strip()
+
+
+def trigrams(keys: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    # Unique (trigram, key index) pairs sorted by trigram, then key. A trigram packs three code points
+    # (< 2^21 each) of the key padded as "  key " into one int64, so the catalog is handled as arrays.
+    all_grams, all_rows = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for start in range(0, len(keys), GRAM_BLOCK):
+        padded = ["  " + k[:GRAM_CHARS] + " " for k in keys[start:start + GRAM_BLOCK]]
+        width = max(len(p) for p in padded)
+        chars = np.array(padded, dtype=f"U{width}").view(np.uint32).reshape(len(padded), width).astype(np.int64)
+        lengths = np.array([len(p) for p in padded])
+        grams = (chars[:, :-2] << 42) | (chars[:, 1:-1] << 21) | chars[:, 2:]
+        valid = np.arange(width - 2)[None, :] < (lengths - 2)[:, None]
+        all_grams.append(grams[valid])
+        all_rows.append(np.broadcast_to(np.arange(start, start + len(padded))[:, None], grams.shape)[valid])
+    grams, rows = np.concatenate(all_grams), np.concatenate(all_rows)
+    # Rows are ascending already, so a stable sort on trigrams orders both
+    order = np.argsort(grams, kind="stable")
+    grams, rows = grams[order], rows[order]
+    first = np.r_[True, (grams[1:] != grams[:-1]) | (rows[1:] != rows[:-1])] if len(grams) else np.zeros(0, dtype=bool)
+    return grams[first], rows[first]
+
+
+class TitleIndex:
+    # Catalog-wide liked-title resolution, independent of request filters. Exact lookups go through a
+    # dict of normalized keys; a title without an exact key falls back to the live rows whose key has
+    # the highest trigram Dice similarity, if it reaches `threshold`. Postings are (trigram, row) pairs
+    # sorted by trigram then row: a base built at init plus a small tail for appended rows, merged
+    # once the tail grows. Writers swap whole arrays, so readers never lock.
+    def __init__(self, threshold: float = 0.7) -> None:
+        self.threshold = threshold
+        self.keys: List[str] = []
+        self.exact: Dict[str, List[int]] = {}
+        self.gram_counts = np.zeros(0, dtype=np.int32)
+        # (base postings, tail postings), swapped as one pair
+        self._postings = (EMPTY, EMPTY)
+        # Keys without a fuzzy match -> catalog size when checked. Retiring rows cannot create a match,
+        # only appended rows can, so an entry holds while the size is unchanged.
+        self._unmatched: Dict[str, int] = {}
+
+    def build(self, titles: List[str]) -> None:
+        self.keys, self.exact = [], {}
+        self.gram_counts = np.zeros(0, dtype=np.int32)
+        self._postings = (EMPTY, EMPTY)
+        self._unmatched = {}
+        self.add(titles, 0)
+
+    def add(self, titles: List[str], offset: int) -> None:
+        # Rows offset..offset+len(titles), appended after every existing row; row data before postings
+        keys = [normalize_title(t) for t in titles]
+        grams, rows = trigrams(keys)
+        self.keys.extend(keys)
+        self.gram_counts = np.concatenate([self.gram_counts, np.bincount(rows, minlength=len(keys)).astype(np.int32)])
+        for pos, key in enumerate(keys, start=offset):
+            if key:
+                self.exact.setdefault(key, []).append(pos)
+        base, tail = self._postings
+        tail = self._merged(tail, (grams, rows + offset))
+        if len(tail[0]) > max(10_000, len(base[0]) // 4):
+            self._postings = (self._merged(base, tail), EMPTY)
+        else:
+            self._postings = (base, tail)
+
+    @staticmethod
+    def _merged(old: Tuple[np.ndarray, np.ndarray], new: Tuple[np.ndarray, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        # (trigrams, rows) pairs; `new` rows all follow `old` rows, so a stable sort keeps rows
+        # ascending within a trigram
+        if not len(old[0]) or not len(new[0]):
+            return new if len(new[0]) else old
+        grams = np.concatenate([old[0], new[0]])
+        rows = np.concatenate([old[1], new[1]])
+        order = np.argsort(grams, kind="stable")
+        return grams[order], rows[order]
+
+    @staticmethod
+    def _rows(postings: Tuple, gram: int) -> np.ndarray:
+        # Rows containing `gram`, ascending (tail rows are all newer than base rows)
+        parts = []
+        for grams, rows in postings:
+            lo, hi = np.searchsorted(grams, [gram, gram + 1])
+            parts.append(rows[lo:hi])
+        return np.concatenate(parts)
+
+    def resolve(self, titles: List[str], alive: np.ndarray) -> np.ndarray:
+        # Live rows matching any of `titles`, ascending. Rows past len(alive) are still being appended.
+        found = [p for _, rows in self.matches(titles, alive).values() for p in rows]
+        return np.unique(np.asarray(found, dtype=np.int64))
+
+    def matches(self, titles: List[str], alive: np.ndarray) -> Dict[str, Tuple[float, List[int]]]:
+        # Normalized key of each matched title -> (match quality, live rows): EXACT for an exact key, else
+        # the best Dice. A sharded catalog keeps, per key, the best quality any shard found.
+        found: Dict[str, Tuple[float, List[int]]] = {}
+        for key in dict.fromkeys(normalize_title(t) for t in titles):
+            if not key:
+                continue
+            exact = [p for p in self.exact.get(key, ()) if p < len(alive) and alive[p]]
+            if exact:
+                found[key] = (EXACT, exact)
+            elif self._unmatched.get(key) != len(alive):
+                dice, rows = self._fuzzy(key, alive)
+                if rows:
+                    found[key] = (dice, rows)
+        return found
+
+    def _fuzzy(self, key: str, alive: np.ndarray) -> Tuple[float, List[int]]:
+        grams, _ = trigrams([key])
+        if not len(grams):
+            return 0.0, []
+        dice, matched = self._fuzzy_match(key, grams, alive)
+        if not matched:
+            if len(self._unmatched) >= UNMATCHED_MAX:
+                self._unmatched = {}
+            self._unmatched[key] = len(alive)
+        return dice, matched
+
+    def _fuzzy_match(self, key: str, grams: np.ndarray, alive: np.ndarray) -> Tuple[float, List[int]]:
+        index = self._postings
+        postings = [self._rows(index, int(g)) for g in grams]
+        # Dice >= t needs at least ceil(t * |q| / (2 - t)) shared trigrams, so every match contains one
+        # of the |q| - that + 1 rarest query trigrams: only those postings generate candidates
+        needed = max(1, math.ceil(self.threshold * len(grams) / (2.0 - self.threshold) - 1e-9))
+        rarest = np.argsort([len(p) for p in postings], kind="stable")[: len(grams) - needed + 1]
+        candidates = np.unique(np.concatenate([postings[i] for i in rarest]))
+        candidates = candidates[candidates < len(alive)]
+        candidates = candidates[alive[candidates]]
+        if not len(candidates):
+            return 0.0, []
+        shared = np.zeros(len(candidates))
+        for rows in postings:
+            if len(rows):
+                loc = np.minimum(np.searchsorted(rows, candidates), len(rows) - 1)
+                shared += rows[loc] == candidates
+        dice = 2.0 * shared / (len(grams) + self.gram_counts[candidates])
+        best = dice.max()
+        if best < self.threshold:
+            return 0.0, []
+        # Every live row sharing a best key, e.g. other editions of the same title
+        keys = dict.fromkeys(self.keys[p] for p in candidates[dice == best].tolist())
+        return float(best), [p for k in keys for p in self.exact.get(k, ()) if p < len(alive) and alive[p]]
@@ -1,11 +1,8 @@
 import os
-import numpy as np
-import pandas as pd
-
-from recommender.content_based import ContentBasedRecommender
-from search.ann_index import AnnIndex
 import yaml
 
+from recommender.hybrid import HybridRecommender
+
 
 def load_config(path: str = "config/config.yaml") -> dict:
     if not os.path.exists(path):
@@ -16,22 +13,30 @@ def load_config(path: str = "config/config.yaml") -> dict:
 
 def main() -> None:
     config = load_config()
-    books_csv = config.get("paths", {}).get("books_csv", "sample_data/books_sample.csv")
-    books = pd.read_csv(books_csv)
-    cbr = ContentBasedRecommender(config)
-    cbr.fit(books)
-    tfidf = cbr.tfidf_matrix
+    paths = dict(config.get("paths", {}))
+    out_dir = paths.pop("artifacts_dir", None) or "data/artifacts"
+    # Always refit from the source data rather than reloading the current bundle
+    recommender = HybridRecommender({**config, "paths": paths})
+    recommender.initialize()
+    tfidf = recommender.content_model.tfidf_matrix
     if tfidf is None:
         print("No TF-IDF matrix; nothing to index")
         return
-    X = tfidf.astype("float32").toarray()
-    index = AnnIndex(dim=X.shape[1], engine=config.get("ann", {}).get("engine", "auto"))
-    index.build(X)
-    out_dir = config.get("paths", {}).get("ann_index_dir", "data/indices")
-    os.makedirs(out_dir, exist_ok=True)
-    np.save(os.path.join(out_dir, "tfidf_index_vectors.npy"), X)
-    print(f"[ok] built ANN vectors: {X.shape}")
+    index = recommender.content_model.ann_index
+    top_k = int(config.get("ann", {}).get("top_k", 50))
+    if recommender.content_model.embeddings is not None:
+        report = recommender.content_model.dense_report(top_k)
+        print(
+            f"[ok] dense recall@{top_k} vs exact TF-IDF search: {report['recall']:.3f}; bytes/book: "
+            f"tfidf {report['tfidf_bytes_per_book']:.0f}, int8 codes {report['codes_bytes_per_book']:.0f} (mmapped), "
+            f"index {report['index_bytes_per_book']:.0f}"
+        )
+    else:
+        sample = tfidf[: min(tfidf.shape[0], 256)]
+        print(f"[ok] recall@{top_k} vs exact search: {index.recall_at_k(sample, top_k):.3f}")
+    version = recommender.save_artifacts(out_dir)
+    print(f"[ok] wrote artifact bundle {version} to {out_dir}: tfidf {tfidf.shape}, nnz={tfidf.nnz}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,16 +1,55 @@
 from __future__ import annotations
 
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
+import json
 import os
+import threading
 import numpy as np
+from scipy import sparse
+
+from search.quantization import QuantizedMatrix
 
 
 class AnnIndex:
-    def __init__(self, dim: int, engine: str = "auto") -> None:
+    # FAISS index layouts for dense vectors; ivf_pq/hnsw fall back to flat when the catalog is too small to train
+    INDEX_TYPES = ("flat", "ivf_pq", "hnsw")
+    FORMAT_VERSION = 1
+    # Filters excluding at most this many rows (tombstones) over-fetch and post-filter; wider ones go
+    # through the engine's own id filter
+    MAX_OVERFETCH = 1024
+
+    def __init__(self, dim: int, engine: str = "auto", exact_threshold: int = 5000, params: dict | None = None) -> None:
         self.dim = dim
         self.engine = engine
+        # Filtered searches over at most this many allowed rows are answered exactly
+        self.exact_threshold = exact_threshold
+        params = params or {}
+        self.index_type = str(params.get("index_type", "flat"))
+        if self.index_type not in self.INDEX_TYPES:
+            raise ValueError(f"Unknown ann.index_type: {self.index_type}")
+        self.nlist = int(params.get("nlist", 1024))
+        self.nprobe = int(params.get("nprobe", 16))
+        self.pq_m = int(params.get("pq_m", 16))
+        self.pq_bits = int(params.get("pq_bits", 8))
+        self.hnsw_m = int(params.get("hnsw_m", 16))
+        self.ef_construction = int(params.get("ef_construction", 200))
+        self.ef_search = int(params.get("ef_search", 64))
+        # Set when the engine stores lossy codes; its similarities are then recomputed from `items`
+        self.rescore = False
         self.faiss_index = None
         self.hnsw_index = None
+        self.items = None
+        self.item_norms: np.ndarray | None = None
+        # External labels (book_ids) per row; rows keep their ids, removed rows are tombstoned here
+        self.labels: np.ndarray | None = None
+        self.deleted = np.zeros(0, dtype=bool)
+        self.n_deleted = 0
+        self._live: np.ndarray | None = None
+        self._label_rows: Dict[str, int] | None = None
+        # Set by load(mmap=True) until the first add(): the engine is a read-only mapping of the saved file
+        self.read_only = False
+        self._mapped_file: str | None = None
+        self._ef_lock = threading.Lock()
 
         if engine in ("auto", "faiss"):
             try:
@@ -30,37 +69,364 @@ class AnnIndex:
         else:
             self.hnswlib = None
 
-    def build(self, vectors: np.ndarray, ef_construction: int = 200, M: int = 16) -> None:
+    @property
+    def size(self) -> int:
+        return 0 if self.items is None else self.items.shape[0]
+
+    def build(
+        self, vectors, labels: Sequence[str] | None = None, ef_construction: int | None = None,
+        M: int | None = None, batch_size: int = 10000,
+    ) -> None:
+        # `vectors` may be dense, int8 codes (QuantizedMatrix) or a scipy sparse matrix; the exact
+        # fallback searches it in place
+        self.items = vectors
+        self.item_norms = self._norms(vectors)
+        self.labels = None if labels is None else np.asarray(labels, dtype=str)
+        self.deleted = np.zeros(vectors.shape[0], dtype=bool)
+        self.n_deleted, self._live, self._label_rows = 0, None, None
+        self.faiss_index, self.read_only = None, False
+        if sparse.issparse(vectors) and self.engine == "auto":
+            # Densifying wide sparse rows (e.g. 20k TF-IDF features) for FAISS/HNSW costs far more
+            # memory than it saves; only do it when an engine is requested explicitly
+            return
+        ef_construction = ef_construction or self.ef_construction
+        M = M or self.hnsw_m
         if self.faiss is not None:
-            self.faiss_index = self.faiss.IndexFlatIP(self.dim)
-            self.faiss_index.add(vectors.astype("float32"))
+            self.faiss_index = self._new_faiss_index(vectors, ef_construction, M)
+            for start in range(0, vectors.shape[0], batch_size):
+                self._faiss_add(self.faiss_index, self._unit(self._dense(vectors[start:start + batch_size])), start)
             return
         if self.hnswlib is not None:
             self.hnsw_index = self.hnswlib.Index(space='cosine', dim=self.dim)
             self.hnsw_index.init_index(max_elements=vectors.shape[0], ef_construction=ef_construction, M=M)
-            self.hnsw_index.add_items(vectors.astype("float32"))
-            self.hnsw_index.set_ef(64)
+            for start in range(0, vectors.shape[0], batch_size):
+                batch = self._dense(vectors[start:start + batch_size])
+                self.hnsw_index.add_items(batch, np.arange(start, start + batch.shape[0]))
+            self.hnsw_index.set_ef(self.ef_search)
             return
-        # Else, no-op; we will rely on brute-force fallback where used
+        # Else, no engine; searches use the exact fallback over `items`
+
+    def _new_faiss_index(self, vectors, ef_construction: int, M: int):
+        # Inner product over unit vectors == cosine similarity
+        faiss, n = self.faiss, vectors.shape[0]
+        if self.index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(self.dim, M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = ef_construction
+            index.hnsw.efSearch = self.ef_search
+            return index
+        if self.index_type == "ivf_pq" and self.dim % self.pq_m == 0 and n >= 39 * 2 ** self.pq_bits:
+            # ~39 training points per list is FAISS's lower bound; train on a bounded sample
+            nlist = max(1, min(self.nlist, n // 39))
+            quantizer = faiss.IndexFlatIP(self.dim)
+            index = faiss.IndexIVFPQ(quantizer, self.dim, nlist, self.pq_m, self.pq_bits, faiss.METRIC_INNER_PRODUCT)
+            sample = np.sort(np.random.default_rng(0).choice(n, size=min(n, max(256 * nlist, 64 * 2 ** self.pq_bits)), replace=False))
+            index.train(self._unit(self._dense(vectors[sample])))
+            index.nprobe = min(self.nprobe, nlist)
+            self.rescore = True
+            return index
+        # IDMap2 labels the flat storage's vectors with their row ids
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+
+    def _faiss_add(self, index, batch: np.ndarray, start: int) -> None:
+        if hasattr(index, "hnsw"):
+            # FAISS HNSW has no id map; rows are added in order so offsets are row ids
+            index.add(batch)
+        else:
+            index.add_with_ids(batch, np.arange(start, start + batch.shape[0], dtype=np.int64))
+
+    def add(self, vectors, items=None, labels: Sequence[str] | None = None, batch_size: int = 10000) -> None:
+        # Append rows; they get the next row ids. `items` is the full matrix (old rows + `vectors`)
+        # when the caller already holds it, which avoids stacking a second copy here.
+        if self.read_only:
+            # First write to a mapped index: add into an in-memory copy read from the same file and swap
+            # it in, so readers keep the mapping until then (FAISS cannot clone on-disk IVF lists)
+            faiss_index = self._read_faiss(self._mapped_file, mmap=False)
+        else:
+            faiss_index = self.faiss_index
+        start = self.size
+        if items is None and isinstance(vectors, QuantizedMatrix):
+            items = self.items.append(vectors.codes)
+        elif items is None:
+            items = sparse.vstack([self.items, vectors], format="csr") if sparse.issparse(vectors) else np.vstack([self.items, vectors])
+        norms = self._norms(vectors)
+        if faiss_index is not None:
+            for offset in range(0, vectors.shape[0], batch_size):
+                self._faiss_add(faiss_index, self._unit(self._dense(vectors[offset:offset + batch_size])), start + offset)
+        if self.hnsw_index is not None:
+            needed = start + vectors.shape[0]
+            if needed > self.hnsw_index.get_max_elements():
+                self.hnsw_index.resize_index(max(needed, 2 * self.hnsw_index.get_max_elements()))
+            for offset in range(0, vectors.shape[0], batch_size):
+                batch = self._dense(vectors[offset:offset + batch_size])
+                self.hnsw_index.add_items(batch, np.arange(start + offset, start + offset + batch.shape[0]))
+        if self.labels is not None:
+            new_labels = np.asarray(labels if labels is not None else [""] * vectors.shape[0], dtype=str)
+            self.labels = np.concatenate([self.labels, new_labels])
+        self.deleted = np.concatenate([self.deleted, np.zeros(vectors.shape[0], dtype=bool)])
+        self.item_norms = np.concatenate([self.item_norms, norms])
+        self.items = items
+        self.faiss_index, self.read_only = faiss_index, False
+        self._live, self._label_rows = None, None
+
+    def remove(self, ids) -> int:
+        # Tombstone rows (ids keep their meaning); hnswlib also drops them natively. FAISS rows stay in
+        # the engine (remove_ids compacts under concurrent readers) and searches filter the tombstones,
+        # so this never touches a mapped index.
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        ids = ids[(ids >= 0) & (ids < self.size)]
+        ids = ids[~self.deleted[ids]]
+        if not len(ids):
+            return 0
+        if self.hnsw_index is not None:
+            for i in ids.tolist():
+                self.hnsw_index.mark_deleted(i)
+        deleted = self.deleted.copy()
+        deleted[ids] = True
+        self.deleted, self.n_deleted = deleted, int(deleted.sum())
+        self._live, self._label_rows = None, None
+        return len(ids)
+
+    def remove_labels(self, labels: Sequence[str]) -> int:
+        rows = self.rows_for_labels(labels)
+        return self.remove(rows[rows >= 0])
+
+    def rows_for_labels(self, labels: Sequence[str]) -> np.ndarray:
+        # Live row per label (-1 if unknown); a label added again maps to its newest row
+        if self.labels is None:
+            raise ValueError("AnnIndex has no labels")
+        mapping = self._label_rows
+        if mapping is None:
+            live = ~self.deleted
+            mapping = self._label_rows = {str(label): row for row, label in enumerate(self.labels.tolist()) if live[row]}
+        return np.array([mapping.get(str(label), -1) for label in labels], dtype=np.int64)
 
-    def search(self, queries: np.ndarray, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+    @property
+    def live(self) -> np.ndarray:
+        if self._live is None:
+            self._live = np.flatnonzero(~self.deleted)
+        return self._live
+
+    def _native_delete(self) -> bool:
+        return self.hnsw_index is not None
+
+    def search(
+        self, queries, top_k: int = 10, allowed: Optional[np.ndarray] = None,
+        ef: int | None = None, nprobe: int | None = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # Returns (row ids, similarities), best first; `allowed` (sorted) restricts results to those row ids.
+        # Missing results are padded with id -1. `ef` / `nprobe` override the configured search effort.
+        if self.n_deleted and (allowed is not None or not self._native_delete()):
+            allowed = self.live if allowed is None else np.asarray(allowed)[~self.deleted[allowed]]
+        top_k = min(top_k, self.size - self.n_deleted)
+        if allowed is not None:
+            top_k = min(top_k, len(allowed))
+        if top_k <= 0 or (allowed is not None and len(allowed) <= self.exact_threshold):
+            return self.exact_search(queries, top_k, allowed)
+        if allowed is not None and self.size - len(allowed) <= self.MAX_OVERFETCH:
+            # Only a few rows excluded (e.g. tombstones without native deletes): over-fetch by that
+            # many and post-filter instead of passing a filter over the whole index
+            extra = self.size - len(allowed)
+            idxs, sims = self._engine_search(queries, min(self.size, top_k + extra), None, ef, nprobe)
+            allowed = np.asarray(allowed)
+            loc = np.minimum(np.searchsorted(allowed, idxs), len(allowed) - 1)
+            keep = allowed[loc] == idxs
+            out_idxs = np.full((idxs.shape[0], top_k), -1, dtype=np.int64)
+            out_sims = np.zeros((idxs.shape[0], top_k), dtype=float)
+            for row in range(idxs.shape[0]):
+                kept_idxs, kept_sims = idxs[row][keep[row]][:top_k], sims[row][keep[row]][:top_k]
+                out_idxs[row, : len(kept_idxs)] = kept_idxs
+                out_sims[row, : len(kept_sims)] = kept_sims
+            return out_idxs, out_sims
+        return self._engine_search(queries, top_k, allowed, ef, nprobe)
+
+    def _engine_search(self, queries, top_k: int, allowed, ef: int | None, nprobe: int | None) -> Tuple[np.ndarray, np.ndarray]:
         if self.faiss_index is not None:
-            sims, idxs = self.faiss_index.search(queries.astype("float32"), top_k)
+            selector, bitmap = None, None
+            if allowed is not None and 8 * len(allowed) >= self.size:
+                # Wide filters: a bitmap over all ids (size / 8 bytes) instead of hashing every allowed id.
+                # `bitmap` must outlive the search.
+                mask = np.zeros(self.size, dtype=bool)
+                mask[np.asarray(allowed, dtype=np.int64)] = True
+                bitmap = np.packbits(mask, bitorder="little")
+                selector = self.faiss.IDSelectorBitmap(self.size, self.faiss.swig_ptr(bitmap))
+            elif allowed is not None:
+                selector = self.faiss.IDSelectorBatch(np.asarray(allowed, dtype="int64"))
+            params = self._search_params(selector, ef, nprobe)
+            sims, idxs = self.faiss_index.search(self._unit(self._dense(queries)), top_k, params=params)
+            if self.rescore:
+                return self._rescore(queries, idxs)
             return idxs, sims
         if self.hnsw_index is not None:
-            idxs, sims = self.hnsw_index.knn_query(queries.astype("float32"), k=top_k)
-            return idxs, 1.0 - sims  # hnswlib returns distances
-        # Brute force cosine sim
+            filter_fn = None
+            if allowed is not None:
+                mask = np.zeros(self.size, dtype=bool)
+                mask[np.asarray(allowed, dtype=np.int64)] = True
+                filter_fn = lambda i: bool(mask[i])
+            if ef is None or ef == self.ef_search:
+                idxs, dists = self.hnsw_index.knn_query(self._dense(queries), k=top_k, filter=filter_fn)
+            else:
+                # hnswlib's ef is index-wide; concurrent default-ef queries may briefly see the override
+                with self._ef_lock:
+                    self.hnsw_index.set_ef(max(ef, top_k))
+                    try:
+                        idxs, dists = self.hnsw_index.knn_query(self._dense(queries), k=top_k, filter=filter_fn)
+                    finally:
+                        self.hnsw_index.set_ef(self.ef_search)
+            return idxs.astype(np.int64), 1.0 - dists  # hnswlib returns distances
+        return self.exact_search(queries, top_k, allowed)
+
+    def search_labels(self, queries, top_k: int = 10, allowed: Optional[np.ndarray] = None, **kwargs) -> Tuple[List[List[str]], np.ndarray]:
+        # search() with rows mapped back to their labels; padding is dropped
+        if self.labels is None:
+            raise ValueError("AnnIndex has no labels")
+        idxs, sims = self.search(queries, top_k, allowed, **kwargs)
+        return [self.labels[row[row >= 0]].tolist() for row in idxs], sims
+
+    def _search_params(self, selector, ef: int | None = None, nprobe: int | None = None):
+        # Filtered searches must pass the index's own parameter type or FAISS ignores nprobe/efSearch
+        if hasattr(self.faiss_index, "hnsw"):
+            return self.faiss.SearchParametersHNSW(sel=selector, efSearch=ef or self.faiss_index.hnsw.efSearch)
+        if hasattr(self.faiss_index, "nprobe"):
+            return self.faiss.SearchParametersIVF(sel=selector, nprobe=nprobe or self.faiss_index.nprobe)
+        return None if selector is None else self.faiss.SearchParameters(sel=selector)
+
+    def _rescore(self, queries, idxs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # PQ distances are coarse; recompute the returned candidates' similarities from `items` and re-sort
+        queries = self._unit(self._dense(queries))
+        out_idxs = np.full(idxs.shape, -1, dtype=np.int64)
+        out_sims = np.zeros(idxs.shape, dtype=float)
+        for row in range(idxs.shape[0]):
+            ids = idxs[row][idxs[row] >= 0]
+            sims = np.asarray(self.items[ids] @ queries[row][:, None]).ravel() / (self.item_norms[ids] + 1e-9)
+            order = np.argsort(-sims, kind="stable")
+            out_idxs[row, : len(ids)] = ids[order]
+            out_sims[row, : len(ids)] = sims[order]
+        return out_idxs, out_sims
+
+    def exact_search(self, queries, top_k: int = 10, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
         items = self._get_items_matrix()
-        if items is None or items.shape[0] == 0:
-            return np.zeros((queries.shape[0], 0), dtype=int), np.zeros((queries.shape[0], 0), dtype=float)
-        queries_norm = queries / (np.linalg.norm(queries, axis=1, keepdims=True) + 1e-9)
-        items_norm = items / (np.linalg.norm(items, axis=1, keepdims=True) + 1e-9)
-        sims = queries_norm @ items_norm.T
-        idxs = np.argsort(-sims, axis=1)[:, :top_k]
-        sorted_sims = np.take_along_axis(sims, idxs, axis=1)
-        return idxs, sorted_sims
-
-    def _get_items_matrix(self) -> Optional[np.ndarray]:
-        # Placeholder - this wrapper is used by higher-level code which can override this
-        return None
\ No newline at end of file
+        n_queries = queries.shape[0]
+        if items is None or items.shape[0] == 0 or top_k <= 0:
+            return np.zeros((n_queries, 0), dtype=np.int64), np.zeros((n_queries, 0), dtype=float)
+        if allowed is None and self.n_deleted:
+            allowed = self.live
+        rows = np.arange(items.shape[0]) if allowed is None else np.asarray(allowed, dtype=np.int64)
+        subset = items if allowed is None else items[rows]
+        if sparse.issparse(queries):
+            query_norms = np.sqrt(np.asarray(queries.multiply(queries).sum(axis=1), dtype=float).ravel())
+        else:
+            query_norms = np.linalg.norm(queries, axis=1)
+        sims = subset @ queries.T
+        sims = (sims.toarray() if sparse.issparse(sims) else np.asarray(sims)).T
+        sims = sims / (np.outer(query_norms, self.item_norms[rows]) + 1e-9)
+        top_k = min(top_k, sims.shape[1])
+        part = np.argpartition(-sims, top_k - 1, axis=1)[:, :top_k]
+        order = np.take_along_axis(part, np.argsort(-np.take_along_axis(sims, part, axis=1), axis=1), axis=1)
+        return rows[order], np.take_along_axis(sims, order, axis=1)
+
+    def recall_at_k(self, queries, top_k: int = 10, allowed: Optional[np.ndarray] = None) -> float:
+        # Fraction of the exact top-k neighbours that the configured engine also returns
+        approx, _ = self.search(queries, top_k, allowed)
+        exact, _ = self.exact_search(queries, top_k, allowed)
+        if exact.size == 0:
+            return 1.0
+        hits = sum(len(set(a.tolist()) & set(e.tolist())) for a, e in zip(approx, exact))
+        return hits / exact.size
+
+    def _config(self) -> Dict[str, object]:
+        # Build-time settings a saved engine must match; search-time ones (nprobe, ef_search) are re-applied
+        return {
+            "dim": self.dim, "engine": self.engine, "index_type": self.index_type, "nlist": self.nlist,
+            "pq_m": self.pq_m, "pq_bits": self.pq_bits, "hnsw_m": self.hnsw_m, "ef_construction": self.ef_construction,
+        }
+
+    def save(self, path: str) -> None:
+        # <path>/{meta.json, norms.npy, deleted.npy, labels.npy, index.faiss | index.hnsw}; meta.json goes last
+        os.makedirs(path, exist_ok=True)
+        kind = "faiss" if self.faiss_index is not None else "hnsw" if self.hnsw_index is not None else "exact"
+        np.save(os.path.join(path, "norms.npy"), np.ascontiguousarray(self.item_norms))
+        np.save(os.path.join(path, "deleted.npy"), self.deleted)
+        if self.labels is not None:
+            np.save(os.path.join(path, "labels.npy"), self.labels)
+        if kind == "faiss":
+            self.faiss.write_index(self.faiss_index, os.path.join(path, "index.faiss"))
+        elif kind == "hnsw":
+            self.hnsw_index.save_index(os.path.join(path, "index.hnsw"))
+        meta = {"format_version": self.FORMAT_VERSION, "kind": kind, "size": self.size, "rescore": self.rescore, **self._config()}
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    def load(self, path: str, items, mmap: bool = False) -> bool:
+        # Attach a saved engine to `items` (the matrix it was built from). Returns False, leaving the index
+        # untouched, when the files are missing or were built with other settings; callers then build().
+        # mmap=True maps FAISS indexes read-only from disk; the first add() copies it into memory.
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if (
+            meta.get("format_version") != self.FORMAT_VERSION
+            or meta["size"] != items.shape[0]
+            or {k: meta.get(k) for k in self._config()} != self._config()
+            or (meta["kind"] == "faiss" and self.faiss is None)
+            or (meta["kind"] == "hnsw" and self.hnswlib is None)
+        ):
+            return False
+        if meta["kind"] == "faiss":
+            file = os.path.join(path, "index.faiss")
+            self.faiss_index, self.read_only = self._read_faiss(file, mmap), mmap
+            self._mapped_file = file if mmap else None
+        elif meta["kind"] == "hnsw":
+            index = self.hnswlib.Index(space='cosine', dim=self.dim)
+            index.load_index(os.path.join(path, "index.hnsw"), max_elements=meta["size"])
+            index.set_ef(self.ef_search)
+            self.hnsw_index = index
+        labels_path = os.path.join(path, "labels.npy")
+        self.items = items
+        self.item_norms = np.load(os.path.join(path, "norms.npy"))
+        self.labels = np.load(labels_path) if os.path.exists(labels_path) else None
+        self.deleted = np.load(os.path.join(path, "deleted.npy"))
+        self.n_deleted, self._live, self._label_rows = int(self.deleted.sum()), None, None
+        self.rescore = bool(meta["rescore"])
+        return True
+
+    def _read_faiss(self, file: str, mmap: bool):
+        if mmap:
+            index = self.faiss.read_index(file, self.faiss.IO_FLAG_MMAP | self.faiss.IO_FLAG_READ_ONLY)
+        else:
+            index = self.faiss.read_index(file)
+        if hasattr(index, "nprobe"):
+            index.nprobe = min(self.nprobe, index.nlist)
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = self.ef_search
+        return index
+
+    def engine_nbytes(self) -> int:
+        # Memory held by the engine on top of `items`
+        if self.faiss_index is not None:
+            return int(self.faiss.serialize_index(self.faiss_index).nbytes)
+        if self.hnsw_index is not None:
+            # hnswlib keeps float32 vectors plus ~2*M int32 links per element on layer 0
+            return int(self.hnsw_index.get_current_count() * (4 * self.dim + 8 * self.hnsw_m + 16))
+        return 0
+
+    def _norms(self, vectors) -> np.ndarray:
+        if sparse.issparse(vectors):
+            return np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1), dtype=float).ravel())
+        if isinstance(vectors, QuantizedMatrix):
+            return vectors.norms()
+        return np.linalg.norm(vectors, axis=1)
+
+    def _dense(self, vectors) -> np.ndarray:
+        if isinstance(vectors, QuantizedMatrix):
+            return vectors.dequantize()
+        if sparse.issparse(vectors):
+            vectors = vectors.toarray()
+        return np.ascontiguousarray(vectors, dtype="float32")
+
+    def _unit(self, vectors: np.ndarray) -> np.ndarray:
+        return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-9)
+
+    def _get_items_matrix(self):
+        return self.items
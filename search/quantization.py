@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from typing import Tuple
+import numpy as np
+
+
+def quantize_int8(vectors: np.ndarray, scale: np.ndarray | None = None) -> Tuple[np.ndarray, np.ndarray]:
+    # Symmetric per-dimension int8 codes: x ~= codes * scale. Pass `scale` to encode new rows
+    # against an existing codebook (values outside its range are clipped).
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if scale is None:
+        scale = np.abs(vectors).max(axis=0) / 127.0 if len(vectors) else np.ones(vectors.shape[1], dtype=np.float32)
+        scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+    return codes, scale
+
+
+class QuantizedMatrix:
+    # Row-major int8 codes (typically memory-mapped) that behave like a dense float matrix for the
+    # operations AnnIndex needs: row selection, products with float queries and row norms.
+    CHUNK_ROWS = 65536
+
+    def __init__(self, codes: np.ndarray, scale: np.ndarray) -> None:
+        self.codes = codes
+        self.scale = np.asarray(scale, dtype=np.float32)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.codes.shape
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.scale.nbytes)
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    def __getitem__(self, rows) -> "QuantizedMatrix":
+        return QuantizedMatrix(self.codes[rows], self.scale)
+
+    def dequantize(self) -> np.ndarray:
+        return self.codes.astype(np.float32) * self.scale
+
+    def __matmul__(self, other: np.ndarray) -> np.ndarray:
+        # x . q == codes . (scale * q); converted chunk by chunk so no float copy of the codes is kept
+        other = np.asarray(other, dtype=np.float32) * self.scale[:, None]
+        out = np.empty((self.codes.shape[0], other.shape[1]), dtype=np.float32)
+        for start in range(0, self.codes.shape[0], self.CHUNK_ROWS):
+            out[start:start + self.CHUNK_ROWS] = self.codes[start:start + self.CHUNK_ROWS].astype(np.float32) @ other
+        return out
+
+    def norms(self) -> np.ndarray:
+        out = np.empty(self.codes.shape[0], dtype=np.float32)
+        for start in range(0, self.codes.shape[0], self.CHUNK_ROWS):
+            out[start:start + self.CHUNK_ROWS] = np.linalg.norm(self[start:start + self.CHUNK_ROWS].dequantize(), axis=1)
+        return out
+
+    def append(self, codes: np.ndarray) -> "QuantizedMatrix":
+        return QuantizedMatrix(np.concatenate([self.codes, codes]), self.scale)
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Optional
+import hashlib
+import shutil
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from data_pipeline.schemas import InteractionEvent
+from recommender.hybrid import HybridRecommender
+from storage.artifacts import ArtifactBundle
+from storage.interaction_log import InteractionLog
+
+
+class InteractionIngestor:
+    # Durable log + in-memory incremental collaborative updates + periodic compaction into a snapshot.
+    # Catalog updates are logged too, so a reloaded model replays them before the interactions.
+    # Updates reach the API process's recommender, i.e. the thread scoring executor.
+    def __init__(self, config: dict | None = None) -> None:
+        cfg = (config or {}).get("interactions", {})
+        self.log = InteractionLog(cfg.get("log_path", "data/interactions/events.jsonl"))
+        self.catalog_log = InteractionLog((config or {}).get("catalog", {}).get("log_path", "data/catalog/updates.jsonl"))
+        self.snapshot_dir = cfg.get("snapshot_dir", "data/interactions/snapshots")
+        self.compact_every_events = int(cfg.get("compact_every_events", 100000))
+        self.compact_interval_seconds = float(cfg.get("compact_interval_seconds", 300))
+        self.recommender: Optional[HybridRecommender] = None
+        self.events_since_compaction = 0
+        self._last_compaction = time.monotonic()
+        self._compacting = False
+        self._lock = threading.Lock()
+
+    def _catalog_fingerprint(self) -> str:
+        collab = self.recommender.collab_model
+        digest = hashlib.sha1("\n".join(collab.book_ids).encode("utf-8"))
+        if collab.catalog_items is not None:
+            digest.update(np.ascontiguousarray(collab.catalog_items, dtype=np.int64).tobytes())
+        return digest.hexdigest()
+
+    def start(self, recommender: HybridRecommender, on_ready: Optional[Callable[[], Any]] = None) -> Any:
+        # Restore the latest snapshot, then replay events logged after it. A snapshot saved against
+        # another catalog is remapped by book_id rather than dropped: the log before it is gone. `on_ready`
+        # (a model swap) runs under the same lock, so no acknowledged event misses the new model.
+        with self._lock:
+            self.recommender = recommender
+            collab = recommender.collab_model
+            bundle = ArtifactBundle.open_current(self.snapshot_dir)
+            events = self.log.replay()
+            # Catalog first: snapshots and events refer to the books it added
+            for update in self.catalog_log.replay():
+                self._apply_catalog(recommender, update["upserts"], update["deletes"])
+            with recommender.update_lock:
+                if bundle is not None and bundle.manifest.get("catalog") == self._catalog_fingerprint():
+                    collab.load(bundle, recommender.books)
+                elif bundle is not None:
+                    collab.restore(bundle)
+                collab.partial_fit((e["user_id"], e["book_id"], e.get("event_strength", 1.0)) for e in events)
+                if bundle is not None or events:
+                    recommender.interactions_changed()
+            self.events_since_compaction = len(events)
+            self._last_compaction = time.monotonic()
+            return on_ready() if on_ready is not None else None
+
+    def ingest(self, events: List[InteractionEvent]) -> int:
+        if self.recommender is None:
+            raise ValueError("Recommender not loaded")
+        with self._lock:
+            # Durable first: an acknowledged event survives a crash and is replayed at startup
+            self.log.append([e.model_dump() for e in events])
+            # Catalog upserts also grow the collaborative item space
+            with self.recommender.update_lock:
+                applied = self.recommender.collab_model.partial_fit(
+                    (e.user_id, e.book_id, e.event_strength) for e in events
+                )
+                if applied:
+                    self.recommender.interactions_changed()
+            self.events_since_compaction += len(events)
+            due = self.events_since_compaction >= self.compact_every_events or (
+                time.monotonic() - self._last_compaction >= self.compact_interval_seconds
+            )
+            if due and not self._compacting:
+                self._compacting = True
+                threading.Thread(target=self.compact, name="interaction-compaction", daemon=True).start()
+        return applied
+
+    def update_catalog(self, upserts: List[dict], deletes: List[str]) -> Dict[str, int]:
+        if self.recommender is None:
+            raise ValueError("Recommender not loaded")
+        with self._lock:
+            # Applied before it is logged, so an update the model rejects is never replayed; it is
+            # acknowledged only once durable
+            counts = self._apply_catalog(self.recommender, upserts, deletes)
+            if upserts or deletes:
+                self.catalog_log.append([{"upserts": upserts, "deletes": deletes}])
+            return {**counts, "catalog_size": self.recommender.live_count()}
+
+    @staticmethod
+    def _apply_catalog(recommender: HybridRecommender, upserts: List[dict], deletes: List[str]) -> Dict[str, int]:
+        counts = {"added": 0, "updated": 0}
+        if upserts:
+            counts = recommender.upsert_books(pd.DataFrame(upserts))
+        return {**counts, "deleted": recommender.delete_books(deletes) if deletes else 0}
+
+    def compact(self) -> None:
+        # The rebuild and the snapshot write run on a detached copy without any lock; the locks are
+        # only held to take that copy and to publish it, so ingestion and scoring keep going meanwhile
+        try:
+            with self._lock:
+                recommender = self.recommender
+                with recommender.update_lock:
+                    detached = recommender.collab_model.detach()
+                    fingerprint = self._catalog_fingerprint()
+                logged, folded = self.log.size(), self.events_since_compaction
+            detached.compact()
+            bundle = ArtifactBundle.create(self.snapshot_dir)
+            detached.save(bundle)
+            with self._lock:
+                if self.recommender is not recommender:
+                    # A new model was started meanwhile and replayed the whole log itself
+                    shutil.rmtree(bundle.path, ignore_errors=True)
+                    return
+                bundle.commit({"catalog": fingerprint, "users": len(detached.user_ids)})
+                with recommender.update_lock:
+                    recommender.collab_model.adopt(detached)
+                    recommender.interactions_changed()
+                # The snapshot now covers every event logged before the copy
+                self.log.truncate(logged)
+                self.events_since_compaction -= folded
+                self._last_compaction = time.monotonic()
+            ArtifactBundle.prune(self.snapshot_dir, keep=2)
+        finally:
+            self._compacting = False
@@ -1,11 +1,43 @@
 from fastapi import FastAPI
 from fastapi import HTTPException
-from typing import List, Optional
+from fastapi import Query
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, Response
+from typing import Any, List, Optional
+import json
 import os
+import time
+import pandas as pd
 import yaml
 
-from data_pipeline.schemas import RecommendationRequest, RecommendationResponse, RecommendedBook
+from data_pipeline.schemas import (
+    RESULT_FIELDS,
+    BatchRecommendationRequest,
+    BatchRecommendationResponse,
+    CatalogUpdate,
+    CatalogUpdateAck,
+    InteractionAck,
+    InteractionBatch,
+    RecommendationRequest,
+    RecommendationResponse,
+    RecommendedBook,
+    SuggestResponse,
+)
+from monitoring.metrics import REGISTRY, observe_trace
+from monitoring.trace import Trace
 from recommender.hybrid import HybridRecommender
+from recommender.sharding import ShardedRecommender
+from recommender.suggest import SUGGEST_FIELDS
+from services.api.ingestion import InteractionIngestor
+from services.api.reload import ModelReloader
+from services.api.scoring import Overloaded, ScoringExecutor
+from storage.recommendation_cache import RecommendationCache
+
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None
 
 
 def load_config(config_path: str = "config/config.yaml") -> dict:
@@ -20,28 +52,281 @@ app = FastAPI(title="Global Book Recommender", version="0.1.0")
 # Global recommender instance (simple in-memory demo)
 CONFIG = load_config()
 RECOMMENDER: Optional[HybridRecommender] = None
+# sharding.shards > 1 serves /recommend by scatter-gather over shard processes (recommender/sharding.py);
+# interactions, suggest and reload need the single in-process model
+SHARDED = int(CONFIG.get("sharding", {}).get("shards", 0)) > 1
+CACHE = RecommendationCache(CONFIG)
+EXECUTOR = ScoringExecutor(CONFIG)
+# Created at startup (it creates the interaction log directory), and only for a single in-process model
+INGESTOR: Optional[InteractionIngestor] = None
+
+
+def _activate(recommender: HybridRecommender) -> Optional[HybridRecommender]:
+    # Called from the reload thread with a fully initialized model. The ingestor replays the event log
+    # into it and the swap happens under the ingestor's lock, so every acknowledged event reaches it.
+    # Process workers for it start before that lock is taken.
+    EXECUTOR.prepare(recommender)
+
+    def swap() -> Optional[HybridRecommender]:
+        global RECOMMENDER
+        previous = EXECUTOR.swap(recommender)
+        RECOMMENDER = recommender
+        return previous
+
+    return INGESTOR.start(recommender, on_ready=swap)
+
+
+def _drain(previous: HybridRecommender, timeout_seconds: float) -> None:
+    # Jobs already submitted to the old model finish on it; afterwards nothing references it
+    deadline = time.monotonic() + timeout_seconds
+    while EXECUTOR.in_flight(previous) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    EXECUTOR.retire(previous)
+
+
+RELOADER = ModelReloader(CONFIG, activate=_activate, drain=_drain)
+
+
+HTTP_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+)
+REGISTRY.callback(
+    "recommendation_cache_events_total", "Recommendation cache lookups by outcome", "counter", ("result",),
+    lambda: {(k,): v for k, v in CACHE.snapshot().items() if k != "local_entries"},
+)
+REGISTRY.callback(
+    "scoring_executor_requests_total", "Scoring executor submissions by outcome", "counter", ("result",),
+    lambda: {(k,): v for k, v in EXECUTOR.snapshot().items() if k in ("submitted", "coalesced", "rejected")},
+)
+REGISTRY.callback(
+    "scoring_executor_pending", "Scoring jobs running or queued", "gauge", (),
+    lambda: {(): EXECUTOR.snapshot()["pending"]},
+)
+
+
+def _project(results: List[RecommendedBook], request: RecommendationRequest) -> List[dict]:
+    # The first `limit` results as dicts holding only the requested fields
+    fields = request.fields or RESULT_FIELDS
+    return [{f: book.__dict__[f] for f in fields} for book in results[: max(1, request.limit)]]
+
+
+def _json(payload: Any) -> Response:
+    # Results are built by the recommender from trusted catalog columns, so they are serialized
+    # directly instead of being re-validated against response_model
+    if orjson is not None:
+        body = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    else:
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return Response(content=body, media_type="application/json")
+
+
+def _single_model_only() -> None:
+    if SHARDED:
+        raise HTTPException(status_code=501, detail="Not available with a sharded catalog")
+
+
+def _in_process_model_only() -> None:
+    # Online updates change this process's model; process-pool workers each hold their own copy
+    if EXECUTOR.kind == "process":
+        raise HTTPException(status_code=501, detail="Not available with api.executor: process")
+
+
+def _overloaded(e: Overloaded) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+async def _cache_io(method, *args):
+    # Redis calls run in the threadpool; the in-process tier alone is answered inline
+    if CACHE.blocking:
+        return await run_in_threadpool(method, *args)
+    return method(*args)
+
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route templates, not raw paths, keep label cardinality bounded
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(
+            time.perf_counter() - started, request.method, getattr(route, "path", "unmatched"), str(status)
+        )
 
 
 @app.on_event("startup")
 async def startup_event() -> None:
-    global RECOMMENDER
-    RECOMMENDER = HybridRecommender(CONFIG)
-    RECOMMENDER.initialize()
+    global RECOMMENDER, INGESTOR
+    RECOMMENDER = ShardedRecommender(CONFIG) if SHARDED else HybridRecommender(CONFIG)
+    source = RELOADER.source_fingerprint()
+    trace = Trace()
+    RECOMMENDER.initialize(trace)
+    observe_trace(trace, initialize=True)
+    if SHARDED:
+        EXECUTOR.start(RECOMMENDER)
+        return
+    if INGESTOR is None:
+        INGESTOR = InteractionIngestor(CONFIG)
+    INGESTOR.start(RECOMMENDER)
+    EXECUTOR.start(RECOMMENDER)
+    RELOADER.start(source)
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    RELOADER.stop()
+    EXECUTOR.shutdown()
+    if SHARDED and RECOMMENDER is not None:
+        RECOMMENDER.shutdown()
 
 
 @app.get("/health")
 async def health() -> dict:
-    return {"status": "ok"}
+    version = RECOMMENDER.model_version if RECOMMENDER is not None else None
+    return {"status": "ok", "model_version": version, "reload": RELOADER.snapshot()}
 
 
-@app.post("/recommend", response_model=RecommendationResponse)
-async def recommend(request: RecommendationRequest) -> RecommendationResponse:
+@app.post("/admin/reload", status_code=202)
+async def reload_model() -> dict:
+    # Rebuilds from the configured sources in the background; poll /health for the new model_version
+    _single_model_only()
     if RECOMMENDER is None:
         raise HTTPException(status_code=503, detail="Recommender not ready")
+    return {"started": RELOADER.trigger(), **RELOADER.snapshot()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/cache/stats")
+async def cache_stats() -> dict:
+    return CACHE.snapshot()
+
+
+@app.post("/recommend", response_model=RecommendationResponse)
+async def recommend(request: RecommendationRequest, debug: bool = False) -> Response:
+    # One model per request: its version keys the cache and labels the response even if a reload
+    # swaps RECOMMENDER meanwhile
+    recommender = RECOMMENDER
+    if recommender is None:
+        raise HTTPException(status_code=503, detail="Recommender not ready")
+    try:
+        if debug:
+            # Always computed (never served from or coalesced with the cache) so the breakdown is real
+            version = recommender.model_version
+            results, trace = await EXECUTOR.submit(
+                "recommend_traced", CACHE.scoring_request(request), on_result=lambda r: observe_trace(r[1]), recommender=recommender
+            )
+            info = {**trace.to_dict(), "cache": "bypass", "model_version": version}
+            return _json({
+                "recommendations": _project(results, request), "model_version": version, "debug": info,
+                "degraded": trace.degraded,
+            })
+        version = recommender.model_version
+        scoring, key, results = await _cache_io(CACHE.lookup, request, version)
+        degraded: List[str] = []
+        if results is None:
+            # Scoring runs in the executor; identical in-flight requests share one computation
+            results, trace = await EXECUTOR.submit(
+                "recommend_traced", scoring, key=key, on_result=lambda r: observe_trace(r[1]), recommender=recommender
+            )
+            degraded = trace.degraded
+            if not degraded:
+                # A budget-degraded list is served once, never cached in place of the full one
+                await _cache_io(CACHE.store, key, results)
+        return _json({
+            "recommendations": _project(results, request), "model_version": version, "debug": None, "degraded": degraded,
+        })
+    except Overloaded as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {e}")
+
+
+@app.post("/recommend/batch", response_model=BatchRecommendationResponse)
+async def recommend_batch(batch: BatchRecommendationRequest) -> Response:
+    recommender = RECOMMENDER
+    if recommender is None:
+        raise HTTPException(status_code=503, detail="Recommender not ready")
+    try:
+        version = recommender.model_version
+        results = await EXECUTOR.submit("recommend_batch", batch.requests, recommender=recommender)
+        return _json({"results": [
+            {"recommendations": _project(r, q), "model_version": version, "debug": None, "degraded": []}
+            for r, q in zip(results, batch.requests)
+        ]})
+    except Overloaded as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {e}")
+
+
+@app.get("/search/suggest", response_model=SuggestResponse)
+async def search_suggest(
+    q: str = Query(..., min_length=1, max_length=200),
+    fields: Optional[List[str]] = Query(None),
+    limit: int = Query(10, ge=1),
+) -> Response:
+    # Typeahead for titles (liked_books) and filter values; answered inline, a keystroke costs well
+    # under a millisecond
+    _single_model_only()
+    recommender = RECOMMENDER
+    if recommender is None or recommender.suggest_index is None:
+        raise HTTPException(status_code=503, detail="Recommender not ready")
+    unknown = [f for f in fields or [] if f not in SUGGEST_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown suggest fields: {', '.join(unknown)}")
+    return _json({"query": q, "suggestions": recommender.suggest_index.suggest(q, fields, limit)})
+
+
+@app.post("/interactions", response_model=InteractionAck)
+async def ingest_interactions(batch: InteractionBatch) -> InteractionAck:
+    _single_model_only()
+    _in_process_model_only()
+    if RECOMMENDER is None or INGESTOR is None:
+        raise HTTPException(status_code=503, detail="Recommender not ready")
+    try:
+        # fsync + model update are blocking; keep them off the event loop
+        applied = await run_in_threadpool(INGESTOR.ingest, batch.events)
+        return InteractionAck(accepted=len(batch.events), applied=applied)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {e}")
+
+
+@app.post("/catalog/books", response_model=CatalogUpdateAck)
+async def update_catalog(update: CatalogUpdate) -> CatalogUpdateAck:
+    # Like /interactions, changes reach this process's recommender, so the thread scoring executor
+    # only. The ingestor logs them for the next reload; a sharded catalog routes each book to its shard.
+    _in_process_model_only()
+    recommender = RECOMMENDER
+    if recommender is None:
+        raise HTTPException(status_code=503, detail="Recommender not ready")
+    upserts = [b.model_dump() for b in update.upserts]
+
+    def apply() -> CatalogUpdateAck:
+        if INGESTOR is not None:
+            return CatalogUpdateAck(**INGESTOR.update_catalog(upserts, update.deletes))
+        counts = {"added": 0, "updated": 0}
+        if upserts:
+            counts = recommender.upsert_books(pd.DataFrame(upserts))
+        deleted = recommender.delete_books(update.deletes) if update.deletes else 0
+        return CatalogUpdateAck(**counts, deleted=deleted, catalog_size=recommender.live_count())
+
     try:
-        results = RECOMMENDER.recommend(request)
-        return RecommendationResponse(recommendations=results)
+        return await run_in_threadpool(apply)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Internal error: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Internal error: {e}")
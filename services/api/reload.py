@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+import os
+import threading
+import time
+
+from data_pipeline.schemas import RecommendationRequest
+from monitoring.metrics import observe_trace
+from monitoring.trace import Trace
+from recommender.hybrid import HybridRecommender
+from storage.artifacts import ArtifactBundle
+
+
+def _build_bundle(config: dict, root: str) -> Tuple[str, Trace]:
+    # Runs in a child process: fit from the data files and write an artifact bundle under `root`
+    recommender = HybridRecommender({**config, "paths": {**config.get("paths", {}), "artifacts_dir": None}})
+    trace = Trace()
+    recommender.initialize(trace)
+    return recommender.save_artifacts(root), trace
+
+
+class ModelReloader:
+    # Loads a replacement HybridRecommender off the serving path and hands it to `activate` only once
+    # it is initialized and warmed up; `drain` then waits for the old model's in-flight jobs before it
+    # is released. One build at a time. A watcher thread triggers a reload when the model source
+    # changes: the CURRENT artifact bundle when paths.artifacts_dir is set, else the data files. The
+    # serving process only ever loads a bundle: without a current one, a child process fits the data
+    # files into a new bundle under reload.build_dir first, so the fit does not compete with requests.
+    def __init__(
+        self,
+        config: dict,
+        activate: Callable[[HybridRecommender], Optional[HybridRecommender]],
+        drain: Callable[[HybridRecommender, float], None],
+    ) -> None:
+        self.config = config or {}
+        cfg = self.config.get("reload", {})
+        self.poll_seconds = float(cfg.get("poll_seconds", 30))  # 0 disables watching
+        self.drain_timeout_seconds = float(cfg.get("drain_timeout_seconds", 30))
+        self.build_dir = str(cfg.get("build_dir", "data/reload"))
+        self.activate = activate
+        self.drain = drain
+        self.stats: Dict[str, Any] = {"state": "idle", "reloads": 0, "failures": 0, "last_error": None, "last_reload_s": None}
+        self._lock = threading.Lock()
+        self._source: Tuple | None = None
+        self._stop = threading.Event()
+        self._watcher: threading.Thread | None = None
+
+    def source_fingerprint(self) -> Tuple:
+        # Identifies what a fresh initialize() would load
+        paths = self.config.get("paths", {})
+        artifacts_dir = paths.get("artifacts_dir")
+        bundle = ArtifactBundle.open_current(artifacts_dir) if artifacts_dir else None
+        if bundle is not None:
+            return ("bundle", bundle.version)
+        files = [paths.get("books_parquet"), paths.get("books_csv"), paths.get("interactions_csv")]
+        return tuple((f, os.path.getmtime(f)) for f in files if f and os.path.exists(f))
+
+    def start(self, loaded: Tuple | None = None) -> None:
+        # `loaded`: fingerprint of the source the serving model was built from
+        self.stop()
+        self._source = loaded if loaded is not None else self.source_fingerprint()
+        if self.poll_seconds > 0:
+            self._stop = threading.Event()
+            self._watcher = threading.Thread(target=self._watch, args=(self._stop,), name="model-watch", daemon=True)
+            self._watcher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._watcher = None
+
+    def _watch(self, stop: threading.Event) -> None:
+        while not stop.wait(self.poll_seconds):
+            try:
+                if self.source_fingerprint() != self._source:
+                    self.trigger()
+            except OSError:
+                continue  # a file mid-replace; retry on the next poll
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+    def trigger(self) -> bool:
+        # Start a background build; False when one is already running
+        with self._lock:
+            if self.stats["state"] != "idle":
+                return False
+            self.stats["state"] = "building"
+        threading.Thread(target=self.reload, name="model-reload", daemon=True).start()
+        return True
+
+    def reload(self) -> None:
+        started = time.monotonic()
+        source = self._source
+        try:
+            self.stats["state"] = "building"
+            # Taken before the build: a source that changes again meanwhile triggers another reload
+            source = self.source_fingerprint()
+            config = self.config
+            if source[:1] != ("bundle",):
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    _, trace = pool.submit(_build_bundle, self.config, self.build_dir).result()
+                observe_trace(trace, initialize=True)
+                config = {**self.config, "paths": {**self.config.get("paths", {}), "artifacts_dir": self.build_dir}}
+            recommender = HybridRecommender(config)
+            trace = Trace()
+            recommender.initialize(trace)
+            observe_trace(trace, initialize=True)
+            self._warm_up(recommender)
+            self.stats["state"] = "draining"
+            previous = self.activate(recommender)
+            self.stats["reloads"] += 1
+            self.stats["last_reload_s"] = time.monotonic() - started
+            if previous is not None:
+                self.drain(previous, self.drain_timeout_seconds)
+            ArtifactBundle.prune(self.build_dir, keep=2)
+        except Exception as e:
+            # The serving model is untouched
+            self.stats["failures"] += 1
+            self.stats["last_error"] = f"{type(e).__name__}: {e}"
+        finally:
+            # A failed source is not retried by the watcher until it changes again
+            self._source = source
+            self.stats["state"] = "idle"
+
+    @staticmethod
+    def _warm_up(recommender: HybridRecommender) -> None:
+        # Touch the memory-mapped artifacts and lazy indexes before the model takes traffic
+        titles = recommender.catalog.titles[:3]
+        recommender.recommend(RecommendationRequest(limit=10))
+        recommender.recommend(RecommendationRequest(liked_books=titles, limit=10))
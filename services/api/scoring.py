@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+import asyncio
+import os
+
+from recommender.hybrid import HybridRecommender
+
+
+# Per-process recommender used when scoring runs in a process pool
+_WORKER_RECOMMENDER: Optional[HybridRecommender] = None
+
+
+def _init_worker(config: dict) -> None:
+    global _WORKER_RECOMMENDER
+    _WORKER_RECOMMENDER = HybridRecommender(config)
+    _WORKER_RECOMMENDER.initialize()
+
+
+def _call_worker(method: str, arg: Any) -> Any:
+    return getattr(_WORKER_RECOMMENDER, method)(arg)
+
+
+def _worker_ready() -> bool:
+    return _WORKER_RECOMMENDER is not None
+
+
+class Overloaded(RuntimeError):
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("Scoring capacity exceeded")
+        self.retry_after = retry_after
+
+
+class ScoringExecutor:
+    # Runs CPU-bound scoring off the event loop, coalesces identical in-flight requests
+    # and sheds load once the bounded queue is full
+    def __init__(self, config: dict | None = None) -> None:
+        self.config = config or {}
+        api = self.config.get("api", {})
+        self.kind = str(api.get("executor", "thread"))
+        if int(self.config.get("sharding", {}).get("shards", 0)) > 1:
+            # Shards already run in their own processes; threads only wait on the scatter-gather
+            self.kind = "thread"
+        self.max_workers = int(api.get("max_workers", os.cpu_count() or 4))
+        self.max_queue = int(api.get("max_queue", 64))
+        self.retry_after_seconds = int(api.get("retry_after_seconds", 1))
+        self.recommender: Optional[HybridRecommender] = None
+        self.pool: Optional[Executor] = None
+        self.pending = 0
+        self.stats: Dict[str, int] = {"submitted": 0, "coalesced": 0, "rejected": 0}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Jobs running or queued per recommender (id), and process pools of swapped-out models
+        self._model_pending: Dict[int, int] = {}
+        self._retired: Dict[int, Executor] = {}
+        # Process mode: a warmed pool for the model about to be swapped in (see prepare)
+        self._prepared: Optional[Tuple[HybridRecommender, Executor]] = None
+
+    def start(self, recommender: HybridRecommender) -> None:
+        self.shutdown()
+        self.recommender = recommender
+        self.pool = self._new_pool(recommender)
+
+    def _new_pool(self, recommender: HybridRecommender) -> Executor:
+        if self.kind == "process":
+            # Workers build their own copy of `recommender` from its config, so they load the same source
+            # (e.g. the bundle a reload built); with a bundle they share its mmapped pages
+            return ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker, initargs=(recommender.config,))
+        # NumPy/SciPy release the GIL in the heavy kernels, so threads scale reasonably
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="scoring")
+
+    def prepare(self, recommender: HybridRecommender) -> None:
+        # Process mode: start and warm the pool for `recommender` ahead of swap(), outside any lock the
+        # swap runs under, so the first requests after it do not pay for worker start-up either
+        if self.kind == "process" and self.pool is not None:
+            pool = self._new_pool(recommender)
+            for future in [pool.submit(_worker_ready) for _ in range(self.max_workers)]:
+                future.result()
+            self._prepared = (recommender, pool)
+
+    def swap(self, recommender: HybridRecommender) -> Optional[HybridRecommender]:
+        # Route new submissions to `recommender` and return the previous one; its queued and running
+        # jobs finish on it (see in_flight/retire)
+        previous = self.recommender
+        if self.kind == "process" and self.pool is not None:
+            if self._prepared is None or self._prepared[0] is not recommender:
+                self.prepare(recommender)
+            _, pool = self._prepared
+            self._prepared = None
+            self._retired[id(previous)] = self.pool
+            self.pool = pool
+        self.recommender = recommender
+        return previous
+
+    def in_flight(self, recommender: HybridRecommender) -> int:
+        return self._model_pending.get(id(recommender), 0)
+
+    def retire(self, recommender: HybridRecommender) -> None:
+        # Release a drained, swapped-out model's process pool
+        pool = self._retired.pop(id(recommender), None)
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def shutdown(self) -> None:
+        prepared = [self._prepared[1]] if self._prepared is not None else []
+        for pool in [self.pool, *self._retired.values(), *prepared]:
+            if pool is not None:
+                pool.shutdown(wait=False)
+        self.pool = None
+        self._retired, self._prepared = {}, None
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "pending": self.pending, "capacity": self.max_workers + self.max_queue}
+
+    async def submit(
+        self,
+        method: str,
+        arg: Any,
+        key: Optional[str] = None,
+        on_result: Optional[Callable[[Any], None]] = None,
+        recommender: Optional[HybridRecommender] = None,
+    ) -> Any:
+        # Must be called from the event loop thread; all bookkeeping below relies on that.
+        # `on_result` runs once per computation, not once per coalesced caller. Passing the
+        # `recommender` the caller read its model version from pins the job to that model across a swap.
+        if key is not None and key in self._inflight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self._inflight[key])
+        if self.pool is None:
+            raise RuntimeError("Scoring executor not started")
+        if self.pending >= self.max_workers + self.max_queue:
+            self.stats["rejected"] += 1
+            raise Overloaded(self.retry_after_seconds)
+
+        loop = asyncio.get_running_loop()
+        recommender = recommender or self.recommender
+        pool = self._retired.get(id(recommender), self.pool)
+        if self.kind == "process":
+            future = loop.run_in_executor(pool, _call_worker, method, arg)
+        else:
+            future = loop.run_in_executor(pool, getattr(recommender, method), arg)
+        model = id(recommender)
+        self._model_pending[model] = self._model_pending.get(model, 0) + 1
+        self.pending += 1
+        self.stats["submitted"] += 1
+        if key is not None:
+            self._inflight[key] = future
+
+        def _done(_: asyncio.Future) -> None:
+            self.pending -= 1
+            left = self._model_pending.pop(model) - 1
+            if left:
+                self._model_pending[model] = left
+            if key is not None and self._inflight.get(key) is future:
+                del self._inflight[key]
+            if on_result is not None and not future.cancelled() and future.exception() is None:
+                on_result(future.result())
+
+        future.add_done_callback(_done)
+        # Shielded so a disconnecting client does not cancel work other callers are waiting on
+        return await asyncio.shield(future)
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+import json
+import os
+import shutil
+import time
+import uuid
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+class ArtifactBundle:
+    # On-disk layout: <root>/<version>/{manifest.json, *.npy, *.json} plus <root>/CURRENT
+    FORMAT_VERSION = 1
+    MANIFEST = "manifest.json"
+    CURRENT = "CURRENT"
+
+    def __init__(self, path: str, version: str, manifest: Dict[str, Any] | None = None) -> None:
+        self.path = path
+        self.version = version
+        self.manifest: Dict[str, Any] = manifest or {}
+
+    @classmethod
+    def create(cls, root: str) -> "ArtifactBundle":
+        version = time.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        staging = os.path.join(root, f".{version}.tmp")
+        os.makedirs(staging, exist_ok=True)
+        return cls(staging, version)
+
+    @classmethod
+    def open_current(cls, root: str) -> Optional["ArtifactBundle"]:
+        pointer = os.path.join(root, cls.CURRENT)
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer, "r", encoding="utf-8") as f:
+            version = f.read().strip()
+        return cls.open(os.path.join(root, version))
+
+    @classmethod
+    def open(cls, path: str) -> Optional["ArtifactBundle"]:
+        manifest_path = os.path.join(path, cls.MANIFEST)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != cls.FORMAT_VERSION:
+            return None
+        return cls(path, manifest["version"], manifest)
+
+    def commit(self, metadata: Dict[str, Any] | None = None) -> str:
+        # Publish the staged bundle: write the manifest, move it into place, then flip CURRENT
+        manifest = {"format_version": self.FORMAT_VERSION, "version": self.version, "created_at": time.time()}
+        manifest.update(metadata or {})
+        self.save_json(self.MANIFEST, manifest)
+        root = os.path.dirname(self.path)
+        final = os.path.join(root, self.version)
+        if os.path.exists(final):
+            shutil.rmtree(final)
+        os.replace(self.path, final)
+        self.path, self.manifest = final, manifest
+        tmp_pointer = os.path.join(root, f".{self.CURRENT}.tmp")
+        with open(tmp_pointer, "w", encoding="utf-8") as f:
+            f.write(self.version)
+        os.replace(tmp_pointer, os.path.join(root, self.CURRENT))
+        return self.version
+
+    @classmethod
+    def prune(cls, root: str, keep: int = 2) -> None:
+        # Drop all but the newest `keep` committed versions, never the current one
+        if not os.path.isdir(root):
+            return
+        current = cls.open_current(root)
+        versions = sorted(
+            d for d in os.listdir(root) if not d.startswith(".") and os.path.isdir(os.path.join(root, d))
+        )
+        for version in versions[:-keep] if keep > 0 else versions:
+            if current is None or version != current.version:
+                shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def path_for(self, name: str) -> str:
+        # Location for components that manage their own files (e.g. a saved ANN engine directory)
+        return self._file(name)
+
+    def has(self, name: str) -> bool:
+        return os.path.exists(self._file(name)) or os.path.exists(self._file(f"{name}.npy"))
+
+    def save_array(self, name: str, array: np.ndarray) -> None:
+        np.save(self._file(f"{name}.npy"), np.ascontiguousarray(array))
+
+    def load_array(self, name: str, mmap: bool = True) -> np.ndarray:
+        # Read-only memory maps let every worker process share the same page cache
+        return np.load(self._file(f"{name}.npy"), mmap_mode="r" if mmap else None)
+
+    def save_csr(self, name: str, matrix: sparse.csr_matrix) -> None:
+        matrix = sparse.csr_matrix(matrix)
+        self.save_array(f"{name}.data", matrix.data)
+        self.save_array(f"{name}.indices", matrix.indices)
+        self.save_array(f"{name}.indptr", matrix.indptr)
+        self.save_json(f"{name}.shape.json", list(matrix.shape))
+
+    def load_csr(self, name: str, mmap: bool = True) -> sparse.csr_matrix:
+        shape = tuple(self.load_json(f"{name}.shape.json"))
+        arrays = [self.load_array(f"{name}.{part}", mmap) for part in ("data", "indices", "indptr")]
+        matrix = sparse.csr_matrix(shape, dtype=arrays[0].dtype)
+        # Assign the buffers directly so scipy does not copy the memory-mapped arrays
+        matrix.data, matrix.indices, matrix.indptr = arrays
+        return matrix
+
+    def save_json(self, name: str, value: Any) -> None:
+        with open(self._file(name), "w", encoding="utf-8") as f:
+            json.dump(value, f)
+
+    def load_json(self, name: str) -> Any:
+        with open(self._file(name), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_frame(self, name: str, df: pd.DataFrame) -> None:
+        # One .npy per column: numeric columns as is (memory-mapped on load), text columns as one
+        # NUL-separated UTF-8 buffer
+        columns = []
+        for col in df.columns:
+            values = df[col]
+            if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+                self.save_array(f"{name}.{col}", values.to_numpy())
+                columns.append([str(col), "array"])
+            else:
+                text = "\0".join(v.replace("\0", "") for v in values.fillna("").astype(str).tolist())
+                self.save_array(f"{name}.{col}", np.frombuffer(text.encode("utf-8"), dtype=np.uint8))
+                columns.append([str(col), "text"])
+        self.save_json(f"{name}.frame.json", {"rows": len(df), "columns": columns})
+
+    def load_frame(self, name: str) -> pd.DataFrame:
+        meta = self.load_json(f"{name}.frame.json")
+        data = {}
+        for col, kind in meta["columns"]:
+            array = self.load_array(f"{name}.{col}")
+            if kind == "array":
+                data[col] = array
+            elif meta["rows"]:
+                data[col] = np.array(array.tobytes().decode("utf-8").split("\0"), dtype=object)
+            else:
+                data[col] = np.zeros(0, dtype=object)
+        # copy=False keeps the numeric columns on their read-only memory maps
+        return pd.DataFrame(data, columns=[c for c, _ in meta["columns"]], copy=False)
@@ -4,13 +4,18 @@ from typing import Optional
 
 
 class Cache:
-    def __init__(self, url: str, enabled: bool = False) -> None:
+    def __init__(
+        self, url: str, enabled: bool = False, connect_timeout_seconds: float = 0.05, read_timeout_seconds: float = 0.05
+    ) -> None:
         self.enabled = enabled
         self.client = None
         if enabled:
             try:
                 import redis  # type: ignore
-                self.client = redis.from_url(url)
+                # An unreachable or slow Redis costs at most the timeout, then counts as a miss
+                self.client = redis.from_url(
+                    url, socket_connect_timeout=connect_timeout_seconds, socket_timeout=read_timeout_seconds
+                )
             except Exception:
                 self.client = None
                 self.enabled = False
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List
+import json
+import os
+
+
+class InteractionLog:
+    # Append-only JSON-lines log; every append is fsynced before it is acknowledged
+    def __init__(self, path: str) -> None:
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def append(self, events: List[Dict[str, Any]]) -> None:
+        if not events:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(e, separators=(",", ":")) + "\n" for e in events))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def replay(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return []
+        events: List[Dict[str, Any]] = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn final write from a crash; everything before it is intact
+                    break
+        return events
+
+    def size(self) -> int:
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def truncate(self, offset: int | None = None) -> None:
+        # Drop the first `offset` bytes (a size() taken earlier), or everything; events appended
+        # since are rewritten through a temporary file so a crash keeps the old or the new log
+        tail = b""
+        if offset is not None and os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                tail = f.read()
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import threading
+import time
+import zlib
+
+from data_pipeline.schemas import RESULT_FIELDS, RecommendationRequest, RecommendedBook
+from storage.cache import Cache
+
+
+class LocalCache:
+    # In-process LRU with a per-entry TTL
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 60.0) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def encode_results(results: List[RecommendedBook]) -> bytes:
+    # Positional rows (no repeated field names) + zlib keeps payloads small for Redis
+    rows = [[getattr(book, f) for f in RESULT_FIELDS] for book in results]
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_results(payload: bytes) -> List[RecommendedBook]:
+    rows = json.loads(zlib.decompress(payload).decode("utf-8"))
+    # Entries were encoded from our own results; skip validation
+    return [RecommendedBook.model_construct(**dict(zip(RESULT_FIELDS, row))) for row in rows]
+
+
+class RecommendationCache:
+    def __init__(self, config: dict | None = None, remote: Cache | None = None) -> None:
+        cache_cfg = (config or {}).get("cache", {})
+        self.local = LocalCache(
+            max_entries=int(cache_cfg.get("local_max_entries", 10000)),
+            ttl_seconds=float(cache_cfg.get("local_ttl_seconds", 60)),
+        )
+        self.remote = remote or Cache(
+            cache_cfg.get("redis_url", ""),
+            enabled=bool(cache_cfg.get("enabled", False)),
+            connect_timeout_seconds=float(cache_cfg.get("connect_timeout_seconds", 0.05)),
+            read_timeout_seconds=float(cache_cfg.get("read_timeout_seconds", 0.05)),
+        )
+        self.ttl_seconds = int(cache_cfg.get("ttl_seconds", 3600))
+        self.limit_buckets = sorted(int(b) for b in cache_cfg.get("limit_buckets", [10, 20, 50, 100]))
+        self.stats: Dict[str, int] = {"local_hits": 0, "remote_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def canonicalize(self, request: RecommendationRequest) -> RecommendationRequest:
+        # Key form only: equivalent requests (list order, case, nearby limits, field projections) map to
+        # one cache entry. Values are not deduplicated or rewritten since repeats and title spellings
+        # change the content query; scoring always sees `scoring_request`.
+        def norm(values: List[str]) -> List[str]:
+            return sorted(v.strip().lower() for v in values if v.strip())
+
+        return self.scoring_request(request).model_copy(
+            update={
+                "genres": norm(request.genres),
+                "authors": norm(request.authors),
+                "countries": norm(request.countries),
+                "languages": norm(request.languages),
+                "themes": norm(request.themes),
+                "liked_books": norm(request.liked_books),
+            }
+        )
+
+    def scoring_request(self, request: RecommendationRequest) -> RecommendationRequest:
+        # The request as submitted, widened to its limit bucket so one entry serves every limit in it
+        limit = max(1, request.limit)
+        bucket = next((b for b in self.limit_buckets if b >= limit), limit)
+        return request.model_copy(update={"limit": bucket, "explain": request.wants_explanation(), "fields": None})
+
+    def key(self, canonical: RecommendationRequest, model_version: str | None) -> str:
+        # The latency budget only decides whether a list is degraded, and degraded lists are not stored
+        digest = hashlib.sha1(canonical.model_dump_json(exclude={"budget_ms"}).encode("utf-8")).hexdigest()
+        return f"rec:{model_version or 'unversioned'}:{digest}"
+
+    @property
+    def blocking(self) -> bool:
+        # Whether lookup/store make network calls (the Redis tier) and belong off the event loop
+        return self.remote.enabled and self.remote.client is not None
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.stats, "local_entries": len(self.local)}
+
+    def lookup(
+        self, request: RecommendationRequest, model_version: str | None
+    ) -> Tuple[RecommendationRequest, str, Optional[List[RecommendedBook]]]:
+        # Returns (request to score, key, cached results or None); results are not truncated to `limit`
+        scoring = self.scoring_request(request)
+        key = self.key(self.canonicalize(request), model_version)
+        payload = self.local.get(key)
+        if payload is not None:
+            self._count("local_hits")
+            return scoring, key, decode_results(payload)
+        payload = self.remote.get(key)
+        if payload is not None:
+            self._count("remote_hits")
+            self.local.set(key, payload)
+            return scoring, key, decode_results(payload)
+        self._count("misses")
+        return scoring, key, None
+
+    def store(self, key: str, results: List[RecommendedBook]) -> None:
+        payload = encode_results(results)
+        self.local.set(key, payload)
+        self.remote.set(key, payload, ttl_seconds=self.ttl_seconds)
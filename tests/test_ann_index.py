@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from search.ann_index import AnnIndex
+
+
+ENGINES = [
+    ("none", {}),
+    ("faiss", {"index_type": "flat"}),
+    ("faiss", {"index_type": "ivf_pq", "nlist": 8, "nprobe": 8, "pq_m": 4, "pq_bits": 4}),
+    ("faiss", {"index_type": "hnsw"}),
+    ("hnsw", {}),
+]
+
+
+def _vectors(n=1000, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+@pytest.mark.parametrize("engine,params", ENGINES)
+def test_save_load_add_remove(engine, params, tmp_path):
+    pytest.importorskip({"faiss": "faiss", "hnsw": "hnswlib"}.get(engine, "numpy"))
+    vectors = _vectors()
+    labels = [f"b{i}" for i in range(len(vectors))]
+    index = AnnIndex(dim=16, engine=engine, exact_threshold=0, params=params)
+    index.build(vectors[:900], labels=labels[:900])
+    index.add(vectors[900:], labels=labels[900:])
+    queries = vectors[[3, 950]]
+
+    found, _ = index.search_labels(queries, top_k=5)
+    assert [row[0] for row in found] == ["b3", "b950"]
+    assert index.remove_labels(["b3", "b950", "missing"]) == 2
+    ids, _ = index.search(queries, top_k=5)
+    assert not np.isin([3, 950], ids).any()
+    assert index.rows_for_labels(["b3", "b4"]).tolist() == [-1, 4]
+
+    index.save(str(tmp_path / "ann"))
+    loaded = AnnIndex(dim=16, engine=engine, exact_threshold=0, params=params)
+    assert loaded.load(str(tmp_path / "ann"), vectors)
+    assert loaded.n_deleted == 2 and loaded.labels[10] == "b10"
+    loaded_ids, _ = loaded.search(queries, top_k=5)
+    np.testing.assert_array_equal(loaded_ids, ids)
+
+    other = AnnIndex(dim=16, engine=engine, params={**params, "hnsw_m": 32})
+    assert not other.load(str(tmp_path / "ann"), vectors)
+    assert not loaded.load(str(tmp_path / "ann"), vectors[:10])
+
+
+def test_per_query_search_effort():
+    pytest.importorskip("faiss")
+    vectors = _vectors(n=2000)
+    params = {"index_type": "ivf_pq", "nlist": 32, "nprobe": 1, "pq_m": 4, "pq_bits": 4}
+    index = AnnIndex(dim=16, engine="faiss", params=params)
+    index.build(vectors)
+    queries = vectors[:50]
+    assert index.faiss_index.nprobe == 1
+    narrow = index.recall_at_k(queries, top_k=10)
+    approx, _ = index.search(queries, top_k=10, nprobe=32)
+    exact, _ = index.exact_search(queries, top_k=10)
+    wide = sum(len(set(a) & set(e)) for a, e in zip(approx.tolist(), exact.tolist())) / exact.size
+    assert wide > narrow
+
+
+@pytest.mark.parametrize("engine,params", ENGINES)
+def test_wide_filters_use_the_engine_filter(engine, params):
+    pytest.importorskip({"faiss": "faiss", "hnsw": "hnswlib"}.get(engine, "numpy"))
+    vectors = _vectors(n=4000)
+    index = AnnIndex(dim=16, engine=engine, exact_threshold=0, params=params)
+    index.build(vectors)
+    allowed = np.arange(0, 4000, 2)  # excludes far more rows than MAX_OVERFETCH
+    ids, _ = index.search(vectors[[1, 2]], top_k=5, allowed=allowed)
+    assert ids.shape == (2, 5) and (ids >= 0).all() and (ids % 2 == 0).all()
+    assert ids[1, 0] == 2
+
+
+@pytest.mark.parametrize("params", [p for engine, p in ENGINES if engine == "faiss"])
+def test_mapped_faiss_index_copies_on_first_add(params, tmp_path):
+    pytest.importorskip("faiss")
+    vectors = _vectors()
+    labels = [f"b{i}" for i in range(len(vectors))]
+    built = AnnIndex(dim=16, engine="faiss", exact_threshold=0, params=params)
+    built.build(vectors[:900], labels=labels[:900])
+    built.save(str(tmp_path / "ann"))
+
+    index = AnnIndex(dim=16, engine="faiss", exact_threshold=0, params=params)
+    assert index.load(str(tmp_path / "ann"), vectors[:900], mmap=True)
+    mapped = index.faiss_index
+    # Removing only tombstones: the mapping is neither copied nor compacted
+    assert index.remove_labels(["b3"]) == 1
+    assert index.read_only and index.faiss_index is mapped and mapped.ntotal == 900
+    ids, _ = index.search(vectors[[3]], top_k=5)
+    assert 3 not in ids
+
+    index.add(vectors[900:], labels=labels[900:])
+    assert not index.read_only and index.faiss_index is not mapped and mapped.ntotal == 900
+    found, _ = index.search_labels(vectors[[3, 950]], top_k=5)
+    assert "b3" not in found[0] and found[1][0] == "b950"
@@ -2,6 +2,7 @@ import pytest
 from httpx import AsyncClient, ASGITransport
 import asyncio
 
+from data_pipeline.schemas import MAX_BATCH_REQUESTS
 from services.api.main import app
 from scripts.ingest_sample import ensure_sample_data
 
@@ -41,4 +42,225 @@ async def test_recommend_basic():
         recs = data["recommendations"]
         assert isinstance(recs, list)
         assert len(recs) > 0
-        assert all("title" in r and "explanation" in r for r in recs)
\ No newline at end of file
+        assert all("title" in r and "explanation" in r for r in recs)
+
+
+@pytest.mark.asyncio
+async def test_recommend_field_projection():
+    ensure_sample_data()
+    for handler in app.router.on_startup:
+        await handler()
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        payload = {"genres": ["Fantasy"], "limit": 3}
+        full = (await ac.post("/recommend", json=payload)).json()["recommendations"]
+        resp = await ac.post("/recommend", json={**payload, "fields": ["book_id", "score"]})
+        assert resp.status_code == 200, resp.text
+        slim = resp.json()["recommendations"]
+        assert slim == [{"book_id": r["book_id"], "score": r["score"]} for r in full]
+        bare = (await ac.post("/recommend", json={**payload, "explain": False})).json()["recommendations"]
+        assert [r["explanation"] for r in bare] == [""] * len(full) and full[0]["explanation"]
+        resp = await ac.post("/recommend", json={**payload, "fields": ["book_id", "isbn"]})
+        assert resp.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_search_suggest():
+    ensure_sample_data()
+    for handler in app.router.on_startup:
+        await handler()
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        resp = await ac.get("/search/suggest", params={"q": "Aka"})
+        assert resp.status_code == 200, resp.text
+        data = resp.json()
+        assert data["query"] == "Aka" and set(data["suggestions"]) == {"title", "author", "genre", "theme"}
+        assert data["suggestions"]["title"][0]["book_id"] == "1"
+        resp = await ac.get("/search/suggest", params=[("q", "nnedi"), ("fields", "author"), ("limit", "1")])
+        authors = resp.json()["suggestions"]
+        assert list(authors) == ["author"] and len(authors["author"]) == 1
+        assert authors["author"][0]["value"] == "Nnedi Okorafor" and authors["author"][0]["books"] == 2
+        assert (await ac.get("/search/suggest", params={"q": "a", "fields": "isbn"})).status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_recommend_batch():
+    ensure_sample_data()
+    for handler in app.router.on_startup:
+        await handler()
+
+    payload = {
+        "requests": [
+            {"genres": ["Fantasy"], "liked_books": ["Akata Witch"], "limit": 2},
+            {"countries": ["Japan"], "limit": 1},
+        ]
+    }
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        resp = await ac.post("/recommend/batch", json=payload)
+        assert resp.status_code == 200, resp.text
+        results = resp.json()["results"]
+        assert len(results) == 2
+        assert len(results[1]["recommendations"]) == 1
+        oversized = {"requests": [{"limit": 1}] * (MAX_BATCH_REQUESTS + 1)}
+        resp = await ac.post("/recommend/batch", json=oversized)
+        assert resp.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_ingest_interactions(tmp_path, monkeypatch):
+    from services.api import main
+    from services.api.ingestion import InteractionIngestor
+
+    ensure_sample_data()
+    monkeypatch.setattr(main, "INGESTOR", InteractionIngestor({"interactions": {"log_path": str(tmp_path / "events.jsonl"), "snapshot_dir": str(tmp_path / "snapshots")}}))
+    for handler in app.router.on_startup:
+        await handler()
+    collab = main.RECOMMENDER.collab_model
+    before = float(collab.item_popularity[collab.item_index["5"]])
+
+    payload = {"events": [{"user_id": "u7", "book_id": "5", "event_strength": 2.5}, {"user_id": "u7", "book_id": "missing"}]}
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        resp = await ac.post("/interactions", json=payload)
+        assert resp.status_code == 200, resp.text
+        assert resp.json() == {"accepted": 2, "applied": 1}
+    assert float(collab.item_popularity[collab.item_index["5"]]) == pytest.approx(before + 2.5)
+    assert len(main.INGESTOR.log.replay()) == 2
+    main.INGESTOR.compact()
+    assert main.INGESTOR.log.replay() == [] and collab.cooccurrence_delta is None
+    assert float(collab.item_popularity[collab.item_index["5"]]) == pytest.approx(before + 2.5)
+
+
+def _tmp_ingestor(tmp_path):
+    from services.api.ingestion import InteractionIngestor
+
+    return InteractionIngestor({
+        "interactions": {"log_path": str(tmp_path / "events.jsonl"), "snapshot_dir": str(tmp_path / "snapshots")},
+        "catalog": {"log_path": str(tmp_path / "catalog.jsonl")},
+    })
+
+
+@pytest.mark.asyncio
+async def test_catalog_upsert_and_delete(tmp_path, monkeypatch):
+    from services.api import main
+
+    ensure_sample_data()
+    monkeypatch.setattr(main, "INGESTOR", _tmp_ingestor(tmp_path))
+    for handler in app.router.on_startup:
+        await handler()
+    book = {"book_id": "9001", "title": "Witch of Lagos", "author": "New Author", "country": "Nigeria", "genres": "Fantasy"}
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        resp = await ac.post("/catalog/books", json={"upserts": [book]})
+        assert resp.status_code == 200, resp.text
+        size = resp.json()["catalog_size"]
+        assert resp.json()["added"] == 1
+        resp = await ac.post("/recommend", json={"countries": ["Nigeria"], "limit": 50})
+        assert "9001" in [b["book_id"] for b in resp.json()["recommendations"]]
+
+        resp = await ac.post("/catalog/books", json={"deletes": ["9001"]})
+        assert resp.json() == {"added": 0, "updated": 0, "deleted": 1, "catalog_size": size - 1}
+        resp = await ac.post("/recommend", json={"countries": ["Nigeria"], "limit": 50})
+        assert "9001" not in [b["book_id"] for b in resp.json()["recommendations"]]
+
+
+@pytest.mark.asyncio
+async def test_catalog_updates_survive_a_reload(tmp_path, monkeypatch):
+    from services.api import main
+
+    ensure_sample_data()
+    monkeypatch.setattr(main, "INGESTOR", _tmp_ingestor(tmp_path))
+    for handler in app.router.on_startup:
+        await handler()
+    book = {"book_id": "9001", "title": "Witch of Lagos", "author": "New Author", "country": "Nigeria", "genres": "Fantasy"}
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        resp = await ac.post("/catalog/books", json={"upserts": [book], "deletes": ["2"]})
+        assert resp.status_code == 200, resp.text
+    old = main.RECOMMENDER
+    main.RELOADER.reload()
+    assert main.RECOMMENDER is not old and main.RELOADER.stats["last_error"] is None
+    # Rebuilt from the data files, then the logged catalog updates were replayed
+    catalog = main.RECOMMENDER.catalog
+    assert catalog.lookup(["9001"]).tolist() and not catalog.lookup(["2"]).tolist()
+
+
+@pytest.mark.asyncio
+async def test_debug_breakdown_and_metrics():
+    ensure_sample_data()
+    for handler in app.router.on_startup:
+        await handler()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        resp = await ac.post("/recommend?debug=true", json={"genres": ["Fantasy"], "limit": 3})
+        assert resp.status_code == 200, resp.text
+        debug = resp.json()["debug"]
+        assert {"filter", "content", "collab", "blend", "rerank", "results", "total"} <= set(debug["stages_ms"])
+        assert debug["counts"]["candidates"] >= debug["counts"]["scored"] > 0
+        resp = await ac.post("/recommend", json={"limit": 3})
+        assert resp.json()["debug"] is None
+
+        resp = await ac.get("/metrics")
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/plain")
+        text = resp.text
+    assert 'recommender_stage_duration_seconds_bucket{stage="content",le="+Inf"}' in text
+    assert 'recommender_initialize_duration_seconds_count{stage="fit_content"}' in text
+    assert 'http_request_duration_seconds_count{method="POST",route="/recommend",status="200"}' in text
+    assert 'recommendation_cache_events_total{result="misses"}' in text
+
+
+@pytest.mark.asyncio
+async def test_reload_swaps_model_without_failed_requests():
+    from services.api import main
+
+    ensure_sample_data()
+    for handler in app.router.on_startup:
+        await handler()
+    old = main.RECOMMENDER
+    reloads = main.RELOADER.stats["reloads"]
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        health = (await ac.get("/health")).json()
+        assert health["model_version"] == old.model_version
+        resp = await ac.post("/admin/reload")
+        assert resp.status_code == 202 and resp.json()["started"]
+        statuses, versions = [], set()
+        for i in range(400):
+            resp = await ac.post("/recommend", json={"genres": ["Fantasy"], "limit": 1 + i % 5})
+            statuses.append(resp.status_code)
+            versions.add(resp.json()["model_version"])
+            if main.RELOADER.stats["reloads"] > reloads and main.RELOADER.stats["state"] == "idle":
+                break
+            await asyncio.sleep(0.01)
+        assert main.RELOADER.stats["reloads"] == reloads + 1, main.RELOADER.stats
+        assert set(statuses) == {200}
+        assert main.RECOMMENDER is not old and main.EXECUTOR.recommender is main.RECOMMENDER
+        # Fitted in a child process into a bundle that the serving process only loaded
+        assert main.RECOMMENDER.artifacts_dir == main.RELOADER.build_dir
+        assert main.EXECUTOR.in_flight(old) == 0
+        health = (await ac.get("/health")).json()
+        assert health["model_version"] == main.RECOMMENDER.model_version and health["reload"]["state"] == "idle"
+        resp = await ac.post("/recommend", json={"genres": ["Fantasy"], "limit": 2})
+        assert resp.json()["model_version"] == main.RECOMMENDER.model_version
+        assert versions <= {old.model_version, main.RECOMMENDER.model_version}
+
+
+@pytest.mark.asyncio
+async def test_online_updates_need_the_thread_executor(monkeypatch):
+    from services.api import main
+
+    ensure_sample_data()
+    for handler in app.router.on_startup:
+        await handler()
+    # Process-pool workers hold their own models, which the API process cannot update
+    monkeypatch.setattr(main.EXECUTOR, "kind", "process")
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        resp = await ac.post("/interactions", json={"events": [{"user_id": "u7", "book_id": "5"}]})
+        assert resp.status_code == 501
+        resp = await ac.post("/catalog/books", json={"deletes": ["1"]})
+        assert resp.status_code == 501
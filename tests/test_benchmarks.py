@@ -0,0 +1,27 @@
+import pandas as pd
+
+from benchmarks.run import bench_size, compare
+from benchmarks.synthetic import generate
+
+
+def test_synthetic_data_is_seeded(tmp_path):
+    books_a, inter_a = generate(300, str(tmp_path / "a"), seed=7)
+    books_b, _ = generate(300, str(tmp_path / "b"), seed=7)
+    books = pd.read_csv(books_a)
+    assert len(books) == 300 and books["book_id"].is_unique
+    assert books.equals(pd.read_csv(books_b))
+    interactions = pd.read_csv(inter_a)
+    assert interactions["book_id"].isin(books["book_id"]).all()
+    # Skewed: the most common country covers far more than a uniform share
+    assert books["country"].value_counts(normalize=True).iloc[0] > 0.15
+
+
+def test_bench_size_reports_percentiles(tmp_path):
+    result = bench_size(300, str(tmp_path), n_requests=5, concurrency=2, seed=1)
+    assert set(result["recommend"]) == {"unfiltered", "broad", "medium", "narrow"}
+    for stats in result["recommend"].values():
+        assert stats["n"] == 5 and stats["p50_ms"] <= stats["p99_ms"]
+    assert result["api"]["errors"] == 0 and result["api"]["throughput_rps"] > 0
+    assert result["peak_rss_mb"] > 0
+    report = {"results": [result]}
+    assert len(compare(report, report)) == 7
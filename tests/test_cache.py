@@ -0,0 +1,93 @@
+from data_pipeline.schemas import RecommendationRequest, RecommendedBook
+from recommender.hybrid import HybridRecommender
+from scripts.ingest_sample import ensure_sample_data
+from storage.recommendation_cache import RecommendationCache, decode_results, encode_results
+
+
+def _books(n):
+    return [RecommendedBook(book_id=str(i), title=f"t{i}", author="a", genres=["x"], year=2000 + i, score=1.0 / (i + 1)) for i in range(n)]
+
+
+def _get_or_compute(cache, request, version, compute):
+    scoring, key, results = cache.lookup(request, version)
+    if results is None:
+        results = compute(scoring)
+        cache.store(key, results)
+    return results[:request.limit]
+
+
+def test_equivalent_requests_share_an_entry():
+    cache = RecommendationCache({})
+    calls = []
+
+    def compute(request):
+        calls.append(request)
+        return _books(request.limit)
+
+    first = _get_or_compute(cache, RecommendationRequest(genres=["YA", "Fantasy"], limit=3), "v1", compute)
+    second = _get_or_compute(cache, RecommendationRequest(genres=["fantasy", "ya"], limit=7), "v1", compute)
+    # One entry for both, but scoring sees the first request as submitted (bucketed limit only)
+    assert len(calls) == 1 and calls[0].limit == 10 and calls[0].genres == ["YA", "Fantasy"]
+    assert [b.book_id for b in first] == ["0", "1", "2"]
+    assert len(second) == 7
+    assert cache.snapshot()["local_hits"] == 1
+
+    # A new model version never sees the old entries
+    _get_or_compute(cache, RecommendationRequest(genres=["fantasy"], limit=3), "v2", compute)
+    assert cache.snapshot()["misses"] == 2
+
+
+def test_projections_share_an_entry_explain_does_not():
+    cache = RecommendationCache({})
+    calls = []
+
+    def compute(request):
+        calls.append(request)
+        return _books(request.limit)
+
+    _get_or_compute(cache, RecommendationRequest(limit=3), "v1", compute)
+    _get_or_compute(cache, RecommendationRequest(limit=3, fields=["book_id", "explanation"]), "v1", compute)
+    assert len(calls) == 1
+    # No explanation requested either way: both map to one explain=False entry
+    _get_or_compute(cache, RecommendationRequest(limit=3, explain=False), "v1", compute)
+    _get_or_compute(cache, RecommendationRequest(limit=3, fields=["book_id"]), "v1", compute)
+    assert len(calls) == 2 and calls[1].explain is False and calls[1].fields is None
+
+
+def test_remote_tier_is_off_the_event_loop_only_when_enabled():
+    class Remote:
+        enabled, client = True, object()
+
+        def get(self, key):
+            return None
+
+        def set(self, key, value, ttl_seconds=3600):
+            pass
+
+    assert not RecommendationCache({}).blocking
+    assert RecommendationCache({}, remote=Remote()).blocking
+
+
+def test_cached_results_match_an_uncached_computation():
+    ensure_sample_data()
+    recommender = HybridRecommender({})
+    recommender.initialize()
+    cache = RecommendationCache({})
+    calls = []
+
+    def compute(request):
+        calls.append(request)
+        return recommender.recommend(request)
+
+    for title in ("Akata Witch (Akata, #1)", "akata witch"):
+        request = RecommendationRequest(liked_books=[title], limit=3)
+        cached = _get_or_compute(cache, request, "v1", compute)
+        assert cached == recommender.recommend(request)
+        assert calls[-1].liked_books == [title]
+    # Different spellings build different content queries, so they do not share an entry
+    assert len(calls) == 2
+
+
+def test_result_serialization_round_trip():
+    books = _books(3)
+    assert decode_results(encode_results(books)) == books
@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+from data_pipeline.catalog_ingest import ingest_books, iter_book_chunks, load_books
+from data_pipeline.schemas import RecommendationRequest
+from recommender.hybrid import HybridRecommender
+from scripts.ingest_sample import ensure_sample_data
+
+
+def _messy_csv(path):
+    pd.DataFrame(
+        [
+            {"book_id": "1", "title": " Akata Witch ", "author": None, "genres": " Fantasy || YA ", "year": "2011", "avg_rating": "4.1", "rating_count": "25000"},
+            {"book_id": "", "title": "No id", "genres": "Fantasy", "year": "2000"},
+            {"book_id": "2", "title": "Zahrah", "author": "Nnedi Okorafor", "genres": "Fantasy", "year": "unknown", "avg_rating": "n/a"},
+            {"book_id": "1", "title": "Duplicate", "genres": "Horror", "year": "1999"},
+        ]
+    ).to_csv(path, index=False)
+
+
+def test_chunks_are_validated_and_normalized(tmp_path):
+    _messy_csv(tmp_path / "books.csv")
+    chunks = list(iter_book_chunks(str(tmp_path / "books.csv"), chunk_rows=2))
+    books = pd.concat([chunk for chunk, _ in chunks], ignore_index=True)
+    assert sum(rejected for _, rejected in chunks) == 2
+    assert books["book_id"].tolist() == ["1", "2"]
+    assert books["title"].tolist() == ["Akata Witch", "Zahrah"]
+    assert books["genres"].tolist() == ["Fantasy|YA", "Fantasy"]
+    assert books["author"].tolist() == ["", "Nnedi Okorafor"]
+    assert pd.isna(books["year"].iloc[1]) and books["avg_rating"].iloc[1] == 0.0
+    assert books["corpus"].iloc[0] == "Akata Witch  Fantasy YA"
+
+
+def test_parquet_catalog_matches_csv(tmp_path):
+    pytest.importorskip("pyarrow")
+    ensure_sample_data()
+    out = tmp_path / "books.parquet"
+    stats = ingest_books("sample_data/books_sample.csv", str(out), chunk_rows=2)
+    assert stats["rows"] == 5 and stats["chunks"] == 3
+
+    books = load_books(str(out), columns=["book_id", "country", "description"])
+    assert list(books.columns) == ["book_id", "country", "description"]
+    assert isinstance(books["country"].dtype, pd.CategoricalDtype)
+
+    from_csv = HybridRecommender({})
+    from_csv.initialize()
+    from_parquet = HybridRecommender({"paths": {"books_parquet": str(out)}})
+    from_parquet.initialize()
+    assert "description" not in from_parquet.books.columns
+    for payload in ({}, {"genres": ["Fantasy"], "liked_books": ["Akata Witch"]}, {"countries": ["Japan"]}):
+        request = RecommendationRequest(**payload)
+        expected = [(b.book_id, round(b.score, 9)) for b in from_csv.recommend(request)]
+        assert [(b.book_id, round(b.score, 9)) for b in from_parquet.recommend(request)] == expected
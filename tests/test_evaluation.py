@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_pipeline.schemas import RecommendationRequest
+from evaluation import metrics
+from evaluation.offline import OfflineEvaluator, time_holdout
+from scripts.ingest_sample import ensure_sample_data
+
+
+def test_vectorized_metrics_match_per_user_functions():
+    rng = np.random.default_rng(0)
+    n_users, n_items, k = 50, 30, 10
+    recommended = np.stack([rng.permutation(n_items)[:k] for _ in range(n_users)])
+    recommended[rng.random(recommended.shape) < 0.1] = -1
+    relevant = [set(rng.choice(n_items, size=rng.integers(0, 6), replace=False).tolist()) for _ in range(n_users)]
+    keys = np.sort([u * n_items + i for u, items in enumerate(relevant) for i in items]).astype(np.int64)
+    hits = metrics.hit_matrix(recommended, keys, n_items)
+    n_relevant = np.array([len(r) for r in relevant])
+    for u in range(n_users):
+        recs = [str(i) for i in recommended[u]]
+        rel = {str(i) for i in relevant[u]}
+        assert metrics.precision_at_k_batch(hits, 5)[u] == pytest.approx(metrics.precision_at_k(recs, rel, 5))
+        assert metrics.recall_at_k_batch(hits, n_relevant, k)[u] == pytest.approx(metrics.recall_at_k(recs, rel, k))
+        assert metrics.ndcg_at_k_batch(hits, k)[u] == pytest.approx(metrics.ndcg_at_k(recs, rel, k))
+
+    codes = np.array([[0, 0, 1, -1], [2, 2, 2, 2]])
+    np.testing.assert_allclose(metrics.intra_list_diversity(codes), [2 / 3, 0.0])
+    assert metrics.catalog_coverage(np.array([[0, 1, -1], [1, 2, -1]]), 6) == pytest.approx(0.5)
+
+
+def test_offline_evaluator_matches_recommend(tmp_path):
+    ensure_sample_data()
+    config = {"evaluation": {"workers": 1, "holdout_fraction": 0.5, "k": 3, "sweep": {"hybrid_alpha": [0.2, 0.8]}}}
+    evaluator = OfflineEvaluator(config)
+    report = evaluator.run()
+    assert [row["hybrid_alpha"] for row in report] == [0.2, 0.8]
+
+    interactions = pd.read_csv("sample_data/user_interactions_sample.csv", dtype={"book_id": str})
+    train, test = time_holdout(interactions, 0.5)
+    assert len(train) == 3 and set(test["user_id"]) == {"u2", "u3"}
+    train.to_csv(tmp_path / "train.csv", index=False)
+    from recommender.hybrid import HybridRecommender
+
+    rec = HybridRecommender({"paths": {"interactions_csv": str(tmp_path / "train.csv")}, "recommendation": {"hybrid_alpha": 0.8}})
+    rec.initialize()
+    books = pd.read_csv("sample_data/books_sample.csv", dtype={"book_id": str}).set_index("book_id")
+    precision = []
+    for user, held in test.groupby("user_id"):
+        liked = train[train["user_id"] == user].sort_values("event_strength", ascending=False)["book_id"]
+        request = RecommendationRequest(liked_books=books.loc[liked, "title"].tolist(), limit=3)
+        recommended = [b.book_id for b in rec.recommend(request)]
+        precision.append(metrics.precision_at_k(recommended, set(held["book_id"]) - set(liked), 3))
+    assert report[1]["precision@3"] == pytest.approx(np.mean(precision))
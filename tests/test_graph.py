@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_pipeline.schemas import RecommendationRequest
+from graph.book_graph import BookGraph
+from recommender.hybrid import HybridRecommender
+from scripts.ingest_sample import ensure_sample_data
+
+
+def _books(n=60, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "book_id": [str(i) for i in range(n)],
+            "author": [f"a{i}" for i in rng.integers(0, 15, n)],
+            "genres": ["|".join(f"g{g}" for g in rng.choice(6, 2, replace=False)) for _ in range(n)],
+            "themes": [f"t{t}" for t in rng.integers(0, 10, n)],
+            "country": [f"c{c}" for c in rng.integers(0, 4, n)],
+        }
+    )
+
+
+def _dense_similarity(graph: BookGraph) -> np.ndarray:
+    # B W B^T with the diagonal removed, straight from the incidence matrix
+    incidence = graph.incidence.toarray()
+    similarity = incidence @ np.diag(graph._entity_weights(graph.incidence)) @ incidence.T
+    np.fill_diagonal(similarity, 0.0)
+    return similarity
+
+
+def test_neighbors_are_top_path_counts():
+    graph = BookGraph({"graph": {"top_n": 5, "max_entity_degree": 20}})
+    graph.build(_books())
+    similarity = _dense_similarity(graph)
+    for pos in range(graph.size):
+        ids, weights = graph.neighbors(pos)
+        np.testing.assert_allclose(weights, np.sort(similarity[pos])[::-1][: len(weights)], rtol=1e-6)
+        np.testing.assert_allclose(similarity[pos, ids], weights, rtol=1e-6)
+
+
+def test_entity_paths_match_neighbors():
+    # A shard's view of a liked book's paths, from its entities, is that book's own neighbour list
+    graph = BookGraph({"graph": {"top_n": 5, "max_entity_degree": 12}})
+    graph.build(_books())
+    positions = np.arange(graph.size)
+    paths = graph.entity_paths([graph.path_entities(keys) for keys in graph.entity_keys(positions)], positions.tolist())
+    for pos, (ids, weights) in enumerate(paths):
+        expected_weights = graph.neighbors(pos)[1]
+        np.testing.assert_allclose(weights, expected_weights, rtol=1e-6)
+        np.testing.assert_allclose(_dense_similarity(graph)[pos, ids], weights, rtol=1e-6)
+
+
+@pytest.mark.parametrize("tail_min_links", [100_000, 0])
+def test_incremental_add_matches_rebuild(tail_min_links, monkeypatch):
+    monkeypatch.setattr(BookGraph, "TAIL_MIN_LINKS", tail_min_links)
+    books = _books(80)
+    config = {"graph": {"top_n": 6, "max_entity_degree": 1000}}
+    online = BookGraph(config)
+    online.build(books.iloc[:60])
+    online.add(books.iloc[60:70].reset_index(drop=True), 60)
+    online.add(books.iloc[70:].reset_index(drop=True), 70)
+    rebuilt = BookGraph(config)
+    rebuilt.build(books)
+    assert online.size == rebuilt.size == 80
+    assert (online.incidence != rebuilt.incidence).nnz == 0
+    for pos in range(80):
+        np.testing.assert_allclose(online.neighbors(pos)[1], rebuilt.neighbors(pos)[1], rtol=1e-6)
+
+
+def test_entities_turning_into_hubs_stop_adding_paths():
+    books = _books(80)
+    config = {"graph": {"top_n": 6, "max_entity_degree": 20}}
+    online = BookGraph(config)
+    online.build(books.iloc[:40])
+    assert (online.degree > 20).sum() < (np.bincount(BookGraph(config)._incidence(books).indices) > 20).sum()
+    online.add(books.iloc[40:].reset_index(drop=True), 40)
+    rebuilt = BookGraph(config)
+    rebuilt.build(books)
+    assert dict(zip(online.entities, online.degree.tolist())) == dict(zip(rebuilt.entities, rebuilt.degree.tolist()))
+    # Old rows keep the paths they had; new rows only see paths through entities that are not hubs now
+    for pos in range(40, 80):
+        np.testing.assert_allclose(online.neighbors(pos)[1], rebuilt.neighbors(pos)[1], rtol=1e-6)
+
+
+def test_graph_signal_in_recommendations(tmp_path):
+    ensure_sample_data()
+    rec = HybridRecommender({"recommendation": {"graph_weight": 0.5}})
+    rec.initialize()
+    assert len(rec.catalog.title_positions(["akata witch"])) == 1
+    request = RecommendationRequest(liked_books=["Akata Witch"], limit=3)
+    scores = rec._graph_scores([request], rec.catalog.live)[0]
+    assert np.nanmax(scores) == 1.0
+    graph_ranked = {b.book_id for b in rec.recommend(request) if "graph" in b.explanation}
+    assert graph_ranked
+
+    rec.save_artifacts(str(tmp_path))
+    loaded = HybridRecommender({"recommendation": {"graph_weight": 0.5}, "paths": {"artifacts_dir": str(tmp_path)}})
+    loaded.initialize()
+    np.testing.assert_array_equal(loaded.graph_model.neighbor_ids, rec.graph_model.neighbor_ids[: rec.graph_model.size])
@@ -0,0 +1,476 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_pipeline.schemas import RecommendationRequest
+from monitoring.trace import Trace
+from recommender.collaborative import CollaborativeRecommender
+from recommender.filter_index import FilterIndex
+from recommender.hybrid import HybridRecommender
+from recommender.title_index import TitleIndex, normalize_title
+from scripts.ingest_sample import ensure_sample_data
+
+
+@pytest.fixture(scope="module")
+def recommender():
+    ensure_sample_data()
+    rec = HybridRecommender({})
+    rec.initialize()
+    return rec
+
+
+def _scan_filter(df: pd.DataFrame, request: RecommendationRequest) -> list[str]:
+    filtered = df
+    if request.genres:
+        filtered = filtered[filtered["genres"].str.contains("|".join(rf"\b{g}\b" for g in request.genres), case=False, regex=True)]
+    if request.authors:
+        filtered = filtered[filtered["author"].str.lower().isin([a.lower() for a in request.authors])]
+    if request.countries:
+        filtered = filtered[filtered["country"].str.lower().isin([c.lower() for c in request.countries])]
+    if request.languages:
+        filtered = filtered[filtered["language"].str.lower().isin([l.lower() for l in request.languages])]
+    if request.min_year is not None:
+        filtered = filtered[filtered["year"] >= request.min_year]
+    if request.max_year is not None:
+        filtered = filtered[filtered["year"] <= request.max_year]
+    return filtered["book_id"].astype(str).tolist()
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"genres": ["fantasy"]},
+        {"genres": ["Fiction", "YA"], "languages": ["EN"]},
+        {"authors": ["haruki murakami"], "min_year": 2005},
+        {"countries": ["Nigeria", "Japan"], "max_year": 2010},
+        {"genres": ["Literary"], "countries": ["Nigeria"]},
+        {"min_year": 2005, "max_year": 2011},
+    ],
+)
+def test_filter_index_matches_column_scan(recommender, payload):
+    request = RecommendationRequest(**payload)
+    expected = _scan_filter(recommender.books, request)
+    got = [recommender.catalog.book_ids[p] for p in recommender._apply_filters(request)]
+    assert got == expected
+
+
+def test_cooccurrence_counts_shared_baskets(recommender):
+    collab = recommender.collab_model
+    idx = collab.item_index
+    cooc = collab.cooccurrence.toarray()
+    # u1 read books 1 and 2, u2 read books 1 and 3
+    assert cooc[idx["1"], idx["2"]] == 1
+    assert cooc[idx["1"], idx["3"]] == 1
+    assert cooc[idx["2"], idx["3"]] == 0
+    assert cooc.diagonal().sum() == 0
+    assert collab.item_popularity[idx["1"]] == pytest.approx(7.0)
+
+
+def test_content_retrieval_scores_only_top_k(recommender):
+    content = recommender.content_model
+    request = RecommendationRequest(genres=["Fantasy"], themes=["Afrofuturism"])
+    positions = np.arange(recommender.catalog.size)
+    exact = content.score_candidates(request, positions)
+    retrieved = content.score_candidates(request, positions, top_k=2)
+    assert np.count_nonzero(~np.isnan(retrieved)) == 2
+    best = np.argsort(-exact)[:2]
+    np.testing.assert_allclose(retrieved[best], exact[best])
+
+
+def test_artifact_bundle_round_trip(recommender, tmp_path):
+    version = recommender.save_artifacts(str(tmp_path))
+    loaded = HybridRecommender({"paths": {"artifacts_dir": str(tmp_path)}})
+    loaded.initialize()
+    assert loaded.model_version == version
+    request = RecommendationRequest(genres=["Fantasy"], liked_books=["Akata Witch"], limit=3)
+    expected = [(b.book_id, round(b.score, 6)) for b in recommender.recommend(request)]
+    assert [(b.book_id, round(b.score, 6)) for b in loaded.recommend(request)] == expected
+    np.testing.assert_array_equal(loaded.collab_model.mf.user_factors, recommender.collab_model.mf.user_factors)
+    # Serving columns only, numeric ones memory-mapped
+    assert "description" not in loaded.books.columns and loaded.books["title"].tolist() == recommender.books["title"].tolist()
+    assert isinstance(loaded.books["rating_count"].to_numpy().base, np.memmap)
+
+
+def test_recommend_batch_matches_single_requests(recommender):
+    requests = [
+        RecommendationRequest(genres=["Fantasy"], liked_books=["Akata Witch"], limit=3),
+        RecommendationRequest(genres=["fantasy"], themes=["Afrofuturism"], limit=2),
+        RecommendationRequest(countries=["Japan"], limit=5),
+        RecommendationRequest(liked_books=["Rosewater"]),
+        RecommendationRequest(user_id="u2", genres=["Fantasy"], limit=3),
+        RecommendationRequest(),
+    ]
+    batched = recommender.recommend_batch(requests)
+    for request, got in zip(requests, batched):
+        expected = recommender.recommend(request)
+        assert [(b.book_id, round(b.score, 6), b.explanation) for b in got] == [
+            (b.book_id, round(b.score, 6), b.explanation) for b in expected
+        ]
+
+
+def test_partial_fit_matches_refit(tmp_path):
+    ensure_sample_data()
+    books = pd.read_csv("sample_data/books_sample.csv")
+    history = pd.read_csv("sample_data/user_interactions_sample.csv")
+    new_events = [("u1", "3", 2.0), ("u9", "4", 1.0), ("u9", "1", 1.0), ("u2", "404", 5.0)]
+
+    online = CollaborativeRecommender({})
+    online.fit("sample_data/user_interactions_sample.csv", books)
+    online.fit_factors()
+    assert online.partial_fit(new_events) == 3
+
+    combined = pd.concat([history, pd.DataFrame(new_events[:3], columns=history.columns)])
+    combined.to_csv(tmp_path / "all.csv", index=False)
+    refit = CollaborativeRecommender({})
+    refit.fit(str(tmp_path / "all.csv"), books)
+
+    np.testing.assert_allclose(online.item_popularity, refit.item_popularity)
+    merged = (online.cooccurrence + online.cooccurrence_delta).toarray()
+    np.testing.assert_allclose(merged, refit.cooccurrence.toarray())
+    online.compact()
+    assert online.cooccurrence_delta is None
+    # New user u9 was folded into the factors
+    assert online.mf.user_factors.shape[0] == len(online.user_ids) and online.mf.user_factors[-1].any()
+    np.testing.assert_allclose(online.cooccurrence.toarray(), refit.cooccurrence.toarray())
+
+
+def test_compaction_of_a_detached_copy_keeps_later_events(tmp_path):
+    ensure_sample_data()
+    books = pd.read_csv("sample_data/books_sample.csv")
+    history = pd.read_csv("sample_data/user_interactions_sample.csv")
+    new_events = [("u1", "3", 2.0), ("u9", "4", 1.0), ("u9", "1", 1.0)]
+
+    online = CollaborativeRecommender({})
+    online.fit("sample_data/user_interactions_sample.csv", books)
+    online.fit_factors()
+    online.partial_fit(new_events[:2])
+    detached = online.detach()
+    # Arrives while the copy is being compacted
+    online.partial_fit(new_events[2:])
+    detached.compact()
+    online.adopt(detached)
+
+    combined = pd.concat([history, pd.DataFrame(new_events, columns=history.columns)])
+    combined.to_csv(tmp_path / "all.csv", index=False)
+    refit = CollaborativeRecommender({})
+    refit.fit(str(tmp_path / "all.csv"), books)
+    assert online.user_item.sum() == pytest.approx(refit.user_item.sum() - 1.0)
+    merged = (online.cooccurrence + online.cooccurrence_delta).toarray()
+    np.testing.assert_allclose(merged, refit.cooccurrence.toarray())
+    online.compact()
+    np.testing.assert_allclose(online.cooccurrence.toarray(), refit.cooccurrence.toarray())
+
+
+def test_compacted_snapshot_survives_a_catalog_change(tmp_path):
+    from data_pipeline.schemas import InteractionEvent
+    from services.api.ingestion import InteractionIngestor
+
+    ensure_sample_data()
+    config = {"interactions": {"log_path": str(tmp_path / "events.jsonl"), "snapshot_dir": str(tmp_path / "snapshots")}}
+    rec = HybridRecommender({})
+    rec.initialize()
+    ingestor = InteractionIngestor(config)
+    ingestor.start(rec)
+    version = rec.model_version
+    ingestor.ingest([InteractionEvent(user_id="u7", book_id="5", event_strength=2.5), InteractionEvent(user_id="u7", book_id="1")])
+    # Cached lists from before the events are not served again
+    assert rec.model_version != version
+    ingestor.compact()
+    assert ingestor.log.replay() == []
+    popularity = rec.collab_model.item_popularity[rec.collab_model.item_index["5"]]
+
+    # Rebuilt from a catalog in another order without book 3: the snapshot is remapped, not dropped
+    books = pd.read_csv("sample_data/books_sample.csv")
+    books[books["book_id"].astype(str) != "3"].iloc[::-1].to_csv(tmp_path / "books.csv", index=False)
+    rebuilt = HybridRecommender({"paths": {"books_csv": str(tmp_path / "books.csv"), "books_parquet": None}})
+    rebuilt.initialize()
+    InteractionIngestor(config).start(rebuilt)
+    collab = rebuilt.collab_model
+    history = [rebuilt.catalog.book_ids[p] for p in collab.history_positions("u7", rebuilt.catalog)]
+    assert sorted(history) == ["1", "5"]
+    assert collab.item_popularity[collab.item_index["5"]] == pytest.approx(popularity)
+    assert collab.mf.user_factors[collab.user_ids.index("u7")].any()
+
+
+def test_catalog_upserts_and_deletes_without_refit():
+    ensure_sample_data()
+    rec = HybridRecommender({})
+    rec.initialize()
+    vocabulary = rec.content_model.vectorizer.vocabulary_
+    version = rec.model_version
+    delta = pd.DataFrame(
+        [
+            {"book_id": "9001", "title": "Witch of Lagos", "author": "New Author", "country": "Nigeria",
+             "language": "en", "genres": "Fantasy", "year": 2020, "avg_rating": 4.5, "rating_count": 100},
+            {"book_id": "1", "title": "Akata Witch (Revised)", "author": "Nnedi Okorafor", "country": "Nigeria",
+             "language": "en", "genres": "Fantasy|YA", "year": 2011, "avg_rating": 4.1, "rating_count": 25000},
+        ]
+    )
+    assert rec.upsert_books(delta) == {"added": 1, "updated": 1}
+    assert rec.content_model.vectorizer.vocabulary_ is vocabulary
+    assert rec.model_version != version
+
+    request = RecommendationRequest(genres=["Fantasy"], countries=["Nigeria"], limit=20)
+    titles = {b.book_id: b.title for b in rec.recommend(request)}
+    assert titles["1"] == "Akata Witch (Revised)" and "9001" in titles
+    assert len(titles) == len(set(titles))
+
+    assert rec.delete_books(["9001", "missing"]) == 1
+    assert "9001" not in {b.book_id for b in rec.recommend(request)}
+    assert len(rec.recommend(RecommendationRequest(limit=100))) == len(rec.catalog.live)
+
+
+def test_reweight_matches_fixed_vocabulary_refit():
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    ensure_sample_data()
+    rec = HybridRecommender({})
+    rec.initialize()
+    rec.delete_books(["2", "3"])
+    rec.reweight()
+    content, live = rec.content_model, rec.catalog.alive
+    reference = TfidfVectorizer(vocabulary=content.vectorizer.vocabulary_, ngram_range=(1, 2))
+    expected = reference.fit_transform(content._build_corpus(rec.books[live]))
+    np.testing.assert_allclose(content.vectorizer.idf_, reference.idf_)
+    np.testing.assert_allclose(content.tfidf_matrix[live].toarray(), expected.toarray(), atol=1e-12)
+
+
+def test_quantized_matrix_matches_float_products():
+    from search.quantization import QuantizedMatrix, quantize_int8
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 32)).astype(np.float32)
+    codes, scale = quantize_int8(vectors)
+    matrix = QuantizedMatrix(codes, scale)
+    queries = rng.normal(size=(3, 32)).astype(np.float32)
+    np.testing.assert_allclose(matrix @ queries.T, matrix.dequantize() @ queries.T, rtol=1e-4, atol=1e-3)
+    np.testing.assert_allclose(matrix.dequantize(), vectors, atol=float(scale.max()))
+    assert codes.dtype == np.int8 and matrix.nbytes < vectors.nbytes / 3
+
+
+def test_dense_embeddings_path(tmp_path):
+    ensure_sample_data()
+    config = {"recommendation": {"enable_deep_embeddings": True}, "embeddings": {"dim": 4},
+              "paths": {"artifacts_dir": str(tmp_path)}}
+    rec = HybridRecommender({**config, "paths": {}})
+    rec.initialize()
+    content = rec.content_model
+    assert content.embeddings.codes.dtype == np.int8 and content.ann_index.items is content.embeddings
+    request = RecommendationRequest(genres=["Fantasy"], liked_books=["Akata Witch"], limit=3)
+    expected = [(b.book_id, round(b.score, 6)) for b in rec.recommend(request)]
+    assert expected and [(b.book_id, round(b.score, 6)) for b in rec.recommend_batch([request])[0]] == expected
+
+    report = content.dense_report(top_k=3)
+    assert 0.0 <= report["recall"] <= 1.0 and report["codes_bytes_per_book"] < report["tfidf_bytes_per_book"]
+
+    rec.save_artifacts(str(tmp_path))
+    loaded = HybridRecommender(config)
+    loaded.initialize()
+    assert isinstance(loaded.content_model.embeddings.codes, np.memmap)
+    assert [(b.book_id, round(b.score, 6)) for b in loaded.recommend(request)] == expected
+
+    delta = pd.DataFrame([{"book_id": "9001", "title": "Witch of Lagos", "author": "New Author", "country": "Nigeria",
+                           "language": "en", "genres": "Fantasy", "year": 2020, "avg_rating": 4.5, "rating_count": 100}])
+    loaded.upsert_books(delta)
+    assert loaded.content_model.embeddings.shape[0] == loaded.catalog.size
+    ids = {b.book_id for b in loaded.recommend(RecommendationRequest(genres=["Fantasy"], countries=["Nigeria"], limit=20))}
+    assert "9001" in ids
+    loaded.reweight()
+    assert loaded.content_model.ann_index.items is loaded.content_model.embeddings
+
+
+def test_mmr_reranker_spreads_authors_and_near_duplicates():
+    from recommender.reranking import make_reranker
+
+    # Six near-identical books by one author outrank four distinct ones
+    relevance = np.array([1.0, 0.99, 0.98, 0.97, 0.96, 0.95, 0.9, 0.85, 0.8, 0.75])
+    vectors = np.eye(10)
+    vectors[:6, 0] = 3.0  # cosine ~0.9 between the first six
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    authors = np.array(["a"] * 6 + ["b", "c", "d", "e"], dtype=object)
+    countries = np.array(["x"] * 6 + ["y", "z", "y", "z"], dtype=object)
+    plain = make_reranker({"recommendation": {"reranker": "none"}})
+    assert plain.rerank(relevance, None, [], authors, 5, 0.15).tolist() == [0, 1, 2, 3, 4]
+
+    mmr = make_reranker({})
+    order = mmr.rerank(relevance, vectors, [countries], authors, 5, 0.15)
+    assert order[0] == 0 and len(set(order.tolist())) == 5
+    assert (authors[order] == "a").sum() <= 2
+
+    # Without any diversity pressure MMR reduces to the relevance order
+    off = make_reranker({"recommendation": {"coverage_weight": 0, "author_penalty": 0}})
+    assert off.rerank(relevance, vectors, [countries], authors, 5, 0.0).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_recommend_reranks_the_blended_pool(recommender):
+    from recommender.reranking import ScoreReranker
+
+    request = RecommendationRequest(limit=10)
+    reranked = recommender.recommend(request)
+    original = recommender.reranker
+    try:
+        recommender.reranker = ScoreReranker({})
+        plain = recommender.recommend(request)
+    finally:
+        recommender.reranker = original
+    assert {b.book_id for b in reranked} == {b.book_id for b in plain}  # small pool: same books, new order
+    assert reranked[0].book_id == plain[0].book_id
+
+
+def test_implicit_als_recovers_user_clusters():
+    from scipy import sparse
+    from recommender.matrix_factorization import ImplicitALS
+
+    # Users 0-19 read books 0-9, users 20-39 books 10-19; each user skipped one book of their block
+    rows, cols = [], []
+    for user in range(40):
+        block = range(0, 10) if user < 20 else range(10, 20)
+        for book in block:
+            if book % 10 != user % 10:
+                rows.append(user)
+                cols.append(book)
+    user_item = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(40, 20))
+    als = ImplicitALS({"mf": {"factors": 4, "iterations": 8, "threads": 2}})
+    als.fit(user_item)
+    scores = als.scores(np.array([3, 25, -1]), np.array([3, 15, 99]))
+    assert scores[0, 0] > scores[0, 1] and scores[1, 1] > scores[1, 0]
+    assert np.isnan(scores[2]).all() and np.isnan(scores[:, 2]).all()
+
+    # Folding in a new user's events gives them a vector in the right block
+    grown = sparse.vstack([user_item, sparse.csr_matrix((np.ones(3), ([0, 0, 0], [11, 12, 13])), shape=(1, 20))]).tocsr()
+    als.fold_in(grown, np.array([40]))
+    new_user = als.scores(np.array([40]), np.arange(20))[0]
+    assert new_user[10:].mean() > new_user[:10].mean()
+
+
+def test_user_id_adds_mf_signal_and_skips_history(recommender):
+    collab = recommender.collab_model
+    assert collab.mf.user_factors.shape == (len(collab.user_ids), collab.mf.factors)
+    results = recommender.recommend(RecommendationRequest(user_id="u1", limit=5))
+    history = set(recommender.catalog.book_ids[p] for p in collab.history_positions("u1", recommender.catalog))
+    assert history == {"1", "2"}
+    assert results and not history & {b.book_id for b in results}
+    assert any("mf" in b.explanation for b in results)
+    unknown = recommender.recommend(RecommendationRequest(user_id="nobody", limit=5))
+    assert not any("mf" in b.explanation for b in unknown)
+
+
+def test_user_id_alone_reorders_the_popularity_prior(tmp_path):
+    # Equal readership, a and b half again as popular as c and d; the user's one read is c
+    pd.DataFrame([
+        {"book_id": b, "title": f"Book {b}", "author": f"Author {b}", "genres": "Fiction", "avg_rating": 4.0, "rating_count": n}
+        for b, n in [("a", 15000), ("b", 15000), ("c", 10000), ("d", 10000)]
+    ]).to_csv(tmp_path / "books.csv", index=False)
+    events = [(f"x{u}", b, 1.0) for u in range(10) for b in ("a", "b")]
+    events += [(f"y{u}", b, 1.0) for u in range(10) for b in ("c", "d")] + [("fan", "c", 1.0)]
+    pd.DataFrame(events, columns=["user_id", "book_id", "event_strength"]).to_csv(tmp_path / "events.csv", index=False)
+    paths = {"books_csv": str(tmp_path / "books.csv"), "books_parquet": None, "interactions_csv": str(tmp_path / "events.csv")}
+    rec = HybridRecommender({"paths": paths, "mf": {"factors": 2}})
+    rec.initialize()
+    anonymous = rec.recommend(RecommendationRequest(limit=3))
+    personal = rec.recommend(RecommendationRequest(user_id="fan", limit=3))
+    # Popularity priors are scaled like the other signals, so the user's factors can outweigh them
+    assert [b.book_id for b in anonymous] == ["a", "b", "c"] and anonymous[0].score < 1.0
+    assert [b.book_id for b in personal] == ["d", "a", "b"]
+
+
+def test_title_index_normalizes_and_matches_fuzzy_titles():
+    assert normalize_title("Cien Años de Soledad (Edición Especial)") == "cien anos de soledad"
+    assert normalize_title("The Fellowship of the Ring (The Lord of the Rings, #1)") == "the fellowship of the ring"
+    assert normalize_title("Dune, Book 1") == normalize_title("DUNE") == "dune"
+    assert normalize_title("(Untitled)") == "untitled"
+    index = TitleIndex(threshold=0.7)
+    index.build(["Kafka on the Shore", "Kafka On The Shore [Vintage]", "Dune", "Dune Messiah"])
+    alive = np.ones(4, dtype=bool)
+    assert index.resolve(["kafka on the shore!"], alive).tolist() == [0, 1]
+    assert index.resolve(["Kafka on teh Shore"], alive).tolist() == [0, 1]
+    assert index.resolve(["Dune"], alive).tolist() == [2]
+    assert not len(index.resolve(["Dune Chronicles"], alive))
+    alive[0] = False
+    assert index.resolve(["Kafka on teh Shore"], alive).tolist() == [1]
+    index.add(["Norwegian Wood"], 4)
+    assert not len(index.resolve(["Norwegian Wood"], alive))  # row 4 is not published yet
+    assert index.resolve(["norwegian wod"], np.ones(5, dtype=bool)).tolist() == [4]
+
+
+def test_liked_titles_resolve_outside_the_filtered_candidates(recommender):
+    # Akata Witch is Fantasy; its co-reader of Rosewater still counts under a Science Fiction filter
+    request = RecommendationRequest(genres=["Science Fiction"], liked_books=["akata witch (Akata, #1)"])
+    candidates = recommender._candidates(request)
+    assert [recommender.catalog.book_ids[p] for p in candidates] == ["3"]
+    with_liked = recommender.collab_model.score_candidates(request, candidates, recommender.catalog)
+    # Unscaled: without liked items the row is only the popularity prior, which `recommend` rescales
+    without = recommender.collab_model.score_candidates(
+        RecommendationRequest(genres=["Science Fiction"]), candidates, recommender.catalog, fallback=False
+    )
+    assert with_liked[0] > without[0] + 0.5
+    results = recommender.recommend(RecommendationRequest(liked_books=["AKATA WITCH"], limit=5))
+    assert "1" not in {b.book_id for b in results}
+
+
+def test_latency_budget_degrades_to_popular_candidates(recommender):
+    costs, min_pool = recommender.stage_costs, recommender.budget_min_pool
+    saved = costs.per_candidate, dict(costs.rates)
+    catalog = recommender.catalog
+    try:
+        # Nothing is affordable: popularity alone, liked books still excluded
+        costs.per_candidate, costs.rates = 1.0, {}
+        trace = Trace()
+        results = recommender.recommend(RecommendationRequest(liked_books=["Rosewater"], limit=5, budget_ms=1), trace)
+        assert trace.degraded[0] == "popularity_fallback"
+        positions = [catalog.positions[b.book_id] for b in results]
+        assert results and "3" not in {b.book_id for b in results}
+        assert positions == sorted(positions, key=lambda p: -catalog.popularity[p])
+        # A few candidates are affordable: scoring runs over the most popular ones only
+        recommender.budget_min_pool = 1
+        costs.per_candidate, costs.rates = 0.6 * 1.0 / 4, {}
+        trace = Trace()
+        results = recommender.recommend(RecommendationRequest(limit=3, budget_ms=1000), trace)
+        assert "candidates_shrunk" in trace.degraded
+        top = set(catalog.popularity_order()[:4].tolist())
+        assert {catalog.positions[b.book_id] for b in results} <= top
+        # No budget: nothing degrades
+        trace = Trace()
+        recommender.recommend(RecommendationRequest(limit=3, budget_ms=0), trace)
+        assert trace.degraded == []
+    finally:
+        (costs.per_candidate, costs.rates), recommender.budget_min_pool = saved, min_pool
+
+
+def test_filtered_traffic_does_not_price_unfiltered_requests_out(recommender):
+    costs, min_pool = recommender.stage_costs, recommender.budget_min_pool
+    saved = costs.per_candidate, dict(costs.rates)
+    try:
+        recommender.budget_min_pool = 1
+        costs.per_candidate, costs.rates = 1e-6, {}
+        for _ in range(20):
+            # A narrow author filter whose single candidate looks very expensive per candidate
+            trace = Trace()
+            recommender.recommend(RecommendationRequest(authors=["Nnedi Okorafor"], limit=5, budget_ms=1000), trace)
+            costs.observe_scoring(1, 0.5)
+            trace = Trace()
+            results = recommender.recommend(RecommendationRequest(limit=5, budget_ms=1000), trace)
+            assert len(results) == 5 and trace.degraded == []
+        # An unfiltered pool priced out by a stale estimate is scored again once the estimate decays
+        costs.rates[costs.bucket(len(recommender.catalog.live))] = 1.0
+        outcomes = []
+        for _ in range(30):
+            trace = Trace()
+            recommender.recommend(RecommendationRequest(limit=5, budget_ms=1000), trace)
+            outcomes.append(trace.degraded == [])
+        assert not outcomes[0] and outcomes[-1]
+    finally:
+        (costs.per_candidate, costs.rates), recommender.budget_min_pool = saved, min_pool
+
+
+def test_genre_filters_are_matched_literally():
+    books = pd.DataFrame({
+        "book_id": ["1", "2", "3"], "title": ["a", "b", "c"], "author": ["x", "y", "z"], "country": ["", "", ""],
+        "language": ["en", "en", "en"], "genres": ["C++|Programming", "Sci-Fi (Hard)", "C|Sci-Fi"], "year": [2000, 2001, 2002],
+    })
+    index = FilterIndex()
+    index.build(books)
+    assert index.match_genres(["c++"]).tolist() == [0]
+    assert index.match_genres(["Sci-Fi (Hard)"]).tolist() == [1]
+    assert index.match_genres(["sci-fi"]).tolist() == [1, 2]
+    assert index.match_genres(["("]).tolist() == []
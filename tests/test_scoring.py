@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import pytest
+
+from services.api.scoring import Overloaded, ScoringExecutor
+
+
+class SlowRecommender:
+    def __init__(self):
+        self.calls = 0
+
+    def recommend(self, request):
+        self.calls += 1
+        time.sleep(0.2)
+        return [request]
+
+
+@pytest.mark.asyncio
+async def test_identical_requests_are_coalesced():
+    executor = ScoringExecutor({"api": {"max_workers": 2, "max_queue": 0}})
+    recommender = SlowRecommender()
+    executor.start(recommender)
+    try:
+        results = await asyncio.gather(*[executor.submit("recommend", "q", key="k") for _ in range(3)])
+        assert results == [["q"]] * 3
+        assert recommender.calls == 1
+        assert executor.snapshot()["coalesced"] == 2
+    finally:
+        executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_excess_load_is_shed():
+    executor = ScoringExecutor({"api": {"max_workers": 1, "max_queue": 1, "retry_after_seconds": 2}})
+    executor.start(SlowRecommender())
+    try:
+        outcomes = await asyncio.gather(
+            *[executor.submit("recommend", i, key=str(i)) for i in range(3)], return_exceptions=True
+        )
+        rejected = [o for o in outcomes if isinstance(o, Overloaded)]
+        assert len(rejected) == 1 and rejected[0].retry_after == 2
+        assert executor.snapshot()["pending"] == 0
+    finally:
+        executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_process_workers_load_the_swapped_in_model(tmp_path):
+    from data_pipeline.schemas import RecommendationRequest
+    from recommender.hybrid import HybridRecommender
+    from scripts.ingest_sample import ensure_sample_data
+
+    ensure_sample_data()
+    built = HybridRecommender({})
+    built.initialize()
+    built.save_artifacts(str(tmp_path / "bundle"))
+    loaded = HybridRecommender({"paths": {"artifacts_dir": str(tmp_path / "bundle")}})
+    loaded.initialize()
+    # The executor's own config has no usable source: workers must follow the model's config
+    executor = ScoringExecutor({"api": {"executor": "process", "max_workers": 1}, "paths": {"books_csv": "missing.csv", "books_parquet": None}})
+    executor.start(built)
+    try:
+        executor.prepare(loaded)
+        prepared = executor._prepared[1]
+        assert executor.swap(loaded) is built and executor.pool is prepared
+        request = RecommendationRequest(genres=["Fantasy"], limit=3)
+        results = await executor.submit("recommend", request)
+        assert [b.book_id for b in results] == [b.book_id for b in loaded.recommend(request)]
+    finally:
+        executor.shutdown()
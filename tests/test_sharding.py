@@ -0,0 +1,98 @@
+import pandas as pd
+import pytest
+
+from data_pipeline.schemas import RecommendationRequest
+from recommender.hybrid import HybridRecommender
+from recommender.sharding import ShardedRecommender, ShardPlan
+from scripts.ingest_sample import ensure_sample_data
+
+
+@pytest.fixture(scope="module")
+def sharded(tmp_path_factory):
+    ensure_sample_data()
+    rec = ShardedRecommender({"sharding": {"shards": 2, "key": "language", "dir": str(tmp_path_factory.mktemp("shards"))}})
+    rec.initialize()
+    yield rec
+    rec.shutdown()
+
+
+@pytest.fixture(scope="module")
+def unsharded():
+    ensure_sample_data()
+    rec = HybridRecommender({})
+    rec.initialize()
+    return rec
+
+
+def test_shard_plan_keeps_values_together_and_routes_by_filter():
+    plan = ShardPlan(2, "language")
+    books = pd.DataFrame({"book_id": list("abcdef"), "language": ["en", "en", "en", "ja", "fr", "JA"]})
+    shards = plan.assign(books).tolist()
+    assert shards[:3] == [0, 0, 0] and shards[3] == shards[5] == 1 and shards[4] == 1
+    assert plan.route(RecommendationRequest(languages=["EN"])) == [0]
+    assert plan.route(RecommendationRequest(languages=["ja", "fr"])) == [1]
+    assert plan.route(RecommendationRequest(languages=["xx"])) == [0, 1]
+    assert plan.route(RecommendationRequest(countries=["Japan"])) == [0, 1]
+
+
+def test_sharded_recommend_merges_shard_top_lists(sharded):
+    assert sharded.books_per_shard == [3, 2]
+    results, trace = sharded.recommend_traced(RecommendationRequest(limit=4, liked_books=["Akata Witch"]))
+    assert trace.counts["shards"] == 2
+    assert len(results) == 4 and "1" not in {b.book_id for b in results}
+    assert {b.language for b in results} == {"en", "ja"}
+    pinned, trace = sharded.recommend_traced(RecommendationRequest(limit=5, languages=["ja"]))
+    assert trace.counts["shards"] == 1 and {b.language for b in pinned} == {"ja"}
+    # A filter only one shard matches is not padded with the other shard's popularity fallback
+    scifi = sharded.recommend(RecommendationRequest(limit=5, genres=["Science Fiction"]))
+    assert [b.book_id for b in scifi] == ["3"]
+    # Nothing matches anywhere: popularity over every shard, as one recommender would answer
+    assert len(sharded.recommend(RecommendationRequest(limit=5, languages=["xx"]))) == 5
+    batch = sharded.recommend_batch([RecommendationRequest(limit=5, genres=["Science Fiction"]), RecommendationRequest(limit=5, languages=["xx"])])
+    assert [b.book_id for b in batch[0]] == ["3"] and len(batch[1]) == 5
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"limit": 5},
+        {"limit": 3, "genres": ["Fantasy"]},
+        {"limit": 4, "themes": ["Coming-of-age"], "countries": ["Nigeria", "Japan"]},
+        {"limit": 5, "genres": ["Literary", "Science Fiction"], "explain": False},
+        {"limit": 2, "authors": ["Haruki Murakami"], "min_year": 1990},
+        # Liked titles on one shard reach the other's books through the graph
+        {"limit": 4, "liked_books": ["Akata Witch"]},
+        {"limit": 4, "liked_books": ["Kafka on the Shore"]},
+        {"limit": 3, "liked_books": ["Rosewater", "1Q84"]},
+        {"limit": 3, "liked_books": ["kafka on teh shore"], "languages": ["en"]},
+    ],
+)
+def test_sharded_top_k_matches_one_recommender(sharded, unsharded, payload):
+    request = RecommendationRequest(**payload)
+    expected = unsharded.recommend(request)
+    got = sharded.recommend(request)
+    assert [(b.book_id, round(b.score, 6), b.explanation) for b in got] == [
+        (b.book_id, round(b.score, 6), b.explanation) for b in expected
+    ]
+    assert [b.book_id for b in sharded.recommend_batch([request])[0]] == [b.book_id for b in expected]
+
+
+def test_sharded_catalog_updates_follow_the_plan(sharded):
+    moved = {"book_id": "5", "title": "Norwegian Wood", "author": "Haruki Murakami", "country": "Japan", "language": "en",
+             "genres": "Literary", "themes": "", "year": 1987, "avg_rating": 4.0, "rating_count": 100, "description": ""}
+    assert sharded.upsert_books(pd.DataFrame([moved])) == {"added": 0, "updated": 1}
+    assert sharded.books_per_shard == [4, 1]
+    assert "5" in {b.book_id for b in sharded.recommend(RecommendationRequest(limit=5, languages=["en"]))}
+    assert sharded.delete_books(["5", "missing"]) == 1
+    assert sharded.live_count() == 4
+
+
+def test_liked_titles_resolve_across_shards(sharded):
+    # An exact title on one shard wins over a fuzzy match on another, as in one catalog
+    near = {"book_id": "9002", "title": "Akata Witches", "author": "Someone Else", "country": "Japan", "language": "ja",
+            "genres": "Fantasy", "themes": "", "year": 2020, "avg_rating": 4.0, "rating_count": 100, "description": ""}
+    sharded.upsert_books(pd.DataFrame([near]))
+    results = sharded.recommend(RecommendationRequest(limit=10, liked_books=["Akata Witch"]))
+    assert "9002" in {b.book_id for b in results} and "1" not in {b.book_id for b in results}
+    results = sharded.recommend(RecommendationRequest(limit=10, liked_books=["Akata Witchez"]))
+    assert "9002" not in {b.book_id for b in results}
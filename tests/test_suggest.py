@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from recommender.hybrid import HybridRecommender
+from recommender.suggest import PrefixIndex
+from scripts.ingest_sample import ensure_sample_data
+
+
+def suffixes(text):
+    words = text.split(" ")
+    return [" ".join(words[i:]) for i in range(1, len(words)) if len(words[i]) > 1]
+
+
+def test_prefix_index_top_lists_match_a_full_scan():
+    rng = np.random.default_rng(0)
+    words = ["".join(rng.choice(list("abcde"), size=rng.integers(2, 6))) for _ in range(50)]
+    texts = [" ".join(rng.choice(words, size=rng.integers(1, 4))) for _ in range(3000)]
+    popularity = rng.random(len(texts))
+    index = PrefixIndex(key_bytes=6, scan_limit=32, top_n=10)
+    index.build(texts, 0, popularity)
+    assert index.top  # wide prefixes answer from precomputed lists
+    for prefix in ["a", "ab", "b c", "cde", "eeee", "abcd ab"]:
+        entities, _ = index.candidates(prefix.encode()[:6])
+        if len(prefix) > 6:
+            entities = np.array([e for e in entities.tolist() if " " + prefix in " " + texts[e]], dtype=np.int64)
+        got = PrefixIndex.best(entities, popularity, 5)
+        # The whole text or any later word of two or more letters starts with the prefix
+        expected = [
+            i for i, t in enumerate(texts)
+            if t.startswith(prefix) or any(w.startswith(prefix) for w in suffixes(t))
+        ]
+        expected = sorted(expected, key=lambda i: -popularity[i])[:5]
+        assert got.tolist() == expected, prefix
+
+
+def test_suggestions_follow_catalog_updates():
+    ensure_sample_data()
+    rec = HybridRecommender({})
+    rec.initialize()
+    index = rec.suggest_index
+    assert [s["book_id"] for s in index.suggest("AKATA", ["title"])["title"]] == ["1"]
+    assert [s["value"] for s in index.suggest("witch", ["title"])["title"]] == ["Akata Witch"]
+    murakami = index.suggest("murak", ["author"])["author"]
+    assert murakami[0]["value"] == "Haruki Murakami" and murakami[0]["books"] == 2
+    assert index.suggest("coming-of", ["theme"])["theme"][0]["value"] == "Coming-of-age"
+
+    rec.upsert_books(pd.DataFrame([
+        {"book_id": "9001", "title": "Witch of Lagos", "author": "Ada Obi", "genres": "Fantasy|Solarpunk",
+         "avg_rating": 4.5, "rating_count": 1000000},
+    ]))
+    witches = index.suggest("wit", ["title"])["title"]
+    assert [s["book_id"] for s in witches] == ["9001", "1"]
+    assert index.suggest("solar", ["genre"])["genre"][0]["value"] == "Solarpunk"
+    assert index.suggest("ada", ["author"])["author"][0]["books"] == 1
+
+    rec.delete_books(["9001"])
+    assert [s["book_id"] for s in index.suggest("wit", ["title"])["title"]] == ["1"]
+    assert index.suggest("ada o", ["author"])["author"] == []
+
+
+def test_long_queries_scan_past_a_precomputed_top_list():
+    ensure_sample_data()
+    rec = HybridRecommender({"suggest": {"key_bytes": 16, "scan_limit": 4, "max_limit": 1}})
+    rec.initialize()
+    endings = ["goblet", "stone", "prince", "order", "hallows", "chamber", "prisoner", "zebra"]
+    rec.upsert_books(pd.DataFrame([
+        {"book_id": f"hp{i}", "title": f"Harry Potter and the {word}", "author": "J. K. Rowling",
+         "avg_rating": 4.0, "rating_count": 1000 * (len(endings) - i)}
+        for i, word in enumerate(endings)
+    ]))
+    found = rec.suggest_index.suggest("harry potter and the zebra", ["title"])["title"]
+    assert [s["book_id"] for s in found] == ["hp7"]